@@ -0,0 +1,212 @@
+"""
+Admission control: per-route-class concurrency limits and load shedding.
+
+Without it a traffic spike queues inside the server until clients time out,
+and the queued work, audit writes included, still runs for nobody. Each
+request is put in a route class (auth, read, write, bulk) from its method
+and path, and each class admits at most `limit` requests at a time per
+worker. Extra requests wait in a bounded FIFO queue. They are shed with
+503 and Retry-After, before any handler runs, when:
+
+- the queue is full,
+- the oldest waiter has already waited longer than ADMISSION_TARGET_DELAY_MS
+  (queueing delay past the target means the class is not keeping up, so
+  new arrivals are turned away early, CoDel style), or
+- a waiter reaches ADMISSION_QUEUE_TIMEOUT_MS without being admitted.
+
+The limit adapts to observed latency (AIMD). The limiter tracks the class's
+no-load latency (a minimum that drifts slowly upwards). While the smoothed
+latency stays under ADMISSION_LATENCY_TOLERANCE times that baseline, a
+saturated class grows its limit by about one per round trip, up to the
+configured ceiling. Above it, the limit is cut by a tenth at most once per
+round trip, down to 1.
+
+Health checks, metrics, the JWKS and token refresh are never queued or shed,
+so a degraded service still reports itself healthy and keeps its sessions.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from config import (
+    ADMISSION_ENABLED, ADMISSION_AUTH_CONCURRENCY, ADMISSION_READ_CONCURRENCY, ADMISSION_WRITE_CONCURRENCY,
+    ADMISSION_BULK_CONCURRENCY, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT_MS, ADMISSION_TARGET_DELAY_MS,
+    ADMISSION_LATENCY_TOLERANCE
+)
+from metrics import ADMISSION_LIMIT, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT, ADMISSION_REJECTIONS
+
+# Never queued or shed
+PRIORITY_ROUTES = {
+    ("GET", "/health"), ("HEAD", "/health"), ("GET", "/metrics"), ("GET", "/.well-known/jwks.json"),
+    ("POST", "/auth/refresh"),
+}
+# Password hashing and TOTP checks: CPU-bound
+AUTH_ROUTES = {
+    ("POST", "/auth/login"), ("POST", "/auth/register"), ("POST", "/auth/change-password"),
+    ("POST", "/auth/mfa/setup"), ("POST", "/auth/mfa/verify"), ("POST", "/auth/mfa/disable"),
+}
+# Long-running reads and writes
+BULK_ROUTES = {
+    ("POST", "/attendees/bulk"), ("GET", "/attendees/export"), ("GET", "/attendees/stats"),
+    ("GET", "/attendees/duplicates"), ("GET", "/replication/snapshot"),
+}
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+BACKOFF_RATIO = 0.9
+# Share of the gap the no-load latency moves towards each slower sample
+BASELINE_DRIFT = 0.001
+LATENCY_SMOOTHING = 0.1
+# Latency below this is never taken as congestion (timer noise on fast routes)
+MIN_CONGESTED_LATENCY_SECONDS = 0.01
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """auth, read, write or bulk; None for priority routes"""
+    route = (method, path.rstrip("/") or "/")
+    if route in PRIORITY_ROUTES:
+        return None
+    if route in AUTH_ROUTES:
+        return "auth"
+    if route in BULK_ROUTES:
+        return "bulk"
+    return "read" if method in READ_METHODS else "write"
+
+
+class Overloaded(Exception):
+    """The request was shed; retry_after is in whole seconds"""
+
+    def __init__(self, route_class: str, reason: str, retry_after: int):
+        super().__init__(f"{route_class} requests overloaded ({reason})")
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """Concurrency limit with a bounded, deadline-bound queue for one route class"""
+
+    def __init__(self, name: str, max_limit: int, max_queue: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_MS / 1000,
+                 target_delay: float = ADMISSION_TARGET_DELAY_MS / 1000,
+                 tolerance: float = ADMISSION_LATENCY_TOLERANCE):
+        self.name = name
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_delay = target_delay
+        self.tolerance = tolerance
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.waiters = deque()  # (enqueued at, future)
+        self.baseline: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.last_decrease = 0.0
+        ADMISSION_LIMIT.labels(name).set(self.limit)
+
+    async def acquire(self):
+        """Wait for a slot; raises Overloaded instead of queueing past the limits"""
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return
+        now = time.monotonic()
+        if len(self.waiters) >= self.max_queue:
+            raise self._shed("queue_full")
+        if self.waiters and now - self.waiters[0][0] > self.target_delay:
+            raise self._shed("queue_delay")
+        future = asyncio.get_running_loop().create_future()
+        entry = (now, future)
+        self.waiters.append(entry)
+        ADMISSION_QUEUE_DEPTH.labels(self.name).inc()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # A slot granted just as the deadline fired is kept
+            if not future.done() or future.cancelled():
+                self._forget(entry)
+                raise self._shed("queue_timeout")
+        except asyncio.CancelledError:
+            # The client went away; give back a slot granted in the meantime
+            if future.done() and not future.cancelled():
+                self.release(None)
+            else:
+                self._forget(entry)
+            raise
+        ADMISSION_QUEUE_WAIT.labels(self.name).observe(time.monotonic() - now)
+
+    def release(self, latency: Optional[float]):
+        """Free a slot, adapt the limit to the request's latency and admit the next waiter"""
+        if latency is not None:
+            self._adapt(latency, saturated=self.in_flight >= self.limit)
+        self.in_flight -= 1
+        while self.waiters and self.in_flight < self.limit:
+            _, future = self.waiters.popleft()
+            ADMISSION_QUEUE_DEPTH.labels(self.name).dec()
+            if not future.done():
+                future.set_result(None)
+                self.in_flight += 1
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained"""
+        latency = self.latency or self.target_delay
+        return max(1, math.ceil((len(self.waiters) + 1) * latency / self.limit))
+
+    def _adapt(self, latency: float, saturated: bool):
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) * BASELINE_DRIFT
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += (latency - self.latency) * LATENCY_SMOOTHING
+        now = time.monotonic()
+        congested = self.latency > max(self.baseline * self.tolerance, MIN_CONGESTED_LATENCY_SECONDS)
+        if congested and now - self.last_decrease > self.latency:
+            self.limit = max(1.0, self.limit * BACKOFF_RATIO)
+            self.last_decrease = now
+        elif not congested and saturated:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        else:
+            return
+        ADMISSION_LIMIT.labels(self.name).set(self.limit)
+
+    def _forget(self, entry):
+        try:
+            self.waiters.remove(entry)
+        except ValueError:
+            return
+        ADMISSION_QUEUE_DEPTH.labels(self.name).dec()
+
+    def _shed(self, reason: str) -> Overloaded:
+        ADMISSION_REJECTIONS.labels(self.name, reason).inc()
+        return Overloaded(self.name, reason, self.retry_after())
+
+
+class AdmissionController:
+    """One limiter per route class"""
+
+    def __init__(self, enabled: bool = ADMISSION_ENABLED, limits: Optional[Dict[str, int]] = None):
+        self.enabled = enabled
+        self.limits = limits or {
+            "auth": ADMISSION_AUTH_CONCURRENCY,
+            "read": ADMISSION_READ_CONCURRENCY,
+            "write": ADMISSION_WRITE_CONCURRENCY,
+            "bulk": ADMISSION_BULK_CONCURRENCY,
+        }
+        self.reset()
+
+    def reset(self):
+        """Fresh limiters, e.g. for a new event loop"""
+        self.limiters = {name: AdaptiveLimiter(name, limit) for name, limit in self.limits.items()}
+
+    def limiter_for(self, method: str, path: str) -> Optional[AdaptiveLimiter]:
+        """The limiter a request must pass, or None if it goes straight through"""
+        if not self.enabled:
+            return None
+        name = route_class(method, path)
+        return self.limiters[name] if name is not None else None
+
+
+admission_controller = AdmissionController()
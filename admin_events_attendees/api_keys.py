@@ -0,0 +1,92 @@
+"""
+API keys for service-to-service callers.
+
+Integrations such as the Django monolith send `Authorization: Bearer ak_...`
+instead of logging in. The dependencies that read JWTs (get_current_user,
+require_scope) recognise the prefix and accept the key with its own
+scopes, acting as the user that owns it. There is no bcrypt, no token
+refresh and, once cached, no query.
+
+Keys are 256-bit random strings, so a keyed digest (HMAC-SHA256 under
+API_KEY_SECRET) is as strong as a slow hash and costs microseconds. Only
+the digest is stored, under a unique index. Each worker caches lookups,
+including misses and the owner's row, for API_KEY_CACHE_SECONDS. A
+revoked key is dropped at once by the worker that revoked it, and by the
+others within that time.
+"""
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import API_KEY_CACHE_SECONDS, API_KEY_CACHE_SIZE, API_KEY_SECRET
+from database import ApiKey, User
+
+API_KEY_PREFIX = "ak_"
+
+
+def is_api_key(credential: str) -> bool:
+    return credential.startswith(API_KEY_PREFIX)
+
+
+def generate_api_key() -> str:
+    return API_KEY_PREFIX + secrets.token_urlsafe(32)
+
+
+def api_key_digest(key: str) -> str:
+    """Hex HMAC-SHA256 of a key, the value stored in api_keys.key_digest"""
+    return hmac.new(API_KEY_SECRET.encode(), key.encode(), hashlib.sha256).hexdigest()
+
+
+class ApiKeyIdentity:
+    """A valid key: its scopes and the (detached) user it acts as"""
+
+    def __init__(self, key_id: int, name: str, scopes: List[str], user: User):
+        self.key_id = key_id
+        self.name = name
+        self.scopes = scopes
+        self.user = user
+
+
+class ApiKeyCache:
+    """LRU of digest -> identity (or None for unknown keys) with a TTL"""
+
+    def __init__(self, ttl: float = API_KEY_CACHE_SECONDS, max_entries: int = API_KEY_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def lookup(self, key: str, db: AsyncSession) -> Optional[ApiKeyIdentity]:
+        """Identity of an active key whose owner is active, or None"""
+        digest = api_key_digest(key)
+        cached = self._entries.get(digest)
+        if cached is not None and cached[1] > time.monotonic():
+            self._entries.move_to_end(digest)
+            return cached[0]
+        row = (await db.execute(
+            select(ApiKey.id, ApiKey.name, ApiKey.scopes, User)
+            .join(User, User.id == ApiKey.user_id)
+            .where(ApiKey.key_digest == digest, ApiKey.revoked_at.is_(None))
+        )).first()
+        identity = None
+        if row is not None and row.User.is_active:
+            identity = ApiKeyIdentity(row.id, row.name, row.scopes.split(), row.User)
+        self._entries[digest] = (identity, time.monotonic() + self.ttl)
+        self._entries.move_to_end(digest)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return identity
+
+    def invalidate(self, digest: str):
+        self._entries.pop(digest, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+api_key_cache = ApiKeyCache()
@@ -1,13 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import select, delete, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime, timezone
+from collections import Counter
+from enum import Enum
+from itertools import groupby, islice
+from operator import attrgetter
+import asyncio
+import csv
+import heapq
+import io
 
-from database import get_db, Attendee
-from schemas import AttendeeCreate, AttendeeUpdate, AttendeeResponse
+from config import BULK_LOAD_MAX_ROWS, EXPORT_BATCH_SIZE
+from database import Attendee, bulk_insert, stream_scalars
+from outbox import attendee_payload
+from schemas import (
+    AttendeeCreate, AttendeeUpdate, AttendeeResponse, BulkLoadResult, AttendeeStats, DuplicateDocument
+)
+from sharding import ShardSessions, get_read_shards, get_write_shards, get_snapshot_shards, merge_sorted
+from timing import TimedRoute
 from auth import get_current_user, require_scope, audit_service
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+EXPORT_COLUMNS = [
+    "attendee_id", "name", "email", "document_type", "document_number",
+    "phone_number", "address", "date_of_birth", "gender", "created_at", "updated_at"
+]
+
+by_id = attrgetter("attendee_id")
 
 @router.post("/", response_model=AttendeeResponse, status_code=status.HTTP_201_CREATED)
 async def create_attendee(
@@ -15,19 +38,20 @@ async def create_attendee(
     request: Request,
     current_user = Depends(get_current_user),
     _: str = Depends(require_scope("write:attendees")),
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_write_shards)
 ):
     """Create a new attendee (requires authentication and write:attendees scope)"""
+    shard = shards.shards.for_document(attendee.document_type, attendee.document_number)
     try:
-        # Check if attendee with same document already exists
-        existing_attendee = db.query(Attendee).filter(
+        # Check if attendee with same document already exists (always on its own shard)
+        db = await shards.session(shard)
+        existing_attendee = await db.scalar(select(Attendee).where(
             Attendee.document_type == attendee.document_type,
             Attendee.document_number == attendee.document_number
-        ).first()
+        ).limit(1))
         
         if existing_attendee:
-            audit_service.log_action(
-                db=db,
+            await audit_service.log_action(
                 action="CREATE_ATTENDEE_FAILED",
                 user_id=current_user.id,
                 resource="attendees",
@@ -42,14 +66,21 @@ async def create_attendee(
         
         # Create new attendee
         attendee_data = attendee.model_dump() if hasattr(attendee, 'model_dump') else attendee.dict()
-        db_attendee = Attendee(**attendee_data)
-        db.add(db_attendee)
-        db.commit()
-        db.refresh(db_attendee)
+        
+        async def insert_attendee(session: AsyncSession) -> Attendee:
+            row = dict(attendee_data)
+            await shard.assign_ids(session, [row])
+            db_attendee = Attendee(**row)
+            session.add(db_attendee)
+            await session.flush()
+            await session.refresh(db_attendee)
+            await shard.outbox.record(session, "attendee.created", [attendee_payload(db_attendee)])
+            return db_attendee
+        
+        db_attendee = await shard.lane.submit(insert_attendee)
         
         # Log successful creation
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="CREATE_ATTENDEE",
             user_id=current_user.id,
             resource="attendees",
@@ -64,12 +95,12 @@ async def create_attendee(
         # Re-raise HTTPExceptions (like duplicate document)
         raise
     except Exception as e:
-        db.rollback()
+        user_id = current_user.id  # read before rollback expires it
+        await shards.rollback()
         error_message = str(e) if str(e) else "Unknown database error occurred"
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="CREATE_ATTENDEE_ERROR",
-            user_id=current_user.id,
+            user_id=user_id,
             resource="attendees",
             ip_address=request.client.host,
             user_agent=request.headers.get("user-agent"),
@@ -80,6 +111,133 @@ async def create_attendee(
             detail=f"Error creating attendee: {error_message}"
         )
 
+@router.post(
+    "/bulk", response_model=BulkLoadResult, response_model_exclude_none=True, status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_207_MULTI_STATUS: {"model": BulkLoadResult, "description": "Some shards failed"}}
+)
+async def bulk_create_attendees(
+    attendees: List[AttendeeCreate],
+    request: Request,
+    current_user = Depends(get_current_user),
+    _: str = Depends(require_scope("write:attendees")),
+    shards: ShardSessions = Depends(get_write_shards)
+):
+    """Create many attendees in one transaction per shard (COPY on PostgreSQL)
+    
+    Shards commit independently: if only some fail, the others' rows stay
+    and the response is 207 with the documents that were not stored.
+    """
+    if len(attendees) > BULK_LOAD_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {BULK_LOAD_MAX_ROWS} attendees per request"
+        )
+    
+    # COPY takes plain values, not enum members
+    rows = [
+        {key: value.value if isinstance(value, Enum) else value for key, value in attendee.dict().items()}
+        for attendee in attendees
+    ]
+    rows_by_shard = {}
+    for row in rows:
+        shard = shards.shards.for_document(row["document_type"], row["document_number"])
+        rows_by_shard.setdefault(shard, []).append(row)
+    
+    async def existing_documents(shard, db: AsyncSession):
+        if shard not in rows_by_shard:
+            return []
+        return (await db.execute(
+            select(Attendee.document_type, Attendee.document_number)
+            .where(Attendee.document_number.in_({row["document_number"] for row in rows_by_shard[shard]}))
+        )).all()
+    
+    existing = [document for found in await shards.gather(existing_documents) for document in found]
+    
+    # Reject documents that already exist or repeat within the request
+    seen = {tuple(document) for document in existing}
+    duplicates = set()
+    for row in rows:
+        document = (row["document_type"], row["document_number"])
+        if document in seen:
+            duplicates.add(document)
+        seen.add(document)
+    
+    if duplicates:
+        await audit_service.log_action(
+            action="BULK_CREATE_ATTENDEES_FAILED",
+            user_id=current_user.id,
+            resource="attendees",
+            ip_address=request.client.host,
+            user_agent=request.headers.get("user-agent"),
+            details=f"Duplicate documents: {len(duplicates)}"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "message": "Attendees with these documents already exist",
+                "documents": [f"{doc_type} - {number}" for doc_type, number in sorted(duplicates)[:50]]
+            }
+        )
+    
+    def insert_rows(shard, shard_rows):
+        async def unit(session: AsyncSession) -> int:
+            await shard.assign_ids(session, shard_rows)
+            inserted = await bulk_insert(session, Attendee, shard_rows)
+            # Read the rows back for their ids and server defaults (documents are unique here)
+            documents = {(row["document_type"], row["document_number"]) for row in shard_rows}
+            created = (await session.execute(
+                select(Attendee).where(Attendee.document_number.in_({number for _, number in documents}))
+            )).scalars().all()
+            await shard.outbox.record(session, "attendee.created", [
+                attendee_payload(row) for row in created if (row.document_type, row.document_number) in documents
+            ])
+            return inserted
+        return unit
+    
+    # Shards commit independently and in parallel
+    results = await asyncio.gather(*(
+        shard.lane.submit(insert_rows(shard, shard_rows)) for shard, shard_rows in rows_by_shard.items()
+    ), return_exceptions=True)
+    inserted = sum(result for result in results if not isinstance(result, BaseException))
+    failed = [
+        {
+            "documents": [f"{row['document_type']} - {row['document_number']}" for row in shard_rows],
+            "error": str(result) or type(result).__name__,
+        }
+        for shard_rows, result in zip(rows_by_shard.values(), results) if isinstance(result, BaseException)
+    ]
+    
+    if failed:
+        await audit_service.log_action(
+            action="BULK_CREATE_ATTENDEES_ERROR",
+            user_id=current_user.id,
+            resource="attendees",
+            ip_address=request.client.host,
+            user_agent=request.headers.get("user-agent"),
+            details=f"Error in bulk load: created {inserted}, failed {sum(len(f['documents']) for f in failed)}: "
+                    f"{failed[0]['error']}"
+        )
+        if not inserted:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Error creating attendees: {failed[0]['error']}"
+            )
+        # Retrying only the failed documents is safe; resending all would hit the stored ones
+        return JSONResponse(
+            status_code=status.HTTP_207_MULTI_STATUS,
+            content={"inserted": inserted, "failed": failed}
+        )
+    
+    await audit_service.log_action(
+        action="BULK_CREATE_ATTENDEES",
+        user_id=current_user.id,
+        resource="attendees",
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent"),
+        details=f"Created {inserted} attendees"
+    )
+    return {"inserted": inserted}
+
 @router.get("/", response_model=List[AttendeeResponse])
 async def get_all_attendees(
     request: Request,
@@ -87,15 +245,22 @@ async def get_all_attendees(
     limit: int = 100,
     current_user = Depends(get_current_user),
     _: str = Depends(require_scope("read:attendees")),
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_read_shards)
 ):
     """Get all attendees with pagination (requires authentication and read:attendees scope)"""
     try:
-        attendees = db.query(Attendee).offset(skip).limit(limit).all()
+        # Sharded: every shard returns its first skip+limit rows by id and the merge cuts the page
+        offset = 0 if shards.shards.sharded else skip
+        
+        async def first_rows(shard, db: AsyncSession):
+            statement = select(Attendee).order_by(Attendee.attendee_id).offset(offset).limit(skip - offset + limit)
+            return (await db.scalars(statement)).all()
+        
+        pages = await shards.gather(first_rows)
+        attendees = list(islice(heapq.merge(*pages, key=by_id), skip - offset, skip - offset + limit))
         
         # Log access
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="READ_ATTENDEES",
             user_id=current_user.id,
             resource="attendees",
@@ -107,8 +272,7 @@ async def get_all_attendees(
         return attendees
         
     except Exception as e:
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="READ_ATTENDEES_ERROR",
             user_id=current_user.id,
             resource="attendees",
@@ -121,20 +285,147 @@ async def get_all_attendees(
             detail="Error retrieving attendees"
         )
 
+@router.get("/export")
+async def export_attendees(
+    request: Request,
+    current_user = Depends(get_current_user),
+    _: str = Depends(require_scope("admin")),
+    shards: ShardSessions = Depends(get_snapshot_shards)
+):
+    """Stream all attendees as CSV from a recent snapshot (admin only)"""
+    await audit_service.log_action(
+        action="EXPORT_ATTENDEES",
+        user_id=current_user.id,
+        resource="attendees",
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent"),
+        details="Exported attendees as CSV"
+    )
+    
+    async def csv_chunks():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        statement = select(Attendee).order_by(Attendee.attendee_id)
+        streams = [
+            stream_scalars(await shards.session(shard), statement, EXPORT_BATCH_SIZE)
+            for shard in shards.shards.shards
+        ]
+        async for attendee in merge_sorted(streams, key=by_id):
+            writer.writerow([getattr(attendee, column) for column in EXPORT_COLUMNS])
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    return StreamingResponse(
+        csv_chunks(),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="attendees.csv"'}
+    )
+
+@router.get("/stats", response_model=AttendeeStats)
+async def get_attendee_stats(
+    request: Request,
+    current_user = Depends(get_current_user),
+    _: str = Depends(require_scope("admin")),
+    shards: ShardSessions = Depends(get_snapshot_shards)
+):
+    """Attendee counts by document type and gender, computed on a recent snapshot (admin only)"""
+    async def counts(shard, db: AsyncSession):
+        by_document_type = (await db.execute(
+            select(func.coalesce(Attendee.document_type, "unknown"), func.count()).group_by(Attendee.document_type)
+        )).all()
+        by_gender = (await db.execute(
+            select(func.coalesce(Attendee.gender, "unknown"), func.count()).group_by(Attendee.gender)
+        )).all()
+        return Counter(dict(by_document_type)), Counter(dict(by_gender))
+    
+    by_document_type, by_gender = Counter(), Counter()
+    for shard_by_document_type, shard_by_gender in await shards.gather(counts):
+        by_document_type.update(shard_by_document_type)
+        by_gender.update(shard_by_gender)
+    
+    await audit_service.log_action(
+        action="READ_ATTENDEE_STATS",
+        user_id=current_user.id,
+        resource="attendees",
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent"),
+        details="Computed attendee statistics"
+    )
+    return {
+        "total": sum(by_document_type.values()),
+        "by_document_type": dict(by_document_type),
+        "by_gender": dict(by_gender),
+        "as_of": datetime.fromtimestamp(request.state.snapshot_taken_at, timezone.utc),
+    }
+
+@router.get("/duplicates", response_model=List[DuplicateDocument])
+async def find_duplicate_attendees(
+    request: Request,
+    limit: int = 100,
+    current_user = Depends(get_current_user),
+    _: str = Depends(require_scope("admin")),
+    shards: ShardSessions = Depends(get_snapshot_shards)
+):
+    """Documents registered for more than one attendee, scanned on a recent snapshot (admin only)"""
+    # A document always hashes to the same shard, so each shard is scanned on its own
+    async def scan(shard, db: AsyncSession):
+        return await find_repeated_documents(db, limit)
+    
+    def document_order(duplicate):
+        return duplicate["document_type"] or "", duplicate["document_number"]
+    
+    duplicates = list(islice(heapq.merge(*await shards.gather(scan), key=document_order), limit))
+    
+    await audit_service.log_action(
+        action="SCAN_DUPLICATE_ATTENDEES",
+        user_id=current_user.id,
+        resource="attendees",
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent"),
+        details=f"Found {len(duplicates)} duplicated documents"
+    )
+    return duplicates
+
+async def find_repeated_documents(db: AsyncSession, limit: int) -> List[dict]:
+    """Up to `limit` documents that appear more than once, with their attendee ids"""
+    repeated = (
+        select(Attendee.document_type, Attendee.document_number)
+        .group_by(Attendee.document_type, Attendee.document_number)
+        .having(func.count() > 1)
+        .order_by(Attendee.document_type, Attendee.document_number)
+        .limit(limit)
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(Attendee.document_type, Attendee.document_number, Attendee.attendee_id)
+        .join(repeated, and_(
+            Attendee.document_type == repeated.c.document_type,
+            Attendee.document_number == repeated.c.document_number
+        ))
+        .order_by(Attendee.document_type, Attendee.document_number, Attendee.attendee_id)
+    )).all()
+    return [
+        {"document_type": doc_type, "document_number": number, "attendee_ids": [row.attendee_id for row in group]}
+        for (doc_type, number), group in groupby(rows, key=lambda row: (row.document_type, row.document_number))
+    ]
+
 @router.get("/{attendee_id}", response_model=AttendeeResponse)
 async def get_attendee(
     attendee_id: int,
     request: Request,
     current_user = Depends(get_current_user),
     _: str = Depends(require_scope("read:attendees")),
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_read_shards)
 ):
     """Get a specific attendee by ID (requires authentication and read:attendees scope)"""
-    attendee = db.query(Attendee).filter(Attendee.attendee_id == attendee_id).first()
+    _shard, attendee = await shards.locate(attendee_id)
     
     if attendee is None:
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="READ_ATTENDEE_NOT_FOUND",
             user_id=current_user.id,
             resource="attendees",
@@ -148,8 +439,7 @@ async def get_attendee(
         )
     
     # Log access
-    audit_service.log_action(
-        db=db,
+    await audit_service.log_action(
         action="READ_ATTENDEE",
         user_id=current_user.id,
         resource="attendees",
@@ -167,14 +457,13 @@ async def update_attendee(
     request: Request,
     current_user = Depends(get_current_user),
     _: str = Depends(require_scope("write:attendees")),
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_write_shards)
 ):
     """Update an attendee (requires authentication and write:attendees scope)"""
-    db_attendee = db.query(Attendee).filter(Attendee.attendee_id == attendee_id).first()
+    shard, db_attendee = await shards.locate(attendee_id)
     
     if db_attendee is None:
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="UPDATE_ATTENDEE_NOT_FOUND",
             user_id=current_user.id,
             resource="attendees",
@@ -188,6 +477,7 @@ async def update_attendee(
         )
     
     try:
+        target_shard = shard
         # Check for duplicate document if document info is being updated
         if attendee_update.document_type or attendee_update.document_number:
             new_doc_type = attendee_update.document_type or db_attendee.document_type
@@ -197,15 +487,17 @@ async def update_attendee(
             if (new_doc_type != db_attendee.document_type or 
                 new_doc_number != db_attendee.document_number):
                 
-                existing_attendee = db.query(Attendee).filter(
+                # The new document may hash to another shard; duplicates would live there
+                target_shard = shards.shards.for_document(new_doc_type, new_doc_number)
+                db = await shards.session(target_shard)
+                existing_attendee = await db.scalar(select(Attendee).where(
                     Attendee.document_type == new_doc_type,
                     Attendee.document_number == new_doc_number,
                     Attendee.attendee_id != attendee_id
-                ).first()
+                ).limit(1))
                 
                 if existing_attendee:
-                    audit_service.log_action(
-                        db=db,
+                    await audit_service.log_action(
                         action="UPDATE_ATTENDEE_FAILED",
                         user_id=current_user.id,
                         resource="attendees",
@@ -220,16 +512,68 @@ async def update_attendee(
         
         # Update fields
         attendee_data = attendee_update.dict(exclude_unset=True)
-        for key, value in attendee_data.items():
-            setattr(db_attendee, key, value)
         
-        db_attendee.updated_at = datetime.now(timezone.utc)
-        db.commit()
-        db.refresh(db_attendee)
+        async def apply_update(session: AsyncSession) -> Attendee:
+            target = await session.get(Attendee, attendee_id)
+            if target is None:
+                raise LookupError(f"Attendee {attendee_id} was deleted")
+            for key, value in attendee_data.items():
+                setattr(target, key, value)
+            target.updated_at = datetime.now(timezone.utc)
+            await session.flush()
+            await session.refresh(target)
+            await shard.outbox.record(session, "attendee.updated", [attendee_payload(target)])
+            return target
+        
+        if target_shard is shard:
+            db_attendee = await shard.lane.submit(apply_update)
+        else:
+            # Copy the row to the new document's shard first, then drop the old copy. Until
+            # the second commit both exist; ShardSessions.locate serves the newer one
+            moved = {column.name: getattr(db_attendee, column.name) for column in Attendee.__table__.columns}
+            moved.update(attendee_data, updated_at=datetime.now(timezone.utc))
+            
+            async def insert_moved(session: AsyncSession) -> Attendee:
+                target = Attendee(**moved)
+                session.add(target)
+                await session.flush()
+                await session.refresh(target)
+                return target
+            
+            db_attendee = await target_shard.lane.submit(insert_moved)
+            payload = attendee_payload(db_attendee)
+            
+            # The update event commits with the removal of the old copy, so a failed move emits nothing
+            async def drop_old_copy(session: AsyncSession):
+                await session.execute(delete(Attendee).where(Attendee.attendee_id == attendee_id))
+                await shard.outbox.record(session, "attendee.updated", [payload])
+            
+            try:
+                await shard.lane.submit(drop_old_copy)
+            except Exception as e:
+                try:
+                    await target_shard.lane.submit(
+                        lambda session: session.execute(delete(Attendee).where(Attendee.attendee_id == attendee_id))
+                    )
+                except Exception as undo_error:
+                    print(f"Could not undo the move of attendee {attendee_id} to shard {target_shard.index}: "
+                          f"{undo_error}")
+                await audit_service.log_action(
+                    action="UPDATE_ATTENDEE_MOVE_FAILED",
+                    user_id=current_user.id,
+                    resource="attendees",
+                    ip_address=request.client.host if request.client else "unknown",
+                    user_agent=request.headers.get("user-agent"),
+                    details=f"Could not move attendee {attendee_id} from shard {shard.index} "
+                            f"to shard {target_shard.index}: {str(e)}"
+                )
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Could not move the attendee to its new document's shard; retry the update"
+                )
         
         # Log successful update
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="UPDATE_ATTENDEE",
             user_id=current_user.id,
             resource="attendees",
@@ -243,11 +587,11 @@ async def update_attendee(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
-        audit_service.log_action(
-            db=db,
+        user_id = current_user.id  # read before rollback expires it
+        await shards.rollback()
+        await audit_service.log_action(
             action="UPDATE_ATTENDEE_ERROR",
-            user_id=current_user.id,
+            user_id=user_id,
             resource="attendees",
             ip_address=request.client.host if request.client else "unknown",
             user_agent=request.headers.get("user-agent"),
@@ -264,14 +608,13 @@ async def delete_attendee(
     request: Request,
     current_user = Depends(get_current_user),
     _: str = Depends(require_scope("delete:attendees")),
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_write_shards)
 ):
     """Delete an attendee (requires authentication and delete:attendees scope - admin only)"""
-    db_attendee = db.query(Attendee).filter(Attendee.attendee_id == attendee_id).first()
+    shard, db_attendee = await shards.locate(attendee_id)
     
     if db_attendee is None:
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="DELETE_ATTENDEE_NOT_FOUND",
             user_id=current_user.id,
             resource="attendees",
@@ -286,12 +629,16 @@ async def delete_attendee(
     
     try:
         attendee_name = db_attendee.name
-        db.delete(db_attendee)
-        db.commit()
+        deleted = attendee_payload(db_attendee)
+        
+        async def delete_row(session: AsyncSession):
+            await session.execute(delete(Attendee).where(Attendee.attendee_id == attendee_id))
+            await shard.outbox.record(session, "attendee.deleted", [deleted])
+        
+        await shard.lane.submit(delete_row)
         
         # Log successful deletion
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="DELETE_ATTENDEE",
             user_id=current_user.id,
             resource="attendees",
@@ -303,11 +650,11 @@ async def delete_attendee(
         return {"message": f"Attendee {attendee_name} deleted successfully"}
         
     except Exception as e:
-        db.rollback()
-        audit_service.log_action(
-            db=db,
+        user_id = current_user.id  # read before rollback expires it
+        await shards.rollback()
+        await audit_service.log_action(
             action="DELETE_ATTENDEE_ERROR",
-            user_id=current_user.id,
+            user_id=user_id,
             resource="attendees",
             ip_address=request.client.host,
             user_agent=request.headers.get("user-agent"),
@@ -325,17 +672,17 @@ async def search_attendee_by_document(
     request: Request,
     current_user = Depends(get_current_user),
     _: str = Depends(require_scope("read:attendees")),
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_read_shards)
 ):
     """Search attendee by document type and number (requires authentication and read:attendees scope)"""
-    attendee = db.query(Attendee).filter(
+    db = await shards.session(shards.shards.for_document(document_type, document_number))
+    attendee = await db.scalar(select(Attendee).where(
         Attendee.document_type == document_type,
         Attendee.document_number == document_number
-    ).first()
+    ).limit(1))
     
     if attendee is None:
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="SEARCH_ATTENDEE_NOT_FOUND",
             user_id=current_user.id,
             resource="attendees",
@@ -349,8 +696,7 @@ async def search_attendee_by_document(
         )
     
     # Log successful search
-    audit_service.log_action(
-        db=db,
+    await audit_service.log_action(
         action="SEARCH_ATTENDEE",
         user_id=current_user.id,
         resource="attendees",
@@ -367,14 +713,17 @@ async def search_attendees_by_email(
     request: Request,
     current_user = Depends(get_current_user),
     _: str = Depends(require_scope("read:attendees")),
-    db: Session = Depends(get_db)
+    shards: ShardSessions = Depends(get_read_shards)
 ):
     """Search attendees by email (requires authentication and read:attendees scope)"""
-    attendees = db.query(Attendee).filter(Attendee.email.ilike(f"%{email}%")).all()
+    async def matches(shard, db: AsyncSession):
+        statement = select(Attendee).where(Attendee.email.ilike(f"%{email}%")).order_by(Attendee.attendee_id)
+        return (await db.scalars(statement)).all()
+    
+    attendees = list(heapq.merge(*await shards.gather(matches), key=by_id))
     
     # Log search
-    audit_service.log_action(
-        db=db,
+    await audit_service.log_action(
         action="SEARCH_ATTENDEES_BY_EMAIL",
         user_id=current_user.id,
         resource="attendees",
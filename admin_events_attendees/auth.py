@@ -1,25 +1,32 @@
 import secrets
-import pyotp
-import qrcode
-import io
-import base64
 import bcrypt
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any
-from jose import JWTError, jwt
+from typing import Optional, Dict, Any, Tuple
+from jose import JWTError
 from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from database import get_db, User, RefreshToken, AuditLog
+from lockout import as_utc, login_attempts
+from refresh_tokens import revoked_values, token_digest
+from revocation import revocation_list, token_entry, user_entry
+from signing_keys import key_ring
+from api_keys import api_key_cache, is_api_key
+from mfa import mfa_service
 from schemas import TokenData
+from metrics import BCRYPT_DURATION, AUDIT_QUEUE_DEPTH
+from timing import phase
+from write_lane import write_lane
+import replication
 from config import (
-    JWT_SECRET_KEY, 
-    JWT_ALGORITHM, 
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES,
     JWT_REFRESH_TOKEN_EXPIRE_DAYS,
     BCRYPT_ROUNDS,
-    MFA_ENABLED,
-    MFA_ISSUER
+    LAST_LOGIN_WRITE_INTERVAL_SECONDS,
+    MFA_ENABLED
 )
 
 # JWT Security
@@ -37,7 +44,8 @@ class AuthService:
             # Convert strings to bytes for bcrypt
             plain_bytes = plain_password.encode('utf-8')
             hashed_bytes = hashed_password.encode('utf-8')
-            return bcrypt.checkpw(plain_bytes, hashed_bytes)
+            with BCRYPT_DURATION.labels("verify").time():
+                return bcrypt.checkpw(plain_bytes, hashed_bytes)
         except (ValueError, TypeError):
             return False
     
@@ -46,7 +54,8 @@ class AuthService:
         # Convert password to bytes and hash with salt
         password_bytes = password.encode('utf-8')
         salt = bcrypt.gensalt(rounds=self.bcrypt_rounds)
-        hashed = bcrypt.hashpw(password_bytes, salt)
+        with BCRYPT_DURATION.labels("hash").time():
+            hashed = bcrypt.hashpw(password_bytes, salt)
         return hashed.decode('utf-8')
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -57,67 +66,106 @@ class AuthService:
         else:
             expire = datetime.now(timezone.utc) + timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
         
-        to_encode.update({"exp": expire, "type": "access"})
-        encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
-        return encoded_jwt
+        # jti and iat let a single token or all of a user's tokens be revoked (revocation.py).
+        # iat keeps its fraction (RFC 7519 allows it) so a revocation does not catch
+        # tokens issued after it within the same second
+        to_encode.update({
+            "exp": expire, "type": "access",
+            "jti": secrets.token_urlsafe(16), "iat": datetime.now(timezone.utc).timestamp()
+        })
+        return key_ring.sign(to_encode)
     
-    def create_refresh_token(self, user_id: int, db: Session) -> str:
+    async def create_refresh_token(self, user_id: int) -> str:
         """Create and store refresh token"""
         # Generate secure random token
         token = secrets.token_urlsafe(32)
-        expires_at = datetime.now(timezone.utc) + timedelta(days=JWT_REFRESH_TOKEN_EXPIRE_DAYS)
-        
-        # Revoke existing refresh tokens for user
-        db.query(RefreshToken).filter(
-            RefreshToken.user_id == user_id,
-            RefreshToken.is_revoked == False
-        ).update({"is_revoked": True})
-        
-        # Create new refresh token
-        refresh_token = RefreshToken(
-            token=token,
-            user_id=user_id,
-            expires_at=expires_at
-        )
-        db.add(refresh_token)
-        db.commit()
-        
+        await write_lane.submit(lambda session: self.store_refresh_token(session, user_id, token))
         return token
     
+    async def store_refresh_token(self, session: AsyncSession, user_id: int, token: str):
+        """Replace the user's active refresh token with `token` in one statement (call inside a write unit)"""
+        values = {
+            "token_hash": token_digest(token),
+            "user_id": user_id,
+            "expires_at": datetime.now(timezone.utc) + timedelta(days=JWT_REFRESH_TOKEN_EXPIRE_DAYS),
+            "created_at": datetime.now(timezone.utc),
+            "is_revoked": False,
+        }
+        dialect = sqlite if session.bind.dialect.name == "sqlite" else postgresql
+        statement = dialect.insert(RefreshToken).values(**values)
+        # Upsert on the partial unique index of active tokens: the previous
+        # token is overwritten (so revoked) instead of flagged and kept
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=[RefreshToken.user_id],
+            index_where=RefreshToken.is_revoked == False,
+            set_={name: statement.excluded[name] for name in ("token_hash", "expires_at", "created_at")},
+        ))
+    
     def verify_token(self, token: str) -> Optional[TokenData]:
         """Verify and decode JWT token"""
         try:
-            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+            with phase("token"):
+                payload = key_ring.decode(token)
             username: str = payload.get("sub")
             user_id: int = payload.get("user_id")
             token_type: str = payload.get("type", "access")
             
             if username is None or user_id is None:
                 return None
+            if revocation_list.is_revoked(payload.get("jti"), user_id, payload.get("iat")):
+                return None
             
             return TokenData(
                 username=username, 
                 user_id=user_id,
-                scopes=payload.get("scopes", [])
+                scopes=payload.get("scopes", []),
+                jti=payload.get("jti"),
+                expires_at=payload.get("exp")
             )
         except JWTError:
             return None
     
-    def refresh_access_token(self, refresh_token: str, db: Session) -> Optional[Dict[str, Any]]:
-        """Create new access token from refresh token"""
-        # Find refresh token in database
-        db_token = db.query(RefreshToken).filter(
-            RefreshToken.token == refresh_token,
-            RefreshToken.is_revoked == False,
-            RefreshToken.expires_at > datetime.now(timezone.utc)
-        ).first()
+    async def refresh_access_token(
+        self, refresh_token: str, db: AsyncSession, audit: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Rotate a refresh token and create a new access token (one query, one commit)"""
+        # Token and user in one indexed lookup
+        row = (await db.execute(
+            select(RefreshToken.id, RefreshToken.is_revoked, RefreshToken.expires_at, User)
+            .join(User, User.id == RefreshToken.user_id)
+            .where(RefreshToken.token_hash == token_digest(refresh_token))
+        )).first()
         
-        if not db_token:
+        if row is None:
+            return None
+        user = row.User
+        if row.is_revoked:
+            # A rotated token presented again was copied: end the session
+            await self.revoke_user_sessions(user.id, audit=audit and dict(
+                audit, action="REFRESH_TOKEN_REUSED", user_id=user.id, details="Revoked refresh token reused"
+            ))
+            return None
+        if as_utc(row.expires_at) <= datetime.now(timezone.utc) or not user.is_active:
             return None
         
-        # Get user
-        user = db.query(User).filter(User.id == db_token.user_id).first()
-        if not user or not user.is_active:
+        token_id, user_id = row.id, user.id
+        new_token = secrets.token_urlsafe(32)
+        
+        async def rotate(session: AsyncSession) -> bool:
+            result = await session.execute(
+                update(RefreshToken)
+                .where(RefreshToken.id == token_id, RefreshToken.is_revoked == False)
+                .values(**revoked_values())
+            )
+            if result.rowcount == 0:
+                return False  # rotated meanwhile by another request with the same token
+            await self.store_refresh_token(session, user_id, new_token)
+            return True
+        
+        if not await write_lane.submit(rotate):
+            await self.revoke_user_sessions(user_id, audit=audit and dict(
+                audit, action="REFRESH_TOKEN_REUSED", user_id=user_id, details="Refresh token used twice"
+            ))
             return None
         
         # Create new access token
@@ -129,21 +177,50 @@ class AuthService:
         
         return {
             "access_token": access_token,
+            "refresh_token": new_token,
             "token_type": "bearer",
             "expires_in": JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60
         }
     
-    def revoke_refresh_token(self, refresh_token: str, db: Session) -> bool:
-        """Revoke a refresh token"""
-        db_token = db.query(RefreshToken).filter(
-            RefreshToken.token == refresh_token
-        ).first()
+    async def logout(self, refresh_token: str, access_token: TokenData, audit: Dict[str, Any]):
+        """Revoke the refresh token and the access token presented, with the audit entry (one commit)"""
+        entry = token_entry(access_token.jti, access_token.user_id, access_token.expires_at) \
+            if access_token.jti else None
         
-        if db_token:
-            db_token.is_revoked = True
-            db.commit()
-            return True
-        return False
+        async def unit(session: AsyncSession):
+            await session.execute(
+                update(RefreshToken)
+                .where(RefreshToken.token_hash == token_digest(refresh_token), RefreshToken.is_revoked == False)
+                .values(**revoked_values())
+            )
+            if entry:
+                revocation_list.record(session, entry)
+            audit_service.record(session, **audit)
+        
+        await write_lane.submit(unit)
+        if entry:
+            revocation_list.apply(entry)
+    
+    async def revoke_user_sessions(
+        self, user_id: int, audit: Optional[Dict[str, Any]] = None, deactivate: bool = False
+    ):
+        """Revoke every refresh and access token of a user, optionally deactivating it (one commit)"""
+        entry = user_entry(user_id)
+        
+        async def revoke(session: AsyncSession):
+            if deactivate:
+                await session.execute(update(User).where(User.id == user_id).values(is_active=False))
+            await session.execute(
+                update(RefreshToken)
+                .where(RefreshToken.user_id == user_id, RefreshToken.is_revoked == False)
+                .values(**revoked_values())
+            )
+            revocation_list.record(session, entry)
+            if audit:
+                audit_service.record(session, **audit)
+        
+        await write_lane.submit(revoke)
+        revocation_list.apply(entry)
     
     def get_user_scopes(self, user: User) -> list[str]:
         """Get user permissions/scopes"""
@@ -154,76 +231,75 @@ class AuthService:
             scopes.append("write:attendees")
         return scopes
     
-    def authenticate_user(self, db: Session, username: str, password: str) -> Optional[User]:
-        """Authenticate user with username and password"""
-        user = db.query(User).filter(User.username == username).first()
+    async def check_credentials(self, db: AsyncSession, username: str, password: str) -> Tuple[Optional[User], bool]:
+        """Look up the user and verify the password; (None, False) for unknown usernames"""
+        user = await db.scalar(select(User).where(User.username == username))
         if not user:
-            return None
-        if not self.verify_password(password, user.hashed_password):
-            return None
-        return user
+            return None, False
+        # bcrypt is CPU-bound; keep it off the event loop
+        return user, await run_in_threadpool(self.verify_password, password, user.hashed_password)
     
-    def is_account_locked(self, user: User) -> bool:
+    async def authenticate_user(self, db: AsyncSession, username: str, password: str) -> Optional[User]:
+        """Authenticate user with username and password"""
+        user, password_ok = await self.check_credentials(db, username, password)
+        return user if password_ok else None
+    
+    async def is_account_locked(self, user: User) -> bool:
         """Check if user account is locked due to failed login attempts"""
-        if user.locked_until and user.locked_until > datetime.now(timezone.utc):
+        locked_until = as_utc(user.locked_until)
+        if locked_until and locked_until > datetime.now(timezone.utc):
             return True
-        return False
+        return await login_attempts.locked_until(user.id) is not None
     
-    def increment_login_attempts(self, user: User, db: Session):
-        """Increment failed login attempts and lock account if necessary"""
-        user.login_attempts += 1
+    async def record_failed_login(self, user: User, audit: Optional[Dict[str, Any]] = None):
+        """Count a failed attempt; the users row is only written when it locks the account"""
+        # Failures while locked are not counted, so they cannot extend the lock
+        locked_until = None if await self.is_account_locked(user) else await login_attempts.record_failure(user.id)
+        if locked_until is None and not audit:
+            return
+        user_id, attempts = user.id, login_attempts.max_attempts
         
-        # Lock account after 5 failed attempts for 15 minutes
-        if user.login_attempts >= 5:
-            user.locked_until = datetime.now(timezone.utc) + timedelta(minutes=15)
+        async def failed_attempt(session: AsyncSession):
+            if locked_until is not None:
+                await session.execute(
+                    update(User).where(User.id == user_id).values(login_attempts=attempts, locked_until=locked_until)
+                )
+            if audit:
+                audit_service.record(session, **audit)
         
-        db.commit()
+        await write_lane.submit(failed_attempt)
     
-    def reset_login_attempts(self, user: User, db: Session):
-        """Reset login attempts on successful login"""
-        user.login_attempts = 0
-        user.locked_until = None
-        user.last_login = datetime.now(timezone.utc)
-        db.commit()
-
-# MFA Service
-class MFAService:
-    def generate_secret(self) -> str:
-        """Generate MFA secret"""
-        return pyotp.random_base32()
+    def login_reset_values(self, user: User) -> Dict[str, Any]:
+        """Columns a successful login has to change on the user row (often none)"""
+        values = {}
+        if user.login_attempts or user.locked_until is not None:
+            values.update(login_attempts=0, locked_until=None)
+        now = datetime.now(timezone.utc)
+        last_login = as_utc(user.last_login)
+        if last_login is None or now - last_login >= timedelta(seconds=LAST_LOGIN_WRITE_INTERVAL_SECONDS):
+            values["last_login"] = now
+        return values
     
-    def generate_qr_code(self, secret: str, username: str) -> str:
-        """Generate QR code for MFA setup"""
-        totp_uri = pyotp.totp.TOTP(secret).provisioning_uri(
-            name=username,
-            issuer_name=MFA_ISSUER
-        )
-        
-        # Generate QR code
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(totp_uri)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
+    async def complete_login(self, user: User, audit: Dict[str, Any]) -> str:
+        """One commit for a successful login: attempt reset, new refresh token and audit entry"""
+        token = secrets.token_urlsafe(32)
+        user_id = user.id
+        reset = self.login_reset_values(user)
         
-        # Convert to base64
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        img_str = base64.b64encode(buffer.getvalue()).decode()
+        async def login(session: AsyncSession):
+            if reset:
+                await session.execute(update(User).where(User.id == user_id).values(**reset))
+            await self.store_refresh_token(session, user_id, token)
+            audit_service.record(session, **audit)
         
-        return f"data:image/png;base64,{img_str}"
-    
-    def verify_mfa_code(self, secret: str, code: str) -> bool:
-        """Verify MFA code"""
-        totp = pyotp.TOTP(secret)
-        return totp.verify(code, valid_window=1)
+        await write_lane.submit(login)
+        await login_attempts.clear(user_id)
+        return token
 
 # Audit Service
 class AuditService:
-    def log_action(
+    async def log_action(
         self, 
-        db: Session, 
         action: str, 
         user_id: Optional[int] = None,
         resource: Optional[str] = None,
@@ -232,27 +308,45 @@ class AuditService:
         details: Optional[str] = None
     ):
         """Log user action for audit trail"""
-        audit_log = AuditLog(
-            user_id=user_id,
-            action=action,
-            resource=resource,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            details=details
-        )
-        db.add(audit_log)
-        db.commit()
+        entry = {
+            "user_id": user_id,
+            "action": action,
+            "resource": resource,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "details": details,
+        }
+        if replication.follower is not None:
+            # Followers are read-only; the primary stores their audit trail
+            replication.follower.forward_audit(entry)
+            return
+        
+        async def insert_audit_log(session: AsyncSession):
+            session.add(AuditLog(**entry))
+        
+        AUDIT_QUEUE_DEPTH.inc()
+        try:
+            with phase("audit"):
+                await write_lane.submit(insert_audit_log)
+        finally:
+            AUDIT_QUEUE_DEPTH.dec()
+    
+    def record(self, session: AsyncSession, **entry):
+        """Add an audit entry (log_action's arguments) to a write unit's transaction"""
+        if replication.follower is not None:
+            replication.follower.forward_audit(entry)
+            return
+        session.add(AuditLog(**entry))
 
 # Dependency instances
 auth_service = AuthService()
-mfa_service = MFAService()
 audit_service = AuditService()
 
 # Dependencies for route protection
 async def get_current_user(
     request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Get current authenticated user"""
     credentials_exception = HTTPException(
@@ -263,8 +357,7 @@ async def get_current_user(
     
     if credentials is None:
         # Log failed authentication attempt
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="AUTH_FAILED",
             ip_address=request.client.host,
             user_agent=request.headers.get("user-agent"),
@@ -272,11 +365,28 @@ async def get_current_user(
         )
         raise credentials_exception
     
+    if is_api_key(credentials.credentials):
+        identity = await api_key_cache.lookup(credentials.credentials, db)
+        if identity is None:
+            await audit_service.log_action(
+                action="AUTH_FAILED",
+                ip_address=request.client.host,
+                user_agent=request.headers.get("user-agent"),
+                details="Invalid API key"
+            )
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        # Acts as the key's owner, with the key's scopes
+        request.state.api_key = identity
+        return identity.user
+    
     token_data = auth_service.verify_token(credentials.credentials)
     if token_data is None:
         # Log failed authentication attempt
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="AUTH_FAILED",
             ip_address=request.client.host,
             user_agent=request.headers.get("user-agent"),
@@ -288,7 +398,8 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = db.query(User).filter(User.username == token_data.username).first()
+    with phase("user"):
+        user = await db.scalar(select(User).where(User.username == token_data.username))
     if user is None:
         raise credentials_exception
     
@@ -298,13 +409,28 @@ async def get_current_user(
             detail="Inactive user"
         )
     
+    request.state.access_token = token_data
     return user
 
+async def get_session_user(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+) -> User:
+    """Get the user of a login session; API keys cannot change passwords, MFA or sessions"""
+    if getattr(request.state, "api_key", None) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not available with an API key"
+        )
+    return current_user
+
 async def get_current_admin_user(
+    request: Request,
     current_user: User = Depends(get_current_user)
 ) -> User:
     """Get current authenticated admin user"""
-    if not current_user.is_admin:
+    api_key = getattr(request.state, "api_key", None)
+    if not current_user.is_admin or (api_key is not None and "admin" not in api_key.scopes):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
@@ -315,7 +441,8 @@ def require_scope(required_scope: str):
     """Decorator to require specific scope"""
     async def scope_checker(
         request: Request,
-        credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+        db: AsyncSession = Depends(get_db)
     ):
         if credentials is None:
             raise HTTPException(
@@ -324,7 +451,13 @@ def require_scope(required_scope: str):
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        token_data = auth_service.verify_token(credentials.credentials)
+        if is_api_key(credentials.credentials):
+            identity = await api_key_cache.lookup(credentials.credentials, db)
+            token_data = identity and TokenData(
+                username=identity.user.username, user_id=identity.user.id, scopes=identity.scopes
+            )
+        else:
+            token_data = auth_service.verify_token(credentials.credentials)
         if not token_data or required_scope not in token_data.scopes:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -1,35 +1,41 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from datetime import timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
 from typing import List
 
-from database import get_db, User
+from database import ApiKey, User
+from replicas import get_read_db, get_write_db
 from schemas import (
     UserCreate, UserLogin, UserResponse, Token, RefreshTokenRequest,
-    MFASetupResponse, MFAVerificationRequest, PasswordChangeRequest,
-    AuditLogResponse
+    MFASetupResponse, MFAVerificationRequest, QRCodeFormat, PasswordChangeRequest,
+    AuditLogResponse, ProfileInfo, ApiKeyCreate, ApiKeyResponse, ApiKeyCreated
 )
+from timing import TimedRoute
 from auth import (
     auth_service, mfa_service, audit_service, get_current_user, 
-    get_current_admin_user, security
+    get_current_admin_user, get_session_user, security
 )
+from api_keys import api_key_cache, api_key_digest, generate_api_key
+from profiling import profile_store
 from config import JWT_ACCESS_TOKEN_EXPIRE_MINUTES, MFA_ENABLED
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register_user(
     user: UserCreate,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
     """Register a new user"""
     # Check if username already exists
-    db_user = db.query(User).filter(User.username == user.username).first()
+    db_user = await db.scalar(select(User).where(User.username == user.username))
     if db_user:
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="REGISTER_FAILED",
             ip_address=request.client.host,
             user_agent=request.headers.get("user-agent"),
@@ -41,10 +47,9 @@ async def register_user(
         )
     
     # Check if email already exists
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = await db.scalar(select(User).where(User.email == user.email))
     if db_user:
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="REGISTER_FAILED",
             ip_address=request.client.host,
             user_agent=request.headers.get("user-agent"),
@@ -56,7 +61,7 @@ async def register_user(
         )
     
     # Create new user
-    hashed_password = auth_service.get_password_hash(user.password)
+    hashed_password = await run_in_threadpool(auth_service.get_password_hash, user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -65,12 +70,11 @@ async def register_user(
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     # Log successful registration
-    audit_service.log_action(
-        db=db,
+    await audit_service.log_action(
         action="USER_REGISTERED",
         user_id=db_user.id,
         ip_address=request.client.host,
@@ -85,19 +89,26 @@ async def login_user(
     user_credentials: UserLogin,
     request: Request,
     response: Response,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
     """Authenticate user and return tokens"""
-    user = auth_service.authenticate_user(db, user_credentials.username, user_credentials.password)
+    user, password_ok = await auth_service.check_credentials(
+        db, user_credentials.username, user_credentials.password
+    )
     
-    if not user:
-        audit_service.log_action(
-            db=db,
+    if not password_ok:
+        audit = dict(
             action="LOGIN_FAILED",
+            user_id=user.id if user else None,
             ip_address=request.client.host,
             user_agent=request.headers.get("user-agent"),
             details=f"Invalid credentials for: {user_credentials.username}"
         )
+        if user:
+            # Counts towards the lockout, with the audit entry in the same commit
+            await auth_service.record_failed_login(user, audit=audit)
+        else:
+            await audit_service.log_action(**audit)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -105,8 +116,7 @@ async def login_user(
         )
     
     if not user.is_active:
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="LOGIN_FAILED",
             user_id=user.id,
             ip_address=request.client.host,
@@ -119,9 +129,8 @@ async def login_user(
         )
     
     # Check if account is locked
-    if auth_service.is_account_locked(user):
-        audit_service.log_action(
-            db=db,
+    if await auth_service.is_account_locked(user):
+        await audit_service.log_action(
             action="LOGIN_FAILED",
             user_id=user.id,
             ip_address=request.client.host,
@@ -141,24 +150,19 @@ async def login_user(
                 detail="MFA code required"
             )
         
-        if not mfa_service.verify_mfa_code(user.mfa_secret, user_credentials.mfa_code):
-            auth_service.increment_login_attempts(user, db)
-            audit_service.log_action(
-                db=db,
+        if not await mfa_service.verify_mfa_code(user.id, user.mfa_secret, user_credentials.mfa_code):
+            await auth_service.record_failed_login(user, audit=dict(
                 action="MFA_FAILED",
                 user_id=user.id,
                 ip_address=request.client.host,
                 user_agent=request.headers.get("user-agent"),
                 details="Invalid MFA code"
-            )
+            ))
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid MFA code"
             )
     
-    # Reset login attempts on successful authentication
-    auth_service.reset_login_attempts(user, db)
-    
     # Create tokens
     access_token_expires = timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
     scopes = auth_service.get_user_scopes(user)
@@ -168,17 +172,14 @@ async def login_user(
         expires_delta=access_token_expires
     )
     
-    refresh_token = auth_service.create_refresh_token(user.id, db)
-    
-    # Log successful login
-    audit_service.log_action(
-        db=db,
+    # Reset login attempts, store the refresh token and log the login in one commit
+    refresh_token = await auth_service.complete_login(user, audit=dict(
         action="LOGIN_SUCCESS",
         user_id=user.id,
         ip_address=request.client.host,
         user_agent=request.headers.get("user-agent"),
         details="User logged in successfully"
-    )
+    ))
     
     return {
         "access_token": access_token,
@@ -191,14 +192,16 @@ async def login_user(
 async def refresh_token(
     token_request: RefreshTokenRequest,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
     """Refresh access token using refresh token"""
-    result = auth_service.refresh_access_token(token_request.refresh_token, db)
+    result = await auth_service.refresh_access_token(token_request.refresh_token, db, audit=dict(
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent")
+    ))
     
     if not result:
-        audit_service.log_action(
-            db=db,
+        await audit_service.log_action(
             action="TOKEN_REFRESH_FAILED",
             ip_address=request.client.host,
             user_agent=request.headers.get("user-agent"),
@@ -215,20 +218,17 @@ async def refresh_token(
 async def logout_user(
     token_request: RefreshTokenRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_session_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    """Logout user and revoke refresh token"""
-    auth_service.revoke_refresh_token(token_request.refresh_token, db)
-    
-    audit_service.log_action(
-        db=db,
+    """Logout user and revoke refresh token and access token"""
+    await auth_service.logout(token_request.refresh_token, request.state.access_token, audit=dict(
         action="LOGOUT",
         user_id=current_user.id,
         ip_address=request.client.host,
         user_agent=request.headers.get("user-agent"),
         details="User logged out"
-    )
+    ))
     
     return {"message": "Successfully logged out"}
 
@@ -241,14 +241,15 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 async def change_password(
     password_request: PasswordChangeRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_session_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """Change user password"""
     # Verify current password
-    if not auth_service.verify_password(password_request.current_password, current_user.hashed_password):
-        audit_service.log_action(
-            db=db,
+    if not await run_in_threadpool(
+        auth_service.verify_password, password_request.current_password, current_user.hashed_password
+    ):
+        await audit_service.log_action(
             action="PASSWORD_CHANGE_FAILED",
             user_id=current_user.id,
             ip_address=request.client.host,
@@ -261,18 +262,15 @@ async def change_password(
         )
     
     # Update password
-    current_user.hashed_password = auth_service.get_password_hash(password_request.new_password)
-    db.commit()
-    
-    # Revoke all refresh tokens to force re-login
-    from database import RefreshToken
-    db.query(RefreshToken).filter(RefreshToken.user_id == current_user.id).update(
-        {"is_revoked": True}
+    current_user.hashed_password = await run_in_threadpool(
+        auth_service.get_password_hash, password_request.new_password
     )
-    db.commit()
+    await db.commit()
     
-    audit_service.log_action(
-        db=db,
+    # Revoke all refresh and access tokens to force re-login
+    await auth_service.revoke_user_sessions(current_user.id)
+    
+    await audit_service.log_action(
         action="PASSWORD_CHANGED",
         user_id=current_user.id,
         ip_address=request.client.host,
@@ -285,8 +283,9 @@ async def change_password(
 # MFA endpoints
 @router.post("/mfa/setup", response_model=MFASetupResponse)
 async def setup_mfa(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    qr_format: QRCodeFormat = QRCodeFormat.png,
+    current_user: User = Depends(get_session_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """Setup MFA for user"""
     if not MFA_ENABLED:
@@ -303,11 +302,11 @@ async def setup_mfa(
     
     # Generate secret
     secret = mfa_service.generate_secret()
-    qr_code = mfa_service.generate_qr_code(secret, current_user.username)
+    qr_code = await mfa_service.generate_qr_code(secret, current_user.username, qr_format.value)
     
     # Store secret temporarily (not enabled until verified)
     current_user.mfa_secret = secret
-    db.commit()
+    await db.commit()
     
     return {
         "secret": secret,
@@ -318,8 +317,8 @@ async def setup_mfa(
 async def verify_mfa_setup(
     mfa_request: MFAVerificationRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_session_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """Verify and enable MFA"""
     if not current_user.mfa_secret:
@@ -328,9 +327,8 @@ async def verify_mfa_setup(
             detail="MFA setup not initiated"
         )
     
-    if not mfa_service.verify_mfa_code(current_user.mfa_secret, mfa_request.mfa_code):
-        audit_service.log_action(
-            db=db,
+    if not await mfa_service.verify_mfa_code(current_user.id, current_user.mfa_secret, mfa_request.mfa_code):
+        await audit_service.log_action(
             action="MFA_SETUP_FAILED",
             user_id=current_user.id,
             ip_address=request.client.host,
@@ -344,10 +342,9 @@ async def verify_mfa_setup(
     
     # Enable MFA
     current_user.mfa_enabled = True
-    db.commit()
+    await db.commit()
     
-    audit_service.log_action(
-        db=db,
+    await audit_service.log_action(
         action="MFA_ENABLED",
         user_id=current_user.id,
         ip_address=request.client.host,
@@ -361,8 +358,8 @@ async def verify_mfa_setup(
 async def disable_mfa(
     mfa_request: MFAVerificationRequest,
     request: Request,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_session_user),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """Disable MFA for user"""
     if not current_user.mfa_enabled:
@@ -371,9 +368,8 @@ async def disable_mfa(
             detail="MFA is not enabled for this user"
         )
     
-    if not mfa_service.verify_mfa_code(current_user.mfa_secret, mfa_request.mfa_code):
-        audit_service.log_action(
-            db=db,
+    if not await mfa_service.verify_mfa_code(current_user.id, current_user.mfa_secret, mfa_request.mfa_code):
+        await audit_service.log_action(
             action="MFA_DISABLE_FAILED",
             user_id=current_user.id,
             ip_address=request.client.host,
@@ -388,10 +384,9 @@ async def disable_mfa(
     # Disable MFA
     current_user.mfa_enabled = False
     current_user.mfa_secret = None
-    db.commit()
+    await db.commit()
     
-    audit_service.log_action(
-        db=db,
+    await audit_service.log_action(
         action="MFA_DISABLED",
         user_id=current_user.id,
         ip_address=request.client.host,
@@ -407,11 +402,13 @@ async def get_audit_logs(
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get audit logs (admin only)"""
     from database import AuditLog
-    logs = db.query(AuditLog).order_by(AuditLog.timestamp.desc()).offset(skip).limit(limit).all()
+    logs = (await db.scalars(
+        select(AuditLog).order_by(AuditLog.timestamp.desc()).offset(skip).limit(limit)
+    )).all()
     return logs
 
 @router.get("/users", response_model=List[UserResponse])
@@ -419,8 +416,132 @@ async def get_all_users(
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get all users (admin only)"""
-    users = db.query(User).offset(skip).limit(limit).all()
+    users = (await db.scalars(select(User).offset(skip).limit(limit))).all()
     return users
+
+@router.post("/users/{user_id}/deactivate")
+async def deactivate_user(
+    user_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_write_db)
+):
+    """Deactivate a user and revoke all of its tokens (admin only)"""
+    if await db.get(User, user_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    await auth_service.revoke_user_sessions(user_id, deactivate=True, audit=dict(
+        action="USER_DEACTIVATED",
+        user_id=current_user.id,
+        resource=f"user:{user_id}",
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent"),
+        details="User deactivated; tokens revoked"
+    ))
+    return {"message": "User deactivated"}
+
+@router.post("/api-keys", response_model=ApiKeyCreated, status_code=status.HTTP_201_CREATED)
+async def create_api_key(
+    api_key: ApiKeyCreate,
+    request: Request,
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_write_db)
+):
+    """Create an API key for a service caller; the key is only returned here (admin only)"""
+    owner_id = api_key.user_id or current_user.id
+    owner = await db.get(User, owner_id)
+    if owner is None or not owner.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The key's user must exist and be active"
+        )
+    key = generate_api_key()
+    db_key = ApiKey(
+        name=api_key.name,
+        prefix=key[:12],
+        key_digest=api_key_digest(key),
+        user_id=owner_id,
+        scopes=" ".join(api_key.scopes)
+    )
+    db.add(db_key)
+    await db.commit()
+    await db.refresh(db_key)
+    
+    await audit_service.log_action(
+        action="API_KEY_CREATED",
+        user_id=current_user.id,
+        resource=f"api_key:{db_key.id}",
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent"),
+        details=f"API key {api_key.name} for user {owner_id}: {db_key.scopes}"
+    )
+    
+    return ApiKeyCreated(**ApiKeyResponse.from_orm(db_key).dict(), key=key)
+
+@router.get("/api-keys", response_model=List[ApiKeyResponse])
+async def list_api_keys(
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """List API keys without their secrets (admin only)"""
+    return (await db.scalars(select(ApiKey).order_by(ApiKey.id))).all()
+
+@router.delete("/api-keys/{key_id}")
+async def revoke_api_key(
+    key_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_write_db)
+):
+    """Revoke an API key (admin only)"""
+    db_key = await db.get(ApiKey, key_id)
+    if db_key is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="API key not found"
+        )
+    if db_key.revoked_at is None:
+        db_key.revoked_at = datetime.now(timezone.utc)
+        await db.commit()
+    # Other workers drop their cached copy within API_KEY_CACHE_SECONDS
+    api_key_cache.invalidate(db_key.key_digest)
+    
+    await audit_service.log_action(
+        action="API_KEY_REVOKED",
+        user_id=current_user.id,
+        resource=f"api_key:{key_id}",
+        ip_address=request.client.host,
+        user_agent=request.headers.get("user-agent"),
+        details=f"API key {db_key.name} revoked"
+    )
+    
+    return {"message": "API key revoked"}
+
+@router.get("/profiles", response_model=List[ProfileInfo])
+async def list_profiles(current_user: User = Depends(get_current_admin_user)):
+    """List captured request profiles, newest first (admin only)"""
+    return profile_store.list_profiles()
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Download a profile as a pstats or collapsed-stack file (admin only)"""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    media_type = "text/plain" if profile["format"] == "collapsed" else "application/octet-stream"
+    return FileResponse(
+        profile["file_path"],
+        media_type=media_type,
+        filename=f"{profile_id}.{profile['format']}"
+    )
@@ -0,0 +1,108 @@
+"""
+Concurrent-request throughput versus database pool size.
+
+Every pool size runs in a fresh process (DB_POOL_SIZE is read at import
+time) against a scratch SQLite database, driving the ASGI app in-process
+with httpx so the numbers reflect the app and the data layer, not the
+network.
+
+Usage:
+    python benchmarks/concurrency.py --pool-sizes 1 2 5 10 --concurrency 50 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(APP_DIR)
+
+
+async def run_load(concurrency: int, total: int, path: str) -> dict:
+    import httpx
+    from auth import auth_service
+    from database import SessionLocal, User, Attendee, create_tables
+    from main import app
+
+    create_tables()
+    db = SessionLocal()
+    user = User(username="bench", email="bench@example.com", hashed_password="x", is_admin=True)
+    db.add(user)
+    db.add_all(
+        Attendee(name=f"Bench {i}", email=f"bench{i}@example.com", document_number=f"B{i}",
+                 phone_number="555-0000")
+        for i in range(200)
+    )
+    db.commit()
+    token = auth_service.create_access_token(
+        {"sub": user.username, "user_id": user.id, "scopes": auth_service.get_user_scopes(user)}
+    )
+    db.close()
+
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one_request():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests_per_second": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def run_child(args):
+    result = asyncio.run(run_load(args.concurrency, args.requests, args.path))
+    print(json.dumps(result))
+
+
+def run_parent(args):
+    print(f"{'pool':>5} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for pool_size in args.pool_sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{tmp}/bench.db",
+                DB_POOL_SIZE=str(pool_size),
+                DB_MAX_OVERFLOW="0",
+                RATE_LIMIT_PER_MINUTE="100000000",
+                LOOP_MONITOR_ENABLED="false",
+            )
+            output = subprocess.run(
+                [sys.executable, __file__, "--child",
+                 "--concurrency", str(args.concurrency),
+                 "--requests", str(args.requests),
+                 "--path", args.path],
+                env=env, cwd=tmp, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{pool_size:>5} {result['requests_per_second']:>10} "
+                  f"{result['p50_ms']:>10} {result['p99_ms']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 5, 10])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--path", default="/attendees/?limit=50")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    run_child(args) if args.child else run_parent(args)
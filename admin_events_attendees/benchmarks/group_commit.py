@@ -0,0 +1,99 @@
+"""
+Write throughput under contention: per-request commits versus the write lane.
+
+C concurrent clients each insert audit rows as fast as they can for a few
+seconds. "direct" gives every write its own pooled connection and commit
+(what handlers did before the lane); "lane" submits every write to a
+WriteLane, which commits whatever is pending in one transaction.
+
+Usage:
+    python benchmarks/group_commit.py --clients 32 --seconds 5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import AuditLog, Base, create_db_engine
+from write_lane import WriteLane
+
+
+def audit_row(session):
+    session.add(AuditLog(action="BENCH", resource="attendees", details="x" * 200))
+
+
+async def run(mode: str, url: str, clients: int, seconds: float) -> dict:
+    setup = create_db_engine(url, use_async=False)
+    Base.metadata.create_all(bind=setup)
+    setup.dispose()
+
+    engine = create_db_engine(url, pool_size=1 if mode == "lane" else clients, max_overflow=0)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    lane = WriteLane(sessions)
+    if mode == "lane":
+        lane.start()
+
+    latencies = []
+    failures = 0
+    deadline = time.perf_counter() + seconds
+
+    async def direct_write():
+        async with sessions() as session:
+            audit_row(session)
+            await session.commit()
+
+    async def lane_write():
+        async def unit(session):
+            audit_row(session)
+        await lane.submit(unit)
+
+    write = lane_write if mode == "lane" else direct_write
+
+    async def client():
+        nonlocal failures
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                await write()
+                latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                failures += 1
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    await lane.stop()
+    await engine.dispose()
+
+    latencies.sort()
+    return {
+        "writes_per_second": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    logging.getLogger("admin_events.sql").setLevel(logging.ERROR)
+
+    print(f"{'mode':>7} {'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7}")
+    for mode in ("direct", "lane"):
+        with tempfile.TemporaryDirectory() as tmp:
+            r = asyncio.run(run(mode, f"sqlite:///{tmp}/bench.db", args.clients, args.seconds))
+        print(f"{mode:>7} {r['writes_per_second']:>9.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['failures']:>7}")
+
+
+if __name__ == "__main__":
+    main()
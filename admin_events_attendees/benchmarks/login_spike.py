@@ -0,0 +1,106 @@
+"""
+Login latency and write transactions during a check-in spike.
+
+Many users log in at once against a scratch SQLite database, with the app
+started through its lifespan (write lane included) and driven in-process
+with httpx. bcrypt runs with BCRYPT_ROUNDS=4 so the numbers show the data
+layer rather than password hashing. Every commit takes the SQLite writer
+lock once, so commits per login is the lock traffic a spike generates.
+
+Usage:
+    python benchmarks/login_spike.py --users 200 --concurrency 50 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(APP_DIR)
+
+
+async def run_load(users: int, concurrency: int, total: int) -> dict:
+    import httpx
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from auth import auth_service
+    from database import SessionLocal, User, create_tables
+    from main import app
+
+    create_tables()
+    db = SessionLocal()
+    hashed_password = auth_service.get_password_hash("checkin-password")
+    db.add_all(
+        User(username=f"user{i}", email=f"user{i}@example.com", hashed_password=hashed_password)
+        for i in range(users)
+    )
+    db.commit()
+    db.close()
+
+    commits = []
+    event.listen(Engine, "commit", lambda conn: commits.append(1))
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def one_login(number: int):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/auth/login", json={"username": f"user{number % users}", "password": "checkin-password"}
+                    )
+                    latencies.append(time.perf_counter() - start)
+                    response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one_login(number) for number in range(total)))
+            elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "logins_per_second": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "commits_per_login": round(len(commits) / total, 2),
+    }
+
+
+def run_child(args):
+    result = asyncio.run(run_load(args.users, args.concurrency, args.requests))
+    print(json.dumps(result))
+
+
+def run_parent(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{tmp}/bench.db",
+            BCRYPT_ROUNDS="4",
+            RATE_LIMIT_PER_MINUTE="100000000",
+            LOOP_MONITOR_ENABLED="false",
+        )
+        output = subprocess.run(
+            [sys.executable, __file__, "--child",
+             "--users", str(args.users), "--concurrency", str(args.concurrency), "--requests", str(args.requests)],
+            env=env, cwd=tmp, capture_output=True, text=True, check=True
+        ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    print(f"{'logins/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'commits/login':>14}")
+    print(f"{result['logins_per_second']:>10} {result['p50_ms']:>10} {result['p99_ms']:>10} "
+          f"{result['commits_per_login']:>14}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    run_child(args) if args.child else run_parent(args)
@@ -0,0 +1,160 @@
+"""
+Overload: a login storm with and without admission control.
+
+server.py (one worker) is started on a scratch SQLite database, once with
+ADMISSION_ENABLED=false and once with it on. --concurrency clients log in
+back to back for --seconds. Password hashing uses real cost (BCRYPT_ROUNDS,
+10 by default), so the storm saturates the CPU. Clients give up after
+--client-timeout seconds, like a browser or a load balancer would, but the
+server still finishes what they left queued. Meanwhile a probe calls
+GET /health and POST /auth/refresh every 100 ms.
+
+The table shows logins served within the client timeout per second
+(goodput), logins shed with 503, logins the client abandoned, other
+failures (connection errors, unexpected statuses), and the latency of the
+probe's health checks and refreshes. With admission control, logins past
+the auth limit should be shed quickly instead of timing out, and refresh
+should stay well under the client timeout.
+
+Usage:
+    python benchmarks/overload.py --concurrency 64 --seconds 15
+"""
+import argparse
+import asyncio
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from workers import APP_DIR, PASSWORD, free_port, wait_until_up
+
+PROBE_INTERVAL_SECONDS = 0.1
+
+
+def percentile(values: list, share: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return round(values[max(0, int(len(values) * share) - 1)] * 1000, 1)
+
+
+async def storm(port: int, concurrency: int, seconds: float, client_timeout: float) -> dict:
+    import httpx
+
+    login = {"username": "bench", "password": PASSWORD}
+    outcomes = {"ok": 0, "shed": 0, "abandoned": 0, "other": 0}
+    ok_latencies, shed_latencies, health, refresh = [], [], [], []
+    limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits,
+                                 timeout=client_timeout) as client:
+        await wait_until_up(client)
+        await client.post("/auth/register", json={**login, "email": "bench@example.com"})
+        refresh_token = (await client.post("/auth/login", json=login)).json()["refresh_token"]
+        deadline = time.monotonic() + seconds
+
+        async def user():
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/auth/login", json=login)
+                except httpx.TimeoutException:
+                    outcomes["abandoned"] += 1
+                    continue
+                except httpx.TransportError:
+                    outcomes["other"] += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                if response.status_code == 200:
+                    outcomes["ok"] += 1
+                    ok_latencies.append(elapsed)
+                elif response.status_code == 503:
+                    outcomes["shed"] += 1
+                    shed_latencies.append(elapsed)
+                    # Jittered, as well-behaved clients do, so retries do not arrive in waves
+                    await asyncio.sleep(random.uniform(0.5, 1.0) * float(response.headers.get("Retry-After", 1)))
+                else:
+                    outcomes["other"] += 1
+
+        async def probe():
+            nonlocal refresh_token
+            while time.monotonic() < deadline:
+                # A failed probe counts with the time it took to fail
+                start = time.perf_counter()
+                try:
+                    await client.get("/health")
+                except httpx.TransportError:
+                    pass
+                health.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/auth/refresh", json={"refresh_token": refresh_token})
+                    refresh_token = response.json().get("refresh_token", refresh_token)
+                except httpx.TransportError:
+                    pass
+                refresh.append(time.perf_counter() - start)
+                await asyncio.sleep(PROBE_INTERVAL_SECONDS)
+
+        started = time.perf_counter()
+        await asyncio.gather(probe(), *(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "goodput": round(outcomes["ok"] / elapsed, 1),
+        **outcomes,
+        "ok_p50_ms": round(statistics.median(ok_latencies) * 1000, 1) if ok_latencies else float("nan"),
+        "shed_p50_ms": round(statistics.median(shed_latencies) * 1000, 1) if shed_latencies else float("nan"),
+        "health_p50_ms": percentile(health, 0.5),
+        "health_p99_ms": percentile(health, 0.99),
+        "refresh_p99_ms": percentile(refresh, 0.99),
+    }
+
+
+def run(admission: bool, args) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{tmp}/overload.db",
+            JWT_KEYS_DIR=f"{tmp}/jwt_keys",
+            BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+            RATE_LIMIT_PER_MINUTE="100000000",
+            LOOP_MONITOR_ENABLED="false",
+            DEBUG="false",
+            ADMISSION_ENABLED=str(admission).lower(),
+            PYTHONPATH=os.pathsep.join(
+                os.path.abspath(path) for path in os.environ.get("PYTHONPATH", "").split(os.pathsep) if path
+            ),
+        )
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(APP_DIR, "server.py"), "--workers", "1",
+             "--port", str(port), "--max-requests", "0", "--graceful-timeout", "1"],
+            env=env, cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            return asyncio.run(storm(port, args.concurrency, args.seconds, args.client_timeout))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--client-timeout", type=float, default=5)
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    columns = ("goodput", "ok", "shed", "abandoned", "other", "ok_p50_ms", "shed_p50_ms", "health_p50_ms", "health_p99_ms",
+               "refresh_p99_ms")
+    print(f"{'admisión':>9} " + " ".join(f"{column:>14}" for column in columns))
+    for admission in (False, True):
+        result = run(admission, args)
+        print(f"{'sí' if admission else 'no':>9} " + " ".join(f"{result[column]:>14}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
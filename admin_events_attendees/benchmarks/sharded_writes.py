@@ -0,0 +1,101 @@
+"""
+Attendee insert throughput of several worker processes with 1, 2 and 4 SQLite shards.
+
+W worker processes (like WEB_CONCURRENCY uvicorn workers) each run C
+concurrent clients that insert attendees with fresh documents for a few
+seconds. Every insert goes to the shard its document hashes to, through
+that worker's write lane for the shard, exactly like POST /attendees/.
+Within one process the lane already groups commits; across processes every
+commit still takes the database file's single write lock, so with one shard
+the workers queue on it and with N shards they mostly lock different files.
+
+Usage:
+    python benchmarks/sharded_writes.py --workers 4 --clients 16 --seconds 5
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Attendee
+from sharding import ShardSet
+
+
+async def run(tmp: str, shards: int, worker: int, clients: int, seconds: float) -> list:
+    shard_set = ShardSet([f"sqlite:///{tmp}/shard-{index}.db" for index in range(shards)])
+    for shard in shard_set.shards:
+        shard.snapshots.directory = os.path.join(tmp, f"snapshots-{worker}-{shard.index}")
+    await shard_set.start()
+
+    numbers = itertools.count()
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def insert(number: int):
+        row = {
+            "name": "Bench", "email": f"bench{number}@example.com", "document_type": "DNI",
+            "document_number": f"BENCH-{worker}-{number}", "phone_number": "555-0000", "address": "x" * 100
+        }
+        shard = shard_set.for_document(row["document_type"], row["document_number"])
+
+        async def unit(session):
+            values = dict(row)
+            await shard.assign_ids(session, [values])
+            session.add(Attendee(**values))
+
+        await shard.lane.submit(unit)
+
+    async def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await insert(next(numbers))
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    await shard_set.stop()
+    return latencies
+
+
+def worker_main(args):
+    logging.getLogger("admin_events.sql").setLevel(logging.ERROR)
+    return asyncio.run(run(*args))
+
+
+def measure(tmp: str, shards: int, workers: int, clients: int, seconds: float) -> dict:
+    # Create the shards once so the workers do not race on the schema
+    asyncio.run(run(tmp, shards, -1, 0, 0))
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.map(worker_main, [(tmp, shards, worker, clients, seconds) for worker in range(workers)])
+    latencies = sorted(latency for result in results for latency in result)
+    return {
+        "writes_per_second": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    logging.getLogger("admin_events.sql").setLevel(logging.ERROR)
+
+    print(f"{'shards':>7} {'writes/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for shards in (1, 2, 4):
+        with tempfile.TemporaryDirectory() as tmp:
+            r = measure(tmp, shards, args.workers, args.clients, args.seconds)
+        print(f"{shards:>7} {r['writes_per_second']:>9.0f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Concurrent read/write benchmark for the SQLite connection profile.
+
+One writer thread commits small transactions back to back (like the audit
+log writes every request makes) while reader threads run the attendee list
+query. The same workload runs against a plain engine (rollback journal,
+default pragmas) and against the tuned engine from create_db_engine().
+
+Readers run with busy_timeout=0, so every time a reader would have had to
+wait for the writer it fails immediately and is counted as a blocked read.
+With the tuned profile (WAL) that count should be zero.
+
+Usage:
+    python benchmarks/sqlite_read_write.py --readers 8 --seconds 5
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from database import Base, create_db_engine
+
+
+def run_workload(engine, readers: int, seconds: float, rows_per_write: int) -> dict:
+    Base.metadata.create_all(bind=engine)
+    stop = threading.Event()
+    read_latencies = []
+    write_latencies = []
+    blocked_reads = []
+    failed_writes = []
+
+    def writer():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        text("INSERT INTO audit_logs (action, details) VALUES (:action, :details)"),
+                        [{"action": "BENCH", "details": "x" * 200}] * rows_per_write
+                    )
+                write_latencies.append(time.perf_counter() - start)
+            except OperationalError as e:
+                failed_writes.append(e)
+
+    def reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.exec_driver_sql("PRAGMA busy_timeout=0")
+                    conn.execute(text(
+                        "SELECT * FROM audit_logs ORDER BY id DESC LIMIT 50"
+                    )).fetchall()
+                read_latencies.append(time.perf_counter() - start)
+            except OperationalError as e:
+                blocked_reads.append(e)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    def p99(values):
+        values = sorted(values)
+        return values[int(len(values) * 0.99) - 1] * 1000 if values else float("nan")
+
+    return {
+        "reads_per_second": len(read_latencies) / seconds,
+        "read_p50_ms": statistics.median(read_latencies) * 1000 if read_latencies else float("nan"),
+        "read_p99_ms": p99(read_latencies),
+        "writes_per_second": len(write_latencies) / seconds,
+        "write_p99_ms": p99(write_latencies),
+        "blocked_reads": len(blocked_reads),
+        "failed_writes": len(failed_writes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rows-per-write", type=int, default=1)
+    args = parser.parse_args()
+    # Lock waits would flood the slow-query log
+    logging.getLogger("admin_events.sql").setLevel(logging.ERROR)
+
+    print(f"{'profile':>8} {'reads/s':>9} {'read p50':>9} {'read p99':>9} {'writes/s':>9} {'write p99':>10} {'blocked':>8} {'failed writes':>14}")
+    for name in ("default", "tuned"):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{tmp}/bench.db"
+            if name == "default":
+                engine = create_engine(url, connect_args={"check_same_thread": False},
+                                       pool_size=args.readers + 1)
+            else:
+                engine = create_db_engine(url, use_async=False, pool_size=args.readers + 1)
+            r = run_workload(engine, args.readers, args.seconds, args.rows_per_write)
+        print(f"{name:>8} {r['reads_per_second']:>9.0f} {r['read_p50_ms']:>9.2f} {r['read_p99_ms']:>9.2f} "
+              f"{r['writes_per_second']:>9.0f} {r['write_p99_ms']:>10.2f} {r['blocked_reads']:>8} {r['failed_writes']:>14}")
+
+
+if __name__ == "__main__":
+    main()
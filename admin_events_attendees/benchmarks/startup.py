@@ -0,0 +1,137 @@
+"""
+Cold start: imports, lifespan and time to the first request.
+
+A fresh interpreter imports main under `python -X importtime`, runs the
+lifespan and serves GET /health. This is what an autoscaled worker, run.sh
+and every test client pay before the first request. It runs twice on a
+scratch database: the first start migrates the empty database, the second
+only checks the schema version, as a restart does. The report lists the
+slowest modules main imports directly, and whether the optional
+dependencies that should load lazily (qrcode, Pillow, pyotp, httpx,
+uvicorn) were imported. tests/test_startup.py runs it with a budget.
+
+Usage:
+    python benchmarks/startup.py --top 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(APP_DIR)
+
+LAZY_MODULES = ("qrcode", "PIL", "pyotp", "httpx", "uvicorn")
+
+
+async def first_request(app) -> dict:
+    """Run the lifespan and one GET /health through the middleware stack (no HTTP client to import)"""
+    timings = {"started": time.perf_counter()}
+    async with app.router.lifespan_context(app):
+        timings["ready"] = time.perf_counter()
+        messages = []
+        requests = [{"type": "http.request", "body": b"", "more_body": False}]
+        sent = asyncio.Event()
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            # Like a server: the client only goes away once the response is out
+            await sent.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                sent.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/health", "raw_path": b"/health", "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"startup")], "client": ("127.0.0.1", 0), "server": ("startup", 80),
+        }
+        await app(scope, receive, send)
+        timings["served"] = time.perf_counter()
+        assert messages[0]["status"] == 200, messages[0]
+    return timings
+
+
+def run_child():
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    timings = asyncio.run(first_request(main.app))
+    print(json.dumps({
+        "import_ms": round((imported - started) * 1000, 1),
+        "lifespan_ms": round((timings["ready"] - timings["started"]) * 1000, 1),
+        "first_request_ms": round((timings["served"] - timings["ready"]) * 1000, 1),
+        "total_ms": round((timings["served"] - started) * 1000, 1),
+        "lazy_modules_loaded": {name: name in sys.modules for name in LAZY_MODULES},
+    }))
+
+
+def slowest_imports(importtime: str, top: int) -> list:
+    """(module, cumulative ms) of main's direct imports, slowest first"""
+    # Lines read "import time: self [us] | cumulative | <two spaces per level>name"
+    modules = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or line.endswith("| imported package"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("   ") and not name.startswith("     "):
+            modules.append((name.strip(), round(int(cumulative) / 1000, 1)))
+    return sorted(modules, key=lambda module: module[1], reverse=True)[:top]
+
+
+def measure_startup(top: int = 10) -> dict:
+    """Start the app twice on a scratch database; returns both runs"""
+    runs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{tmp}/startup.db",
+            JWT_KEYS_DIR=f"{tmp}/jwt_keys",
+            LOOP_MONITOR_ENABLED="false",
+            # The child runs in the scratch directory
+            PYTHONPATH=os.pathsep.join(
+                os.path.abspath(path) for path in os.environ.get("PYTHONPATH", "").split(os.pathsep) if path
+            ),
+        )
+        for run in ("first_start", "restart"):
+            started = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, "-X", "importtime", __file__, "--child"],
+                env=env, cwd=tmp, capture_output=True, text=True
+            )
+            if process.returncode != 0:
+                raise RuntimeError(process.stderr[-2000:])
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+            result["process_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            result["slowest_imports"] = slowest_imports(process.stderr, top)
+            runs[run] = result
+    return runs
+
+
+def run_parent(args):
+    runs = measure_startup(args.top)
+    print(f"{'':12} {'import ms':>10} {'lifespan ms':>12} {'1st req ms':>11} {'total ms':>9} {'process ms':>11}")
+    for run, result in runs.items():
+        print(f"{run:12} {result['import_ms']:>10} {result['lifespan_ms']:>12} {result['first_request_ms']:>11} "
+              f"{result['total_ms']:>9} {result['process_ms']:>11}")
+    print("\nImportaciones más lentas de main (ms acumulados, reinicio):")
+    for name, cumulative in runs["restart"]["slowest_imports"]:
+        print(f"  {cumulative:>8}  {name}")
+    loaded = [name for name, imported in runs["restart"]["lazy_modules_loaded"].items() if imported]
+    print(f"\nDependencias opcionales cargadas al arrancar: {', '.join(loaded) or 'ninguna'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    run_child() if args.child else run_parent(args)
@@ -0,0 +1,138 @@
+"""
+Throughput by worker count for the production runner (server.py).
+
+For each worker count, server.py is started on a scratch SQLite database
+and a free port. A client then keeps --concurrency requests in flight for
+--seconds against two routes:
+
+- GET /health: framework and middleware overhead only
+- GET /auth/me: token verification plus one user read
+
+The table gives requests/s and latency per route. Throughput should grow
+with workers up to about the number of cores and then flatten or fall.
+Past that point workers only compete for the CPU and for the SQLite
+writer. Pick the smallest count on the plateau. Run the client on another
+machine when possible: here it shares the CPUs it is measuring.
+
+Usage:
+    python benchmarks/workers.py --workers 1,2,4 --concurrency 32 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "Bench-password-1"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(client, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+        await asyncio.sleep(0.2)
+
+
+async def drive(client, path: str, headers: dict, concurrency: int, seconds: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + seconds
+
+    async def loop():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000, 2),
+        "errors": errors,
+    }
+
+
+async def measure(port: int, concurrency: int, seconds: float) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+        await wait_until_up(client)
+        user = {"username": "bench", "email": "bench@example.com", "password": PASSWORD}
+        await client.post("/auth/register", json=user)
+        token = (await client.post("/auth/login", json={"username": "bench", "password": PASSWORD})).json()
+        headers = {"Authorization": f"Bearer {token['access_token']}"}
+        return {
+            "health": await drive(client, "/health", {}, concurrency, seconds),
+            "me": await drive(client, "/auth/me", headers, concurrency, seconds),
+        }
+
+
+def run_workers(workers: int, concurrency: int, seconds: float) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{tmp}/bench.db",
+            JWT_KEYS_DIR=f"{tmp}/jwt_keys",
+            BCRYPT_ROUNDS="4",
+            RATE_LIMIT_PER_MINUTE="100000000",
+            LOOP_MONITOR_ENABLED="false",
+            DEBUG="false",
+            # The server runs in the scratch directory
+            PYTHONPATH=os.pathsep.join(
+                os.path.abspath(path) for path in os.environ.get("PYTHONPATH", "").split(os.pathsep) if path
+            ),
+        )
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(APP_DIR, "server.py"), "--workers", str(workers),
+             "--port", str(port), "--max-requests", "0", "--allow-per-worker-state"],
+            env=env, cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            return asyncio.run(measure(port, concurrency, seconds))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"CPUs: {os.cpu_count()}")
+    print(f"{'workers':>8} {'route':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for workers in (int(count) for count in args.workers.split(",")):
+        for route, result in run_workers(workers, args.concurrency, args.seconds).items():
+            print(f"{workers:>8} {route:>8} {result['requests_per_second']:>10} {result['p50_ms']:>10} "
+                  f"{result['p99_ms']:>10} {result['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
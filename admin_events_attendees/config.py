@@ -1,25 +1,169 @@
-from decouple import config
+from decouple import config, Csv
 
 # JWT Configuration
-JWT_SECRET_KEY = config("JWT_SECRET_KEY", default="your-super-secret-key-change-this-in-production")
-JWT_ALGORITHM = config("JWT_ALGORITHM", default="HS256")
+JWT_SECRET_KEY = config("JWT_SECRET_KEY", default="your-super-secret-key-change-this-in-production")  # HS256 only
+# ES256 signs with the key ring in JWT_KEYS_DIR (published at /.well-known/jwks.json);
+# HS256 keeps the shared secret
+JWT_ALGORITHM = config("JWT_ALGORITHM", default="ES256")
+JWT_KEYS_DIR = config("JWT_KEYS_DIR", default="./jwt_keys")
+JWT_ACTIVE_KID = config("JWT_ACTIVE_KID", default="")  # empty: newest key published for JWKS_MAX_AGE
+JWT_JWKS_MAX_AGE_SECONDS = config("JWT_JWKS_MAX_AGE_SECONDS", default=300, cast=int)
+JWT_VERIFIED_CACHE_SIZE = config("JWT_VERIFIED_CACHE_SIZE", default=10000, cast=int)
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = config("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", default=30, cast=int)
 JWT_REFRESH_TOKEN_EXPIRE_DAYS = config("JWT_REFRESH_TOKEN_EXPIRE_DAYS", default=7, cast=int)
+# Rotated and revoked refresh tokens are kept this long to detect reuse,
+# then swept in batches with the expired ones
+REFRESH_TOKEN_REUSE_WINDOW_SECONDS = config("REFRESH_TOKEN_REUSE_WINDOW_SECONDS", default=86400, cast=int)
+REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS = config("REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS", default=300, cast=int)
+REFRESH_TOKEN_SWEEP_BATCH_SIZE = config("REFRESH_TOKEN_SWEEP_BATCH_SIZE", default=1000, cast=int)
+# How often each worker picks up access-token revocations made by the others
+REVOCATION_SYNC_INTERVAL_MS = config("REVOCATION_SYNC_INTERVAL_MS", default=1000, cast=int)
 
 # Database Configuration
 DATABASE_URL = config("DATABASE_URL", default="sqlite:///./attendees.db")
+# Connections each worker may open is DB_MAX_CONNECTIONS / WEB_CONCURRENCY
+# unless DB_POOL_SIZE is set explicitly. server.py starts WEB_CONCURRENCY
+# workers, one per CPU when it is 0; main.py always runs one
+WEB_CONCURRENCY = config("WEB_CONCURRENCY", default=0, cast=int)
+DB_MAX_CONNECTIONS = config("DB_MAX_CONNECTIONS", default=20, cast=int)
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=0, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=0, cast=int)
+DB_POOL_TIMEOUT_SECONDS = config("DB_POOL_TIMEOUT_SECONDS", default=30, cast=float)
+
+# PostgreSQL connections
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", default=True, cast=bool)
+DB_POOL_RECYCLE_SECONDS = config("DB_POOL_RECYCLE_SECONDS", default=1800, cast=int)
+DB_STATEMENT_TIMEOUT_MS = config("DB_STATEMENT_TIMEOUT_MS", default=30000, cast=int)
+DB_APPLICATION_NAME = config("DB_APPLICATION_NAME", default="admin-events-attendees")
+
+# Read replicas: reads are spread over healthy replicas; a client that just
+# wrote reads from the primary for READ_YOUR_WRITES_SECONDS
+DB_REPLICA_URLS = config("DB_REPLICA_URLS", default="", cast=Csv())
+REPLICA_HEALTH_INTERVAL_SECONDS = config("REPLICA_HEALTH_INTERVAL_SECONDS", default=10, cast=float)
+READ_YOUR_WRITES_SECONDS = config("READ_YOUR_WRITES_SECONDS", default=5, cast=float)
+
+# Schema: "service" keeps attendees in this service's own `attendees` table;
+# "django" maps onto the monolith's attendees_attendee (reflected once and
+# cached in DJANGO_SCHEMA_CACHE, see django_schema.py)
+SCHEMA_MODE = config("SCHEMA_MODE", default="service")
+DJANGO_SCHEMA_CACHE = config("DJANGO_SCHEMA_CACHE", default="./django_schema.cache")
+
+# Attendee sharding: attendees are spread over these databases by a hash of
+# their document; empty keeps them in DATABASE_URL. Change with scripts/reshard.py
+SHARD_URLS = config("SHARD_URLS", default="", cast=Csv())
+
+# SQLite log shipping: "primary" records committed changes for followers,
+# "follower" replays them read-only and redirects writes to the primary
+REPLICATION_ROLE = config("REPLICATION_ROLE", default="standalone")
+REPLICATION_PRIMARY_URL = config("REPLICATION_PRIMARY_URL", default="")
+REPLICATION_TOKEN = config("REPLICATION_TOKEN", default="")
+REPLICATION_POLL_INTERVAL_MS = config("REPLICATION_POLL_INTERVAL_MS", default=500, cast=int)
+REPLICATION_BATCH_SIZE = config("REPLICATION_BATCH_SIZE", default=1000, cast=int)
+REPLICATION_LOG_RETENTION_SECONDS = config("REPLICATION_LOG_RETENTION_SECONDS", default=86400, cast=int)
+
+# Transactional outbox: attendee changes are delivered at least once, in
+# commit order per database, to the in-process bus and these subscribers
+OUTBOX_WEBHOOK_URLS = config("OUTBOX_WEBHOOK_URLS", default="", cast=Csv())
+OUTBOX_WEBHOOK_SECRET = config("OUTBOX_WEBHOOK_SECRET", default="")
+OUTBOX_REDIS_URL = config("OUTBOX_REDIS_URL", default="")  # "memory://" = in-process stand-in
+OUTBOX_REDIS_STREAM = config("OUTBOX_REDIS_STREAM", default="attendee-events")
+OUTBOX_REDIS_MAXLEN = config("OUTBOX_REDIS_MAXLEN", default=100000, cast=int)
+OUTBOX_BATCH_SIZE = config("OUTBOX_BATCH_SIZE", default=100, cast=int)
+OUTBOX_POLL_INTERVAL_MS = config("OUTBOX_POLL_INTERVAL_MS", default=1000, cast=int)
+OUTBOX_LEASE_SECONDS = config("OUTBOX_LEASE_SECONDS", default=30, cast=float)
+OUTBOX_MAX_BACKOFF_SECONDS = config("OUTBOX_MAX_BACKOFF_SECONDS", default=60, cast=float)
+OUTBOX_RETENTION_SECONDS = config("OUTBOX_RETENTION_SECONDS", default=86400, cast=int)
+# A missing id may be a transaction that has not committed yet (PostgreSQL
+# commits sequence ids out of order); the relay waits this long for it
+OUTBOX_GAP_GRACE_SECONDS = config("OUTBOX_GAP_GRACE_SECONDS", default=60, cast=float)
+
+# SQLite connection profile
+SQLITE_BUSY_TIMEOUT_MS = config("SQLITE_BUSY_TIMEOUT_MS", default=5000, cast=int)
+SQLITE_CACHE_SIZE_KB = config("SQLITE_CACHE_SIZE_KB", default=65536, cast=int)
+SQLITE_MMAP_SIZE = config("SQLITE_MMAP_SIZE", default=268435456, cast=int)
+SQLITE_OPTIMIZE_INTERVAL_SECONDS = config("SQLITE_OPTIMIZE_INTERVAL_SECONDS", default=3600, cast=float)
+
+# Single-writer lane (SQLite only): writes are queued to one connection and
+# pending units are committed together
+WRITE_LANE_ENABLED = config("WRITE_LANE_ENABLED", default=True, cast=bool)
+WRITE_LANE_MAX_BATCH = config("WRITE_LANE_MAX_BATCH", default=64, cast=int)
 
 # Security
 BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", default=12, cast=int)
+# A login only rewrites users.last_login when the stored value is older than
+# this; 0 records every login
+LAST_LOGIN_WRITE_INTERVAL_SECONDS = config("LAST_LOGIN_WRITE_INTERVAL_SECONDS", default=0, cast=int)
+# Failed logins are counted outside the database; the users row is only
+# written when an account gets locked
+LOGIN_MAX_ATTEMPTS = config("LOGIN_MAX_ATTEMPTS", default=5, cast=int)
+LOGIN_LOCKOUT_MINUTES = config("LOGIN_LOCKOUT_MINUTES", default=15, cast=int)
+LOGIN_ATTEMPTS_REDIS_URL = config("LOGIN_ATTEMPTS_REDIS_URL", default="memory://")  # shared Redis for several workers
+LOGIN_ATTEMPTS_TTL_SECONDS = config("LOGIN_ATTEMPTS_TTL_SECONDS", default=86400, cast=int)
+# API keys for service callers: stored as HMAC-SHA256 digests under this
+# secret (changing it invalidates every key) and cached per worker
+API_KEY_SECRET = config("API_KEY_SECRET", default="change-this-api-key-secret")
+API_KEY_CACHE_SECONDS = config("API_KEY_CACHE_SECONDS", default=60, cast=int)
+API_KEY_CACHE_SIZE = config("API_KEY_CACHE_SIZE", default=10000, cast=int)
 
 # Application
 DEBUG = config("DEBUG", default=True, cast=bool)
 HOST = config("HOST", default="0.0.0.0")
 PORT = config("PORT", default=3000, cast=int)
 
+# Production runner (server.py): a worker exits after serving about
+# SERVER_MAX_REQUESTS requests (0 = never; the jitter keeps workers from
+# recycling together) and SIGTERM gives in-flight requests this long to finish
+SERVER_MAX_REQUESTS = config("SERVER_MAX_REQUESTS", default=10000, cast=int)
+SERVER_MAX_REQUESTS_JITTER = config("SERVER_MAX_REQUESTS_JITTER", default=1000, cast=int)
+SERVER_GRACEFUL_TIMEOUT_SECONDS = config("SERVER_GRACEFUL_TIMEOUT_SECONDS", default=30, cast=int)
+
+# Admission control: concurrent requests each worker admits per route class
+# (the limit adapts below this ceiling from observed latency). Others wait in
+# a bounded queue and are shed with 503 + Retry-After once the queue is full,
+# the oldest waiter has waited past the target delay, or a waiter hits the
+# queue timeout. Health checks and token refresh are never shed
+ADMISSION_ENABLED = config("ADMISSION_ENABLED", default=True, cast=bool)
+ADMISSION_AUTH_CONCURRENCY = config("ADMISSION_AUTH_CONCURRENCY", default=8, cast=int)
+ADMISSION_READ_CONCURRENCY = config("ADMISSION_READ_CONCURRENCY", default=64, cast=int)
+ADMISSION_WRITE_CONCURRENCY = config("ADMISSION_WRITE_CONCURRENCY", default=32, cast=int)
+ADMISSION_BULK_CONCURRENCY = config("ADMISSION_BULK_CONCURRENCY", default=2, cast=int)
+ADMISSION_QUEUE_SIZE = config("ADMISSION_QUEUE_SIZE", default=64, cast=int)
+ADMISSION_QUEUE_TIMEOUT_MS = config("ADMISSION_QUEUE_TIMEOUT_MS", default=2000, cast=int)
+ADMISSION_TARGET_DELAY_MS = config("ADMISSION_TARGET_DELAY_MS", default=100, cast=int)
+ADMISSION_LATENCY_TOLERANCE = config("ADMISSION_LATENCY_TOLERANCE", default=2.0, cast=float)
+
+# Bulk load and export
+BULK_LOAD_MAX_ROWS = config("BULK_LOAD_MAX_ROWS", default=10000, cast=int)
+EXPORT_BATCH_SIZE = config("EXPORT_BATCH_SIZE", default=1000, cast=int)
+
+# Point-in-time copies for long-running reads (SQLite)
+SNAPSHOT_DIR = config("SNAPSHOT_DIR", default="./snapshots")
+SNAPSHOT_MAX_AGE_SECONDS = config("SNAPSHOT_MAX_AGE_SECONDS", default=60, cast=int)
+
 # Rate Limiting
 RATE_LIMIT_PER_MINUTE = config("RATE_LIMIT_PER_MINUTE", default=100, cast=int)
 
 # MFA Configuration
 MFA_ENABLED = config("MFA_ENABLED", default=False, cast=bool)
 MFA_ISSUER = config("MFA_ISSUER", default="AdminEvents")
+
+# Metrics
+# Directory shared by all workers so /metrics can aggregate across processes;
+# emptied at startup, so never share it between instances
+PROMETHEUS_MULTIPROC_DIR = config("PROMETHEUS_MULTIPROC_DIR", default="")
+
+# SQL instrumentation
+SLOW_QUERY_THRESHOLD_MS = config("SLOW_QUERY_THRESHOLD_MS", default=100, cast=float)
+N_PLUS_ONE_THRESHOLD = config("N_PLUS_ONE_THRESHOLD", default=5, cast=int)
+
+# Request profiling
+PROFILE_DIR = config("PROFILE_DIR", default="./profiles")
+PROFILE_MAX_FILES = config("PROFILE_MAX_FILES", default=50, cast=int)
+PROFILE_SAMPLE_RATE = config("PROFILE_SAMPLE_RATE", default=0.0, cast=float)
+PROFILE_SAMPLE_MODE = config("PROFILE_SAMPLE_MODE", default="sample")
+PROFILE_SAMPLE_INTERVAL_MS = config("PROFILE_SAMPLE_INTERVAL_MS", default=5, cast=float)
+
+# Event loop lag monitor
+LOOP_MONITOR_ENABLED = config("LOOP_MONITOR_ENABLED", default=True, cast=bool)
+LOOP_LAG_INTERVAL_MS = config("LOOP_LAG_INTERVAL_MS", default=100, cast=float)
+LOOP_LAG_THRESHOLD_MS = config("LOOP_LAG_THRESHOLD_MS", default=100, cast=float)
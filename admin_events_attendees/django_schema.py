@@ -0,0 +1,210 @@
+"""
+Cached reflection of the Django monolith's tables (SCHEMA_MODE=django).
+
+In Django mode the Attendee model maps onto the monolith's
+attendees_attendee table. That table is never created or altered here;
+Django's migrations own it. Reflecting attendees_attendee,
+attendees_purchase and attendees_ticket costs several catalog queries per
+table on every cold start. Instead the reflected MetaData is stored in
+DJANGO_SCHEMA_CACHE together with a fingerprint of the tables' definitions.
+A start only reads the catalog rows behind the fingerprint (one query) and
+rebuilds the tables from the cached column definitions. The cache is plain
+JSON (names, SQLAlchemy type classes, nullability, keys), so nothing in it
+is executed; a type that is not a SQLAlchemy type discards the cache.
+
+The cache also records the schema this service was last validated against.
+If the live fingerprint differs, a Django migration changed a shared table
+and the service refuses to start. Review the migration, then rebuild the
+cache with scripts/refresh_django_schema.py. A cache written by another
+format or SQLAlchemy version is rebuilt without complaint, as long as the
+fingerprint still matches.
+"""
+import hashlib
+import importlib
+import inspect
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import sqlalchemy
+from sqlalchemy import Column, ForeignKey, MetaData, Table, text
+from sqlalchemy.types import TypeEngine
+
+from config import DJANGO_SCHEMA_CACHE
+
+CACHE_FORMAT = 2
+DJANGO_TABLES = ("attendees_attendee", "attendees_purchase", "attendees_ticket")
+
+# Columns the attendee routes read and write
+REQUIRED_ATTENDEE_COLUMNS = (
+    "attendee_id", "name", "email", "document_type", "document_number", "phone_number",
+    "address", "date_of_birth", "gender", "created_at", "updated_at",
+)
+
+
+class SchemaDriftError(RuntimeError):
+    """The monolith's tables no longer match what this service was validated against"""
+
+
+def table_fingerprints(conn) -> Dict[str, str]:
+    """Hash of each Django table's definition, read from the catalog in one query"""
+    if conn.dialect.name == "sqlite":
+        # CREATE TABLE / CREATE INDEX statements as Django's migrations left them
+        rows = conn.execute(text(
+            "SELECT tbl_name, type, name, sql FROM sqlite_master "
+            "WHERE tbl_name IN (SELECT value FROM json_each(:tables)) ORDER BY tbl_name, type, name"
+        ), {"tables": json.dumps(DJANGO_TABLES)}).all()
+    else:
+        rows = conn.execute(text(
+            "SELECT table_name, column_name, data_type, is_nullable, column_default "
+            "FROM information_schema.columns WHERE table_schema = current_schema() "
+            "AND table_name IN :tables ORDER BY table_name, ordinal_position"
+        ).bindparams(sqlalchemy.bindparam("tables", expanding=True)), {"tables": list(DJANGO_TABLES)}).all()
+    definitions: Dict[str, list] = {}
+    for row in rows:
+        definitions.setdefault(row[0], []).append([str(value) for value in row[1:]])
+    return {
+        table: hashlib.sha256(json.dumps(definition).encode()).hexdigest()
+        for table, definition in sorted(definitions.items())
+    }
+
+
+# Type constructor arguments kept in the cache
+TYPE_ARGUMENTS = ("length", "precision", "scale", "timezone", "asdecimal")
+
+
+def type_arguments(kind: type) -> Tuple[str, ...]:
+    accepted = inspect.signature(kind.__init__).parameters
+    return tuple(name for name in TYPE_ARGUMENTS if name in accepted)
+
+
+def table_spec(table: Table) -> list:
+    """JSON-ready column definitions of a table"""
+    columns = []
+    for column in table.columns:
+        kind = type(column.type)
+        columns.append({
+            "name": column.name,
+            "type": f"{kind.__module__}:{kind.__qualname__}",
+            "arguments": {name: getattr(column.type, name, None) for name in type_arguments(kind)},
+            "nullable": column.nullable,
+            "primary_key": column.primary_key,
+            "foreign_keys": sorted(key.target_fullname for key in column.foreign_keys),
+        })
+    return columns
+
+
+def column_type(spec: str, arguments: dict) -> TypeEngine:
+    """Instance of a SQLAlchemy type class named "module:class"; anything else is a ValueError"""
+    module_name, _, class_name = spec.partition(":")
+    if module_name != "sqlalchemy" and not module_name.startswith("sqlalchemy."):
+        raise ValueError(f"{spec} is not a SQLAlchemy type")
+    try:
+        kind = getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError):
+        raise ValueError(f"Unknown type {spec}") from None
+    if not (isinstance(kind, type) and issubclass(kind, TypeEngine)):
+        raise ValueError(f"{spec} is not a SQLAlchemy type")
+    allowed = type_arguments(kind)
+    return kind(**{name: value for name, value in arguments.items() if name in allowed})
+
+
+def metadata_from_spec(tables: Dict[str, list]) -> MetaData:
+    metadata = MetaData()
+    for name, columns in tables.items():
+        Table(name, metadata, *(
+            Column(
+                column["name"],
+                column_type(column["type"], column["arguments"]),
+                *(ForeignKey(target) for target in column["foreign_keys"]),
+                nullable=column["nullable"],
+                primary_key=column["primary_key"],
+            )
+            for column in columns
+        ))
+    return metadata
+
+
+def read_cache(path: str) -> Tuple[Optional[dict], Optional[bytes]]:
+    """(header, JSON table definitions) of the cache file, or (None, None)"""
+    try:
+        with open(path, "rb") as f:
+            header_line, payload = f.read().split(b"\n", 1)
+        return json.loads(header_line), payload
+    except (OSError, ValueError):
+        return None, None
+
+
+def write_cache(path: str, fingerprints: Dict[str, str], metadata: MetaData):
+    header = {"format": CACHE_FORMAT, "sqlalchemy": sqlalchemy.__version__, "tables": fingerprints}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        tables = {name: table_spec(table) for name, table in metadata.tables.items()}
+        f.write(json.dumps(header).encode() + b"\n" + json.dumps(tables).encode())
+    os.replace(tmp_path, path)
+
+
+def validate(metadata: MetaData):
+    missing_tables = [name for name in DJANGO_TABLES if name not in metadata.tables]
+    if missing_tables:
+        raise SchemaDriftError(f"Django tables not found: {', '.join(missing_tables)}")
+    attendee = metadata.tables["attendees_attendee"]
+    missing_columns = [name for name in REQUIRED_ATTENDEE_COLUMNS if name not in attendee.c]
+    if missing_columns:
+        raise SchemaDriftError(f"attendees_attendee lacks columns: {', '.join(missing_columns)}")
+
+
+def load_django_metadata(engine, cache_path: str = DJANGO_SCHEMA_CACHE) -> MetaData:
+    """Metadata of the Django tables, from the cache unless it is missing or outdated"""
+    with engine.connect() as conn:
+        fingerprints = table_fingerprints(conn)
+        header, payload = read_cache(cache_path)
+        if header is not None and header["tables"] != fingerprints:
+            changed = sorted(
+                name for name in set(header["tables"]) | set(fingerprints)
+                if header["tables"].get(name) != fingerprints.get(name)
+            )
+            raise SchemaDriftError(
+                f"Django schema changed since {cache_path} was written ({', '.join(changed)}); "
+                f"review the migration and run scripts/refresh_django_schema.py"
+            )
+        metadata = None
+        if header is not None and (header["format"], header["sqlalchemy"]) == (CACHE_FORMAT, sqlalchemy.__version__):
+            try:
+                metadata = metadata_from_spec(json.loads(payload))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Ignoring {cache_path}: {e}")
+        if metadata is None:
+            metadata = MetaData()
+            metadata.reflect(bind=conn, only=[name for name in DJANGO_TABLES if name in fingerprints])
+            validate(metadata)
+            write_cache(cache_path, fingerprints, metadata)
+    validate(metadata)
+    return metadata
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# Django fills these in Python (default=, auto_now_add, auto_now), so the
+# columns have no server default; inserts and updates from here must too
+APP_SIDE_DEFAULTS = {
+    "document_type": {"default": "DNI"},
+    "created_at": {"default": utcnow},
+    "updated_at": {"default": utcnow, "onupdate": utcnow},
+}
+
+
+def attendee_table(metadata: MetaData) -> Table:
+    """attendees_attendee with the defaults Django applies in Python"""
+    table = metadata.tables["attendees_attendee"]
+    return Table(
+        table.name, metadata,
+        *(
+            Column(name, table.c[name].type, nullable=table.c[name].nullable, **defaults)
+            for name, defaults in APP_SIDE_DEFAULTS.items()
+        ),
+        extend_existing=True,
+    )
@@ -0,0 +1,124 @@
+"""
+Redis client selection and an in-process stand-in.
+
+Settings such as OUTBOX_REDIS_URL and LOGIN_ATTEMPTS_REDIS_URL name a Redis
+server shared by all workers, or "memory://" for LocalRedis. LocalRedis
+implements the handful of commands this service uses (strings with
+expiry, INCR, streams, pipelines) with redis-py's asyncio signatures, so
+the code above it is the same with or without a server. Its data lives in
+one process, so it only suits a single worker, development and tests.
+"""
+import time
+from typing import Any, Dict, Optional, Tuple
+
+MEMORY_URL = "memory://"
+# Expired keys are dropped when read, and all at once every this many SETs
+PURGE_EVERY_WRITES = 1024
+
+
+def redis_client(url: str):
+    """Client for a Redis URL ("memory://" = LocalRedis); redis is only imported when needed"""
+    if url == MEMORY_URL:
+        return LocalRedis()
+    try:
+        import redis.asyncio as redis
+    except ImportError:
+        raise RuntimeError(f"{url} requires the redis package (pip install redis)") from None
+    return redis.from_url(url)
+
+
+class LocalPipeline:
+    """Queues commands and runs them in order on execute(), like redis-py's pipeline"""
+
+    def __init__(self, client: "LocalRedis"):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name: str):
+        command = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self) -> list:
+        commands, self.commands = self.commands, []
+        return [await command(*args, **kwargs) for command, args, kwargs in commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands = []
+
+
+class LocalRedis:
+    """In-process stand-in for the Redis commands this service uses"""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self.streams: Dict[str, list] = {}
+        self._sequence = 0
+        self._writes = 0
+
+    def _live(self, key: str):
+        value, expires_at = self._values.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+    def _purge(self):
+        """Drop expired keys that were never read again"""
+        now = time.monotonic()
+        self._values = {
+            key: entry for key, entry in self._values.items() if entry[1] is None or entry[1] > now
+        }
+
+    async def get(self, key: str):
+        return self._live(key)
+
+    async def set(self, key: str, value, ex: Optional[float] = None, nx: bool = False):
+        if nx and self._live(key) is not None:
+            return None
+        self._writes += 1
+        if self._writes % PURGE_EVERY_WRITES == 0:
+            self._purge()
+        self._values[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        value = int(self._live(key) or 0) + amount
+        expires_at = self._values.get(key, (None, None))[1]
+        self._values[key] = (value, expires_at)
+        return value
+
+    async def expire(self, key: str, seconds: float) -> bool:
+        if self._live(key) is None:
+            return False
+        self._values[key] = (self._values[key][0], time.monotonic() + seconds)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._values.pop(key, None) is not None for key in keys)
+
+    async def flushdb(self):
+        self._values.clear()
+        self.streams.clear()
+
+    async def xadd(self, name: str, fields: dict, maxlen: Optional[int] = None, approximate: bool = True) -> str:
+        self._sequence += 1
+        entry_id = f"{int(time.time() * 1000)}-{self._sequence}"
+        entries = self.streams.setdefault(name, [])
+        entries.append((entry_id, dict(fields)))
+        if maxlen is not None and len(entries) > maxlen:
+            del entries[:len(entries) - maxlen]
+        return entry_id
+
+    async def xrange(self, name: str, count: Optional[int] = None) -> list:
+        entries = self.streams.get(name, [])
+        return entries[:count] if count else list(entries)
+
+    def pipeline(self, transaction: bool = True) -> LocalPipeline:
+        return LocalPipeline(self)
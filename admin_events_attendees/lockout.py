@@ -0,0 +1,80 @@
+"""
+Failed-login counting and account lockout.
+
+Brute-force state used to live on the users row, so every bad password was
+a database write and a password spray turned into write traffic on the
+SQLite file. The counter and the lock window are now kept in a Redis-like
+store: LocalRedis in-process by default, or a Redis server shared by all
+workers (LOGIN_ATTEMPTS_REDIS_URL). Only a failure that locks the account
+is written to users.locked_until, which keeps the lock across restarts and
+makes it visible to workers that do not share the store.
+
+The rules are the ones the users row implemented: every failure past
+LOGIN_MAX_ATTEMPTS - 1 locks the account for LOGIN_LOCKOUT_MINUTES, and a
+successful login clears the count. Failures while locked are not counted,
+so an attacker cannot keep extending the lock. Counters expire
+LOGIN_ATTEMPTS_TTL_SECONDS after the last failure so an idle store does
+not grow with every user who once mistyped a password.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from config import (
+    LOGIN_ATTEMPTS_REDIS_URL, LOGIN_ATTEMPTS_TTL_SECONDS, LOGIN_LOCKOUT_MINUTES, LOGIN_MAX_ATTEMPTS
+)
+from local_redis import redis_client
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """SQLite returns naive datetimes; they are stored as UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class LoginAttemptTracker:
+    """Failed-attempt counters and lock windows keyed by user id"""
+
+    def __init__(
+        self,
+        client,
+        max_attempts: int = LOGIN_MAX_ATTEMPTS,
+        lockout: timedelta = timedelta(minutes=LOGIN_LOCKOUT_MINUTES),
+        attempts_ttl: int = LOGIN_ATTEMPTS_TTL_SECONDS,
+    ):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.lockout = lockout
+        self.attempts_ttl = attempts_ttl
+
+    @staticmethod
+    def _key(kind: str, user_id: int) -> str:
+        return f"login:{kind}:{user_id}"
+
+    async def locked_until(self, user_id: int) -> Optional[datetime]:
+        """End of the user's lock window, or None"""
+        value = await self.client.get(self._key("locked", user_id))
+        if value is None or float(value) <= time.time():
+            return None
+        return datetime.fromtimestamp(float(value), timezone.utc)
+
+    async def record_failure(self, user_id: int) -> Optional[datetime]:
+        """Count a failed attempt; returns the lock's end when this failure locks the account"""
+        key = self._key("attempts", user_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            attempts, _ = await pipe.incr(key).expire(key, self.attempts_ttl).execute()
+        if int(attempts) < self.max_attempts:
+            return None
+        locked_until = datetime.now(timezone.utc) + self.lockout
+        await self.client.set(
+            self._key("locked", user_id), locked_until.timestamp(), ex=int(self.lockout.total_seconds())
+        )
+        return locked_until
+
+    async def clear(self, user_id: int):
+        """Forget the user's failures after a successful login"""
+        await self.client.delete(self._key("attempts", user_id), self._key("locked", user_id))
+
+
+login_attempts = LoginAttemptTracker(redis_client(LOGIN_ATTEMPTS_REDIS_URL))
@@ -0,0 +1,111 @@
+"""
+Event-loop lag monitor.
+
+A heartbeat task sleeps for LOOP_LAG_INTERVAL_MS and measures how late it
+wakes up; the delay is the time the loop spent running something else
+without yielding. A watchdog thread watches the heartbeat and, as soon as
+it is overdue by LOOP_LAG_THRESHOLD_MS, grabs the loop thread's current
+stack, i.e. the code that is blocking. Each stall is exported as a metric
+(labelled by the innermost frame in this service's code) and logged with
+the captured stack.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+from config import LOOP_LAG_INTERVAL_MS, LOOP_LAG_THRESHOLD_MS
+from metrics import EVENT_LOOP_LAG, EVENT_LOOP_BLOCKED
+
+logger = logging.getLogger("admin_events.loop")
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def blocking_location(frame) -> str:
+    """Innermost frame that belongs to this service (not a library)"""
+    for summary in reversed(traceback.extract_stack(frame)):
+        filename = os.path.abspath(summary.filename)
+        if filename.startswith(APP_DIR) and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, APP_DIR)}:{summary.name}"
+    return "unknown"
+
+
+class LoopLagMonitor:
+    """Heartbeat on the event loop plus a watchdog thread that captures blocking stacks"""
+
+    def __init__(self, interval_ms: float = LOOP_LAG_INTERVAL_MS, threshold_ms: float = LOOP_LAG_THRESHOLD_MS):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.stalls = deque(maxlen=20)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._next_beat = 0.0
+        self._captured: Optional[tuple] = None
+
+    def start(self):
+        """Start monitoring the running event loop (call from the loop thread)"""
+        self._loop_thread_id = threading.get_ident()
+        self._next_beat = time.perf_counter() + self.interval
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - self._next_beat)
+            self._next_beat = now + self.interval
+            EVENT_LOOP_LAG.observe(lag)
+            captured, self._captured = self._captured, None
+            if lag >= self.threshold:
+                self._report(lag, captured)
+
+    def _watch(self):
+        # Poll often enough to catch the blocker while it is still on the stack
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(poll):
+            overdue = time.perf_counter() - self._next_beat
+            if overdue >= self.threshold and self._captured is None:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._captured = (
+                        blocking_location(frame),
+                        "".join(traceback.format_stack(frame))
+                    )
+
+    def _report(self, lag: float, captured: Optional[tuple]):
+        location, stack = captured or ("unknown", "")
+        EVENT_LOOP_BLOCKED.labels(location).inc()
+        self.stalls.append({
+            "lag_ms": round(lag * 1000, 1),
+            "location": location,
+            "stack": stack,
+            "timestamp": time.time(),
+        })
+        logger.warning(
+            "Event loop blocked for %.0f ms in %s\n%s", lag * 1000, location, stack
+        )
+
+
+loop_monitor = LoopLagMonitor()
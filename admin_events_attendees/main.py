@@ -1,30 +1,110 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
-import uvicorn
+import asyncio
 
 # Import modules
-from database import create_tables
+from database import SCHEMA_VERSION, ensure_schema, engine, write_engine, is_sqlite, optimize_database, optimize_periodically
+from write_lane import write_lane
+from replicas import replica_set
+from snapshots import snapshot_service
+from outbox import outbox_relay
+from revocation import revocation_list
+from signing_keys import key_ring
+from admission import admission_controller
+from refresh_tokens import sweep_periodically as sweep_refresh_tokens_periodically
+import sharding
+import replication
 from auth_routes import router as auth_router
 from attendee_routes import router as attendee_router
+from replication_routes import router as replication_router
 from middleware import (
     SecurityHeadersMiddleware, 
     RateLimitMiddleware, 
-    RequestLoggingMiddleware
+    RequestLoggingMiddleware,
+    MetricsMiddleware,
+    ServerTimingMiddleware,
+    ProfilingMiddleware,
+    FollowerRedirectMiddleware,
+    AdmissionControlMiddleware
+)
+from metrics import CONTENT_TYPE_LATEST, render_metrics
+from timing import TimedRoute
+from loop_monitor import loop_monitor
+from config import (
+    DEBUG, HOST, PORT, LOOP_MONITOR_ENABLED, DATABASE_URL, SQLITE_OPTIMIZE_INTERVAL_SECONDS,
+    WRITE_LANE_ENABLED, REPLICATION_ROLE, JWT_JWKS_MAX_AGE_SECONDS
 )
-from config import DEBUG, HOST, PORT
 
 # Lifespan event handler
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting Admin Events Attendees API...")
-    create_tables()
-    print("Database tables created successfully")
+    follower = replication.follower
+    if follower is not None:
+        # server.py bootstraps once in the master, before forking the workers
+        if not follower.bootstrapped:
+            await follower.bootstrap()
+        replication.make_query_only(engine)
+        replication.make_query_only(write_engine)
+    if ensure_schema():
+        print(f"Database schema migrated to version {SCHEMA_VERSION}")
+    else:
+        print(f"Database schema is up to date (version {SCHEMA_VERSION})")
+    key_ring.load()
+    # Queued waiters are futures of this worker's event loop
+    admission_controller.reset()
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    if WRITE_LANE_ENABLED and is_sqlite(DATABASE_URL) and follower is None:
+        write_lane.start()
+    replica_set.start()
+    if snapshot_service.enabled:
+        snapshot_service.start()
+    await sharding.shard_set.start()
+    # Followers read revocations replicated from the primary
+    await revocation_list.start(prune=follower is None)
+    sweep_task = None
+    if follower is None:
+        # Writes happen on the primary; its relay delivers the outbox
+        await outbox_relay.start()
+        sweep_task = asyncio.create_task(sweep_refresh_tokens_periodically())
+    prune_task = None
+    if REPLICATION_ROLE == "primary":
+        replication.install_change_capture()
+        prune_task = asyncio.create_task(replication.prune_periodically())
+    if follower is not None:
+        follower.start()
+    optimize_task = None
+    if is_sqlite(DATABASE_URL) and SQLITE_OPTIMIZE_INTERVAL_SECONDS > 0:
+        optimize_task = asyncio.create_task(optimize_periodically(SQLITE_OPTIMIZE_INTERVAL_SECONDS))
     yield
     # Shutdown
     print("Shutting down Admin Events Attendees API...")
+    if follower is not None:
+        await follower.stop()
+    if prune_task is not None:
+        prune_task.cancel()
+    if sweep_task is not None:
+        sweep_task.cancel()
+    await outbox_relay.stop()
+    await revocation_list.stop()
+    await write_lane.stop()
+    await replica_set.stop()
+    await snapshot_service.close()
+    await sharding.shard_set.stop()
+    if optimize_task is not None:
+        optimize_task.cancel()
+        try:
+            await optimize_database()
+        except Exception as e:
+            print(f"PRAGMA optimize failed: {e}")
+    await engine.dispose()
+    await write_engine.dispose()
+    if LOOP_MONITOR_ENABLED:
+        await loop_monitor.stop()
 
 # Create FastAPI app
 app = FastAPI(
@@ -57,11 +137,16 @@ app = FastAPI(
     },
     lifespan=lifespan
 )
+app.router.route_class = TimedRoute
 
 # Add security middleware
+app.add_middleware(FollowerRedirectMiddleware)
+# Sheds before any handler runs; 503s still get the security headers, logging and metrics
+app.add_middleware(AdmissionControlMiddleware)
 app.add_middleware(SecurityHeadersMiddleware)
 app.add_middleware(RateLimitMiddleware)
 app.add_middleware(RequestLoggingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -72,9 +157,14 @@ app.add_middleware(
     allow_headers=["Authorization", "Content-Type", "X-Requested-With"],
 )
 
+# Outermost so profiles and the phase breakdown cover the whole middleware stack
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+
 # Include routers
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 app.include_router(attendee_router, prefix="/attendees", tags=["Attendees"])
+app.include_router(replication_router, prefix="/replication", tags=["Replication"])
 
 # Root endpoint
 @app.get("/", tags=["Root"])
@@ -96,6 +186,7 @@ async def root():
             "docs": "/docs",
             "redoc": "/redoc",
             "health": "/health",
+            "metrics": "/metrics",
             "auth": "/auth",
             "attendees": "/attendees"
         }
@@ -112,6 +203,20 @@ async def health_check():
         "version": "1.0.0"
     }
 
+# Prometheus metrics endpoint
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+async def metrics():
+    """Expose service metrics in Prometheus text format"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/.well-known/jwks.json", tags=["Health"], include_in_schema=False)
+async def jwks():
+    """Public keys that verify access tokens (RFC 7517), for services validating them offline"""
+    return Response(
+        content=key_ring.jwks, media_type="application/json",
+        headers={"Cache-Control": f"public, max-age={JWT_JWKS_MAX_AGE_SECONDS}"}
+    )
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -138,6 +243,7 @@ async def not_found_handler(request: Request, exc: HTTPException):
     )
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(
         "main:app",
         host=HOST,
@@ -0,0 +1,252 @@
+"""
+Prometheus metrics for the attendees microservice.
+
+All metric objects live at module level so recording a sample is a single
+method call on an already-resolved child. When PROMETHEUS_MULTIPROC_DIR is
+set every worker writes its samples to its own mmap'd file in that directory
+and /metrics merges them, so counters and histograms stay correct behind
+multiple uvicorn/gunicorn workers.
+
+The first process to import this module (server.py's master before it
+forks, or the only process) empties the directory, so samples from earlier
+runs and from killed workers are not merged into the new run's. Every
+instance needs a directory of its own.
+"""
+import os
+from config import PROMETHEUS_MULTIPROC_DIR
+
+# Set by the process that cleared the directory; its workers inherit it
+MULTIPROC_OWNER_ENV = "PROMETHEUS_MULTIPROC_OWNER"
+
+
+def clear_multiprocess_dir(directory: str):
+    """Delete the sample files of earlier processes"""
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+# prometheus_client decides between in-process and multiprocess value storage
+# at import time, so the env var must be in place before the import below.
+if PROMETHEUS_MULTIPROC_DIR and MULTIPROC_OWNER_ENV not in os.environ:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    clear_multiprocess_dir(PROMETHEUS_MULTIPROC_DIR)
+    os.environ[MULTIPROC_OWNER_ENV] = str(os.getpid())
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = PROMETHEUS_MULTIPROC_DIR
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BCRYPT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+
+# HTTP
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status code",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being processed",
+    multiprocess_mode="livesum",
+)
+REQUEST_PHASE_DURATION = Histogram(
+    "http_request_phase_seconds",
+    "Time attributed to each request phase (middleware, token, user, db, audit, serialize, send, ...)",
+    ["route", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# Event loop
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between when the loop heartbeat was due and when it ran",
+    buckets=LATENCY_BUCKETS,
+)
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "Heartbeats delayed past the threshold, by innermost blocking frame in service code",
+    ["location"],
+)
+
+# Database
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time by statement type",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "Number of SQL statements issued while serving one request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Total SQL execution time spent while serving one request",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# Security
+BCRYPT_DURATION = Histogram(
+    "bcrypt_duration_seconds",
+    "Time spent hashing or verifying passwords with bcrypt",
+    ["operation"],
+    buckets=BCRYPT_BUCKETS,
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total",
+    "Requests rejected by the rate limiter",
+)
+
+# Admission control
+ADMISSION_LIMIT = Gauge(
+    "admission_concurrency_limit",
+    "Current adaptive concurrency limit by route class",
+    ["route_class"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Requests waiting for admission by route class",
+    ["route_class"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds",
+    "Time admitted requests spent waiting in the admission queue",
+    ["route_class"],
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total",
+    "Requests shed with 503 by route class and reason (queue_full, queue_delay, queue_timeout)",
+    ["route_class", "reason"],
+)
+
+# Audit
+AUDIT_QUEUE_DEPTH = Gauge(
+    "audit_queue_depth",
+    "Audit log entries accepted but not yet committed",
+    multiprocess_mode="livesum",
+)
+
+# Read routing
+DB_READS_ROUTED = Counter(
+    "db_reads_routed_total",
+    "Read sessions by target (replica, primary, or primary because of read-your-writes)",
+    ["target"],
+)
+DB_REPLICA_HEALTHY = Gauge(
+    "db_replica_healthy",
+    "1 if the replica passed its last health check",
+    ["replica"],
+    multiprocess_mode="min",
+)
+
+# Log shipping (followers)
+REPLICATION_LAG_SECONDS = Gauge(
+    "replication_lag_seconds",
+    "Seconds since this follower was last caught up with the primary",
+    multiprocess_mode="max",
+)
+REPLICATION_LAG_CHANGES = Gauge(
+    "replication_lag_changes",
+    "Changes committed on the primary but not yet applied here",
+    multiprocess_mode="max",
+)
+
+# Write lane
+WRITE_LANE_DEPTH = Gauge(
+    "write_lane_queue_depth",
+    "Write units waiting for the single writer",
+    multiprocess_mode="livesum",
+)
+WRITE_LANE_BATCH_SIZE = Histogram(
+    "write_lane_batch_size",
+    "Write units committed together in one transaction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+WRITE_LANE_COMMIT_DURATION = Histogram(
+    "write_lane_commit_duration_seconds",
+    "Time to run and commit one batch of write units",
+    buckets=LATENCY_BUCKETS,
+)
+
+# Snapshots for long-running reads
+SNAPSHOT_REQUESTS = Counter(
+    "db_snapshot_requests_total",
+    "Snapshot requests by result (taken = new backup, reused = within the freshness bound)",
+    ["result"],
+)
+SNAPSHOT_BACKUP_DURATION = Histogram(
+    "db_snapshot_backup_duration_seconds",
+    "Time to copy the database with the online backup API",
+    buckets=LATENCY_BUCKETS,
+)
+
+# Transactional outbox
+OUTBOX_EVENTS_DELIVERED = Counter(
+    "outbox_events_delivered_total",
+    "Attendee change events accepted by each outbox subscriber",
+    ["subscriber"],
+)
+OUTBOX_DELIVERY_FAILURES = Counter(
+    "outbox_delivery_failures_total",
+    "Outbox batches a subscriber failed to accept (they are redelivered)",
+    ["subscriber"],
+)
+OUTBOX_DELIVERY_LAG = Histogram(
+    "outbox_delivery_lag_seconds",
+    "Time from the commit of a change to its delivery to a subscriber",
+    buckets=LATENCY_BUCKETS,
+)
+
+# Caches (hit ratio = hits / (hits + misses))
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache name and result",
+    ["cache", "result"],
+)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    """Count a cache hit or miss"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def statement_operation(statement: str) -> str:
+    """Return the leading SQL keyword of a statement (SELECT, INSERT, ...)"""
+    head = statement.lstrip()[:10].split(None, 1)
+    return head[0].upper() if head else "UNKNOWN"
+
+
+def render_metrics() -> bytes:
+    """Render all metrics in the Prometheus text exposition format"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
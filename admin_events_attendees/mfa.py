@@ -0,0 +1,93 @@
+"""
+TOTP second factor: secrets, setup QR codes and code verification.
+
+qrcode (and Pillow, which qrcode 7 loads as soon as it is installed) costs
+a couple of hundred milliseconds to import and is only needed by
+/auth/mfa/setup, so it is imported on the first setup rather than at
+startup; pyotp likewise on the first MFA request. Rendering a code takes
+several milliseconds of pure CPU, so it runs in the thread pool. The SVG
+format is drawn by qrcode itself without Pillow.
+
+A TOTP code is valid for its 30-second step and the steps either side,
+so a code read over someone's shoulder could be replayed for about a
+minute. Each accepted (user, step) pair is recorded with SET NX in the
+store that holds login attempts. The entry expires once the step can no
+longer be accepted, so a second use is refused without a database write.
+"""
+import base64
+import hmac
+import io
+import math
+import time
+from functools import lru_cache
+
+from starlette.concurrency import run_in_threadpool
+
+from config import LOGIN_ATTEMPTS_REDIS_URL, MFA_ISSUER
+from local_redis import redis_client
+
+# Steps either side of the current one that are still accepted (clock drift)
+VALID_WINDOW = 1
+
+
+@lru_cache(maxsize=1024)
+def _totp(secret: str) -> "pyotp.TOTP":
+    import pyotp
+    return pyotp.TOTP(secret)
+
+
+def render_qr_code(data: str, image_format: str = "png") -> str:
+    """QR code for data as a data: URL, PNG or SVG"""
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if image_format == "svg":
+        import qrcode.image.svg
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+        mime_type = "image/svg+xml"
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+        mime_type = "image/png"
+    return f"data:{mime_type};base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+
+class MFAService:
+    def __init__(self, client):
+        self.client = client
+
+    def generate_secret(self) -> str:
+        """Generate MFA secret"""
+        import pyotp
+        return pyotp.random_base32()
+
+    async def generate_qr_code(self, secret: str, username: str, image_format: str = "png") -> str:
+        """Generate QR code for MFA setup (rendered off the event loop)"""
+        totp_uri = _totp(secret).provisioning_uri(name=username, issuer_name=MFA_ISSUER)
+        return await run_in_threadpool(render_qr_code, totp_uri, image_format)
+
+    def matching_step(self, secret: str, code: str, now: float) -> int:
+        """Time step whose code equals code, or -1"""
+        totp = _totp(secret)
+        current = int(now // totp.interval)
+        for step in range(current - VALID_WINDOW, current + VALID_WINDOW + 1):
+            if hmac.compare_digest(code.encode(), totp.generate_otp(step).encode()):
+                return step
+        return -1
+
+    async def verify_mfa_code(self, user_id: int, secret: str, code: str) -> bool:
+        """Verify MFA code; each code is accepted once per user"""
+        now = time.time()
+        step = self.matching_step(secret, code, now)
+        if step < 0:
+            return False
+        # The step stops being accepted when step + VALID_WINDOW is over
+        interval = _totp(secret).interval
+        ttl = max(1, math.ceil((step + VALID_WINDOW + 1) * interval - now))
+        return bool(await self.client.set(f"mfa:used:{user_id}:{step}", 1, ex=ttl, nx=True))
+
+
+mfa_service = MFAService(redis_client(LOGIN_ATTEMPTS_REDIS_URL))
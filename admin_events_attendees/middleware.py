@@ -1,10 +1,86 @@
+import random
 import time
 from collections import defaultdict
 from fastapi import Request, HTTPException, status
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response, RedirectResponse
 from typing import Dict, DefaultDict
-from config import RATE_LIMIT_PER_MINUTE
+from config import RATE_LIMIT_PER_MINUTE, PROFILE_SAMPLE_RATE, PROFILE_SAMPLE_MODE
+from metrics import (
+    REQUEST_LATENCY, REQUESTS_IN_FLIGHT, RATE_LIMIT_REJECTIONS,
+    DB_QUERIES_PER_REQUEST, DB_TIME_PER_REQUEST, REQUEST_PHASE_DURATION
+)
+import profiling
+import replication
+from admission import Overloaded, admission_controller
+from auth import auth_service
+import query_stats
+import timing
+
+def get_route_template(request: Request) -> str:
+    """Matched route path (e.g. /attendees/{attendee_id}) so metric label cardinality stays bounded"""
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+class FollowerRedirectMiddleware(BaseHTTPMiddleware):
+    """On a read-only follower, send writes to the primary and report replication lag"""
+    
+    SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+    
+    @classmethod
+    def redirects(cls, method: str) -> bool:
+        return replication.follower is not None and method not in cls.SAFE_METHODS
+    
+    async def dispatch(self, request: Request, call_next):
+        follower = replication.follower
+        if follower is None:
+            return await call_next(request)
+        if self.redirects(request.method):
+            # 307 keeps the method and body
+            return RedirectResponse(
+                follower.redirect_url(request.url.path, request.url.query),
+                status_code=status.HTTP_307_TEMPORARY_REDIRECT
+            )
+        response = await call_next(request)
+        response.headers["X-Replication-Lag"] = f"{follower.lag_seconds:.3f}"
+        return response
+
+class AdmissionControlMiddleware:
+    """Admit requests per route class and shed the excess with 503 + Retry-After
+    
+    Pure ASGI and inside the logging/metrics layers: a shed request is still
+    logged and counted, but never reaches a handler, a session or the audit log.
+    Writes a follower redirects to the primary pass without taking a slot.
+    """
+    
+    def __init__(self, app, controller=admission_controller):
+        self.app = app
+        self.controller = controller
+    
+    async def __call__(self, scope, receive, send):
+        limiter = None
+        if scope["type"] == "http" and not FollowerRedirectMiddleware.redirects(scope["method"]):
+            limiter = self.controller.limiter_for(scope["method"], scope["path"])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await limiter.acquire()
+        except Overloaded as e:
+            response = JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"detail": "Service overloaded, retry later", "type": "error"},
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start_time)
 
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     """Add security headers to all responses"""
@@ -52,6 +128,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         
         # Check rate limit
         if len(self.clients[client_ip]) >= self.requests_per_minute:
+            RATE_LIMIT_REJECTIONS.inc()
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail=f"Rate limit exceeded. Maximum {self.requests_per_minute} requests per minute."
@@ -159,3 +236,129 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
         
         # Fallback to direct client host
         return request.client.host if request.client else "unknown"
+
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Record per-route latency histograms and in-flight requests"""
+    
+    async def dispatch(self, request: Request, call_next):
+        REQUESTS_IN_FLIGHT.inc()
+        start_time = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(
+                request.method,
+                get_route_template(request),
+                str(status_code)
+            ).observe(time.perf_counter() - start_time)
+
+class ServerTimingMiddleware:
+    """Attribute request time to phases and emit them as a Server-Timing header
+    
+    Pure ASGI (not BaseHTTPMiddleware) so it can see when the response starts
+    and when the last body chunk is sent. The send phase happens after the
+    headers are out, so it is only recorded to metrics.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        timer, timer_token = timing.begin_request()
+        stats, stats_token = query_stats.begin_request()
+        response_start = None
+        
+        async def send_with_timing(message):
+            nonlocal response_start
+            if message["type"] == "http.response.start":
+                response_start = time.perf_counter()
+                handled = timer.phases.get("app", 0.0)
+                phases = {"middleware": max(0.0, response_start - timer.start - handled)}
+                phases.update(timer.phases)
+                phases["db"] = stats.duration
+                phases["total"] = response_start - timer.start
+                timer.phases = phases
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timing.format_server_timing(
+                    phases, {"db": f"{stats.count} queries"}
+                ))
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                timer.add("send", time.perf_counter() - response_start)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            timing.end_request(timer_token)
+            query_stats.end_request(stats_token)
+            self.record(Request(scope), timer, stats)
+    
+    def record(self, request: Request, timer, stats):
+        route = get_route_template(request)
+        for name, seconds in timer.phases.items():
+            REQUEST_PHASE_DURATION.labels(route, name).observe(seconds)
+        DB_QUERIES_PER_REQUEST.labels(route).observe(stats.count)
+        DB_TIME_PER_REQUEST.labels(route).observe(stats.duration)
+        query_stats.report_repeated_statements(stats, request.method, request.url.path)
+
+class ProfilingMiddleware:
+    """Profile requests flagged by an admin (X-Profile header) or picked by sampling
+    
+    Unflagged requests only pay for one header scan; no profiler, sampler
+    thread or token decode is involved unless a capture was asked for.
+    """
+    
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, sample_mode: str = PROFILE_SAMPLE_MODE):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.sample_mode = sample_mode
+    
+    async def __call__(self, scope, receive, send):
+        mode = self.requested_mode(scope) if scope["type"] == "http" else None
+        capture = profiling.try_begin_capture(mode, scope["method"], scope["path"]) if mode else None
+        if capture is None:
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", capture.id)
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiling.end_capture(capture)
+            try:
+                await run_in_threadpool(profiling.profile_store.save, capture)
+            except OSError as e:
+                print(f"Could not store profile {capture.id}: {e}")
+    
+    def requested_mode(self, scope):
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                requested = value.decode("latin-1").strip().lower()
+                if requested in profiling.PROFILE_MODES and self.is_admin(scope):
+                    return requested
+                return None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.sample_mode
+        return None
+    
+    def is_admin(self, scope) -> bool:
+        """Only admin tokens may ask for a profile"""
+        authorization = Headers(scope=scope).get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+        token_data = auth_service.verify_token(token)
+        return token_data is not None and "admin" in token_data.scopes
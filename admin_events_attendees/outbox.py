@@ -0,0 +1,385 @@
+"""
+Transactional outbox for attendee changes.
+
+Attendee write units append an event to `outbox_events` in the same
+transaction as the change (OutboxRelay.record), so an event exists if and
+only if its change committed. The Django monolith and other consumers no
+longer have to poll the attendee tables. A relay task per attendee database
+reads the outbox in id order and hands batches to every subscriber:
+
+- EventBus: handlers in this process (cache invalidation and the like)
+- WebhookSubscriber: POSTs each batch as JSON, signed with HMAC-SHA256
+- RedisStreamSubscriber: XADDs each event to a Redis stream ("memory://"
+  uses the in-process LocalRedis stand-in)
+
+Delivery is at least once. A durable subscriber's position is stored in
+`outbox_offsets` and only advances after a whole batch was accepted. A
+failure or a crash therefore redelivers the batch, and consumers
+deduplicate by event id. Workers share the offsets: each durable subscriber
+is served by whichever relay holds its lease. The in-process bus is not
+durable; each worker delivers to its own handlers the events committed
+after it started.
+
+Ids are allocated when an event is inserted but become visible when its
+transaction commits, and on PostgreSQL a lower id may commit after a higher
+one. The relay therefore stops a batch at the first missing id past the
+subscriber's position. Once the event after the gap is OUTBOX_GAP_GRACE_SECONDS
+old, the transaction holding the missing id has been open at least that
+long; the gap is taken as a rollback and skipped. (Under the SQLite write
+lane ids always commit in order.)
+
+Events are ordered per database. With SHARD_URLS, the update that moves an
+attendee to another shard is recorded on its old shard, together with the
+removal of the old copy; later events come from the new shard's relay and
+may arrive first, so consumers compare occurred_at.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import date, datetime
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import event, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import (
+    OUTBOX_WEBHOOK_URLS, OUTBOX_WEBHOOK_SECRET, OUTBOX_REDIS_URL, OUTBOX_REDIS_STREAM, OUTBOX_REDIS_MAXLEN,
+    OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL_MS, OUTBOX_LEASE_SECONDS, OUTBOX_MAX_BACKOFF_SECONDS,
+    OUTBOX_RETENTION_SECONDS, OUTBOX_GAP_GRACE_SECONDS
+)
+from database import AsyncSessionLocal, OutboxEvent, OutboxOffset
+from local_redis import redis_client
+from metrics import OUTBOX_EVENTS_DELIVERED, OUTBOX_DELIVERY_FAILURES, OUTBOX_DELIVERY_LAG
+from query_stats import mark_background
+from write_lane import WriteLane, write_lane
+
+if TYPE_CHECKING:
+    import httpx  # imported by the first WebhookSubscriber
+
+SIGNATURE_HEADER = "X-Outbox-Signature"
+PRUNE_INTERVAL_SECONDS = 60
+
+Handler = Callable[[List[dict]], Awaitable[None]]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def attendee_payload(attendee) -> Dict[str, Any]:
+    """Column values of an Attendee"""
+    return {column.name: getattr(attendee, column.name) for column in attendee.__table__.columns}
+
+
+class EventBus:
+    """Handlers in this process; not durable"""
+
+    name = "bus"
+    durable = False
+
+    def __init__(self):
+        self.handlers: List[Handler] = []
+
+    def subscribe(self, handler: Handler) -> Handler:
+        self.handlers.append(handler)
+        return handler
+
+    def unsubscribe(self, handler: Handler):
+        self.handlers.remove(handler)
+
+    async def deliver(self, events: List[dict]):
+        for handler in list(self.handlers):
+            await handler(events)
+
+
+class WebhookSubscriber:
+    """POSTs {"events": [...]} to a URL; any non-2xx answer is retried"""
+
+    durable = True
+
+    def __init__(self, url: str, secret: str = "", timeout: float = 10, http: Optional["httpx.AsyncClient"] = None):
+        self.url = url
+        self.name = f"webhook:{url}"
+        self.secret = secret
+        if http is None:
+            import httpx
+            http = httpx.AsyncClient(timeout=timeout)
+        self.http = http
+
+    async def deliver(self, events: List[dict]):
+        body = json.dumps({"events": events}).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            digest = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            headers[SIGNATURE_HEADER] = f"sha256={digest}"
+        response = await self.http.post(self.url, content=body, headers=headers)
+        response.raise_for_status()
+
+
+class RedisStreamSubscriber:
+    """Appends each event to a Redis stream, one pipelined round trip per batch"""
+
+    durable = True
+
+    def __init__(self, client, stream: str = OUTBOX_REDIS_STREAM, maxlen: int = OUTBOX_REDIS_MAXLEN):
+        self.client = client
+        self.stream = stream
+        self.maxlen = maxlen
+        self.name = f"redis:{stream}"
+
+    async def deliver(self, events: List[dict]):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for outbox_event in events:
+                pipe.xadd(self.stream, {"event": json.dumps(outbox_event)}, maxlen=self.maxlen, approximate=True)
+            await pipe.execute()
+
+
+def configured_subscribers() -> list:
+    subscribers = [event_bus]
+    subscribers += [WebhookSubscriber(url, OUTBOX_WEBHOOK_SECRET) for url in OUTBOX_WEBHOOK_URLS]
+    if OUTBOX_REDIS_URL:
+        subscribers.append(RedisStreamSubscriber(redis_client(OUTBOX_REDIS_URL)))
+    return subscribers
+
+
+class OutboxRelay:
+    """Records attendee change events and delivers one database's outbox to the subscribers"""
+
+    def __init__(
+        self,
+        lane: WriteLane = write_lane,
+        sessionmaker=AsyncSessionLocal,
+        source: str = "attendees",
+        subscribers: Optional[list] = None,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval_ms: int = OUTBOX_POLL_INTERVAL_MS,
+        lease_seconds: float = OUTBOX_LEASE_SECONDS,
+        max_backoff_seconds: float = OUTBOX_MAX_BACKOFF_SECONDS,
+        retention_seconds: int = OUTBOX_RETENTION_SECONDS,
+        gap_grace_seconds: float = OUTBOX_GAP_GRACE_SECONDS
+    ):
+        self.lane = lane  # offsets and pruning; events are read through `sessionmaker`
+        self.sessionmaker = sessionmaker
+        self.source = source
+        self.subscribers = subscribers if subscribers is not None else default_subscribers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval_ms / 1000
+        self.lease_seconds = lease_seconds
+        self.max_backoff = max_backoff_seconds
+        self.retention = retention_seconds
+        self.gap_grace = gap_grace_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._positions: Dict[str, int] = {}
+        self._failures: Dict[str, int] = {}
+        self._retry_at: Dict[str, float] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def record(self, session: AsyncSession, event_type: str, rows: List[Dict[str, Any]]):
+        """Append one event per attendee row to the unit's transaction (call inside the write unit)"""
+        if not rows:
+            return
+        now = time.time()
+        await session.execute(insert(OutboxEvent), [
+            {
+                "event_type": event_type,
+                "aggregate_id": row["attendee_id"],
+                "payload": json.dumps(row, default=_json_default),
+                "created_at": now,
+            }
+            for row in rows
+        ])
+        session.info.setdefault("outbox_relays", set()).add(self)
+
+    def notify(self):
+        """Deliver without waiting for the next poll (called after a commit that recorded events)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def start(self):
+        """Start relaying on the running event loop; the bus gets events committed from now on"""
+        async with self.sessionmaker() as session:
+            head = await session.scalar(select(func.max(OutboxEvent.id)))
+        for subscriber in self.subscribers:
+            if not subscriber.durable:
+                self._positions[subscriber.name] = head or 0
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop relaying and hand this worker's leases to the other workers"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wake = None
+        try:
+            await self.lane.submit(lambda session: session.execute(
+                update(OutboxOffset).where(OutboxOffset.lease_owner == self.owner)
+                .values(lease_owner=None, leased_until=None)
+            ))
+        except Exception as e:
+            print(f"Could not release outbox leases: {e}")
+
+    async def relay_once(self) -> int:
+        """Deliver one batch to every subscriber that is due; returns the largest batch delivered"""
+        delivered = 0
+        for subscriber in self.subscribers:
+            name = subscriber.name
+            if time.time() < self._retry_at.get(name, 0):
+                continue
+            try:
+                delivered = max(delivered, await self._deliver_batch(subscriber))
+            except Exception as e:
+                failures = self._failures[name] = self._failures.get(name, 0) + 1
+                self._retry_at[name] = time.time() + min(self.max_backoff, self.poll_interval * 2 ** (failures - 1))
+                OUTBOX_DELIVERY_FAILURES.labels(name).inc()
+                print(f"Outbox delivery to {name} failed ({failures} in a row): {e}")
+            else:
+                self._failures.pop(name, None)
+                self._retry_at.pop(name, None)
+        return delivered
+
+    async def prune(self) -> int:
+        """Delete events older than the retention window that every durable subscriber has received"""
+        cutoff = time.time() - self.retention
+        names = [subscriber.name for subscriber in self.subscribers if subscriber.durable]
+
+        async def unit(session: AsyncSession) -> int:
+            condition = OutboxEvent.created_at < cutoff
+            if names:
+                offsets = (await session.execute(
+                    select(OutboxOffset.delivered_id).where(OutboxOffset.subscriber.in_(names))
+                )).scalars().all()
+                if len(offsets) < len(names):
+                    return 0  # a subscriber has not received anything yet
+                condition = condition & (OutboxEvent.id <= min(offsets))
+            return (await session.execute(OutboxEvent.__table__.delete().where(condition))).rowcount
+
+        return await self.lane.submit(unit)
+
+    def serialize(self, row: OutboxEvent) -> dict:
+        return {
+            "id": row.id,
+            "source": self.source,
+            "type": row.event_type,
+            "attendee_id": row.aggregate_id,
+            "occurred_at": row.created_at,
+            "data": json.loads(row.payload),
+        }
+
+    async def _deliver_batch(self, subscriber) -> int:
+        name = subscriber.name
+        if subscriber.durable:
+            position = await self.lane.submit(lambda session: self._claim(session, name))
+            if position is None:
+                return 0  # another worker holds the lease
+        else:
+            position = self._positions.get(name, 0)
+
+        async with self.sessionmaker() as session:
+            rows = (await session.execute(
+                select(OutboxEvent).where(OutboxEvent.id > position).order_by(OutboxEvent.id).limit(self.batch_size)
+            )).scalars().all()
+        events = [self.serialize(row) for row in self._committed_prefix(position, rows)]
+        if not events:
+            return 0
+        await subscriber.deliver(events)
+        last_id = events[-1]["id"]
+        if subscriber.durable:
+            await self.lane.submit(lambda session: session.execute(
+                update(OutboxOffset)
+                .where(OutboxOffset.subscriber == name, OutboxOffset.lease_owner == self.owner)
+                .values(delivered_id=last_id)
+            ))
+        else:
+            self._positions[name] = last_id
+        now = time.time()
+        OUTBOX_EVENTS_DELIVERED.labels(name).inc(len(events))
+        for delivered_event in events:
+            OUTBOX_DELIVERY_LAG.observe(now - delivered_event["occurred_at"])
+        return len(events)
+
+    def _committed_prefix(self, position: int, rows: List[OutboxEvent]) -> List[OutboxEvent]:
+        """Rows up to the first id gap that may still be an uncommitted transaction"""
+        settled = time.time() - self.gap_grace
+        # Nothing delivered yet: ids below the first row were pruned before this subscriber existed
+        expected = position + 1 if position else None
+        for index, row in enumerate(rows):
+            if expected is not None and row.id != expected and row.created_at > settled:
+                return rows[:index]
+            expected = row.id + 1
+        return rows
+
+    async def _claim(self, session: AsyncSession, name: str) -> Optional[int]:
+        """Take or renew the subscriber's lease; its delivered id, or None if another worker holds it"""
+        now = time.time()
+        if await session.get(OutboxOffset, name) is None:
+            session.add(OutboxOffset(subscriber=name, delivered_id=0))
+            await session.flush()
+        claimed = await session.execute(
+            update(OutboxOffset)
+            .where(
+                OutboxOffset.subscriber == name,
+                or_(
+                    OutboxOffset.lease_owner == self.owner,
+                    OutboxOffset.lease_owner.is_(None),
+                    OutboxOffset.leased_until < now,
+                ),
+            )
+            .values(lease_owner=self.owner, leased_until=now + self.lease_seconds)
+        )
+        if claimed.rowcount != 1:
+            return None
+        return await session.scalar(select(OutboxOffset.delivered_id).where(OutboxOffset.subscriber == name))
+
+    async def _run(self):
+        mark_background()
+        last_prune = time.monotonic()
+        while True:
+            delivered = 0
+            try:
+                delivered = await self.relay_once()
+                if time.monotonic() - last_prune >= PRUNE_INTERVAL_SECONDS:
+                    last_prune = time.monotonic()
+                    await self.prune()
+            except Exception as e:
+                print(f"Outbox relay failed: {e}")
+            # Keep draining without waiting while there is a backlog
+            if delivered < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_relays(session):
+    for relay in session.info.pop("outbox_relays", ()):
+        relay.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_relays(session):
+    session.info.pop("outbox_relays", None)
+
+
+event_bus = EventBus()
+default_subscribers = configured_subscribers()
+outbox_relay = OutboxRelay()
@@ -0,0 +1,184 @@
+"""
+On-demand request profiling.
+
+A request is profiled when an admin sends `X-Profile: cprofile` or
+`X-Profile: sample`, or when it is picked by PROFILE_SAMPLE_RATE. cprofile
+captures are stored as pstats files; sample captures walk the event-loop
+thread's stack every PROFILE_SAMPLE_INTERVAL_MS and are stored as collapsed
+stacks (flamegraph.pl / speedscope input). Captures go to a bounded ring of
+files in PROFILE_DIR and can be downloaded from /auth/profiles.
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import List, Optional
+
+from config import PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_SAMPLE_INTERVAL_MS
+
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_FORMATS = {"cprofile": "pstats", "sample": "collapsed"}
+
+# cProfile cannot run twice at once (3.12 raises), and overlapping samplers
+# on the same loop would mix requests; allow one capture per process.
+_capture_lock = threading.Lock()
+
+
+class StackSampler:
+    """Periodically sample one thread's Python stack into collapsed-stack counts"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def collapse_stack(frame) -> str:
+    """Render a frame chain root-first as `file:function;file:function`"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfileCapture:
+    """One in-progress capture for a single request"""
+
+    def __init__(self, mode: str, method: str, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.duration = 0.0
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            self._sampler.start()
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        self.duration = time.perf_counter() - self._start
+
+
+def try_begin_capture(mode: str, method: str, path: str) -> Optional[ProfileCapture]:
+    """Start a capture unless another one is already running in this process"""
+    if not _capture_lock.acquire(blocking=False):
+        return None
+    capture = ProfileCapture(mode, method, path)
+    try:
+        capture.start()
+    except Exception:
+        _capture_lock.release()
+        raise
+    return capture
+
+
+def end_capture(capture: ProfileCapture):
+    try:
+        capture.stop()
+    finally:
+        _capture_lock.release()
+
+
+class ProfileStore:
+    """Bounded on-disk ring of profile captures (oldest are deleted first)"""
+
+    def __init__(self, directory: str = PROFILE_DIR, max_profiles: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def save(self, capture: ProfileCapture) -> dict:
+        os.makedirs(self.directory, exist_ok=True)
+        fmt = PROFILE_FORMATS[capture.mode]
+        data_path = os.path.join(self.directory, f"{capture.id}.{fmt}")
+        if capture.mode == "cprofile":
+            capture._profiler.dump_stats(data_path)
+        else:
+            with open(data_path, "w") as f:
+                f.write(capture._sampler.collapsed())
+
+        meta = {
+            "id": capture.id,
+            "mode": capture.mode,
+            "format": fmt,
+            "method": capture.method,
+            "path": capture.path,
+            "created_at": capture.started_at,
+            "duration_ms": round(capture.duration * 1000, 3),
+            "size_bytes": os.path.getsize(data_path),
+        }
+        with open(os.path.join(self.directory, f"{capture.id}.json"), "w") as f:
+            json.dump(meta, f)
+        self._prune()
+        return meta
+
+    def list_profiles(self) -> List[dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        if not profile_id.isalnum():
+            return None
+        meta_path = os.path.join(self.directory, f"{profile_id}.json")
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        meta["file_path"] = os.path.join(self.directory, f"{profile_id}.{meta['format']}")
+        return meta
+
+    def _prune(self):
+        for meta in self.list_profiles()[self.max_profiles:]:
+            for ext in ("json", meta["format"]):
+                try:
+                    os.remove(os.path.join(self.directory, f"{meta['id']}.{ext}"))
+                except OSError:
+                    pass
+
+
+profile_store = ProfileStore()
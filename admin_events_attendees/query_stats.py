@@ -0,0 +1,132 @@
+"""
+Per-request SQL accounting.
+
+The engine hooks in database.py call record_query() for every statement.
+QueryStatsMiddleware binds a QueryStats object to the request context, so
+each request gets its own query count and DB time, which are exported as a
+Server-Timing entry and as metrics. Statements slower than
+SLOW_QUERY_THRESHOLD_MS are logged with the *shape* of their bound
+parameters (types only, never values), and statements repeated
+N_PLUS_ONE_THRESHOLD times within one request are reported as a likely N+1.
+"""
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, List, Optional
+
+from config import SLOW_QUERY_THRESHOLD_MS, N_PLUS_ONE_THRESHOLD
+from metrics import DB_QUERY_DURATION, statement_operation
+
+logger = logging.getLogger("admin_events.sql")
+
+
+class QueryStats:
+    """Queries issued within one request (or one capture block)"""
+
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter = Counter()
+
+    def add(self, statement: str, elapsed: float):
+        self.count += 1
+        self.duration += elapsed
+        self.statements[statement] += 1
+
+    def repeated_statements(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[tuple]:
+        """Statements executed at least `threshold` times (likely N+1 patterns)"""
+        return [(stmt, n) for stmt, n in self.statements.most_common() if n >= threshold]
+
+
+_request_stats: ContextVar[Optional[QueryStats]] = ContextVar("request_query_stats", default=None)
+
+# Process-wide captures used by tests (the test client runs the app in another thread)
+_captures: List[QueryStats] = []
+# Set inside background tasks whose statements belong to no request
+_background: ContextVar[bool] = ContextVar("background_queries", default=False)
+
+
+def begin_request():
+    """Bind a fresh QueryStats to the current context; returns (stats, token)"""
+    stats = QueryStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token):
+    _request_stats.reset(token)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _request_stats.get()
+
+
+def mark_background():
+    """Keep the current task's statements out of capture_queries() (call at the top of the task)"""
+    _background.set(True)
+
+
+def parameter_shape(parameters: Any, executemany: bool = False) -> str:
+    """Describe bound parameters by type only, e.g. {username: str} or (str, int)"""
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = parameter_shape(parameters[0]) if parameters else "()"
+        return f"{len(parameters)} x {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in parameters) + ")"
+    return type(parameters).__name__
+
+
+def record_query(statement: str, parameters: Any, elapsed: float, executemany: bool = False):
+    """Account one executed statement (called from the engine hooks)"""
+    DB_QUERY_DURATION.labels(statement_operation(statement)).observe(elapsed)
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add(statement, elapsed)
+    if not _background.get():
+        for capture in _captures:
+            capture.add(statement, elapsed)
+
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        logger.warning(
+            "Slow query (%.1f ms): %s | params: %s",
+            elapsed * 1000,
+            " ".join(statement.split()),
+            parameter_shape(parameters, executemany)
+        )
+
+
+def report_repeated_statements(stats: QueryStats, method: str, path: str):
+    """Log statements that look like an N+1 access pattern"""
+    for statement, count in stats.repeated_statements():
+        logger.warning(
+            "Possible N+1 on %s %s: statement executed %d times: %s",
+            method, path, count, " ".join(statement.split())
+        )
+
+
+@contextmanager
+def capture_queries() -> Iterator[QueryStats]:
+    """Count every statement executed in this process while the block runs (background tasks excepted)"""
+    stats = QueryStats()
+    _captures.append(stats)
+    try:
+        yield stats
+    finally:
+        _captures.remove(stats)
+
+
+@contextmanager
+def assert_max_queries(budget: int) -> Iterator[QueryStats]:
+    """Fail if the block issues more than `budget` SQL statements"""
+    with capture_queries() as stats:
+        yield stats
+    if stats.count > budget:
+        issued = "\n".join(f"  {n}x {' '.join(s.split())}" for s, n in stats.statements.items())
+        raise AssertionError(
+            f"Query budget exceeded: {stats.count} statements issued, budget is {budget}\n{issued}"
+        )
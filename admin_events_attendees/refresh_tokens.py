@@ -0,0 +1,72 @@
+"""
+Refresh-token storage helpers.
+
+Only a SHA-256 digest of each token is stored: a fixed-width, uniquely
+indexed key, so a leaked table does not hand out sessions. Tokens are
+random 256-bit strings, so an unsalted digest is enough.
+
+Refreshing rotates the token. The presented row is revoked and a new one
+issued. A revoked row is kept as a tombstone for
+REFRESH_TOKEN_REUSE_WINDOW_SECONDS (its expires_at is moved there), so
+presenting a rotated token again is recognised as reuse and ends the
+user's session. Once that window has passed, the row is swept with the
+expired ones in bounded batches, so the table only holds live sessions
+plus recent tombstones.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import (
+    REFRESH_TOKEN_REUSE_WINDOW_SECONDS, REFRESH_TOKEN_SWEEP_BATCH_SIZE, REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS
+)
+from database import RefreshToken
+from query_stats import mark_background
+from write_lane import write_lane
+
+
+def token_digest(token: str) -> str:
+    """Hex SHA-256 of a refresh token, the value stored in refresh_tokens.token_hash"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def revoked_values() -> Dict[str, Any]:
+    """Column values that revoke a token and keep it only for the reuse window"""
+    return {
+        "is_revoked": True,
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=REFRESH_TOKEN_REUSE_WINDOW_SECONDS),
+    }
+
+
+async def sweep_refresh_tokens(batch_size: int = REFRESH_TOKEN_SWEEP_BATCH_SIZE) -> int:
+    """Delete expired tokens and stale tombstones, one commit per batch; returns the rows deleted"""
+    table = RefreshToken.__table__
+
+    async def delete_batch(session: AsyncSession) -> int:
+        expired = (
+            select(table.c.id).where(table.c.expires_at < datetime.now(timezone.utc)).limit(batch_size)
+        ).scalar_subquery()
+        return (await session.execute(table.delete().where(table.c.id.in_(expired)))).rowcount
+
+    deleted = 0
+    while True:
+        # Each batch is its own unit so logins queued behind it wait for one
+        # bounded DELETE, not for the whole backlog
+        count = await write_lane.submit(delete_batch)
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+async def sweep_periodically(interval: float = REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS):
+    mark_background()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sweep_refresh_tokens()
+        except Exception as e:
+            print(f"Refresh token sweep failed: {e}")
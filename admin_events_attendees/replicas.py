@@ -0,0 +1,133 @@
+"""
+Read/write session routing.
+
+get_write_db hands out a session on the primary and marks the client as
+having written: for READ_YOUR_WRITES_SECONDS its reads stay on the primary
+(a cookie carries the deadline, so it works across workers). get_read_db
+hands out a session on one of the healthy replicas from DB_REPLICA_URLS,
+round-robin, or on the primary when the client is sticky or no replica is
+healthy. A background task runs `SELECT 1` on every replica each
+REPLICA_HEALTH_INTERVAL_SECONDS.
+
+Both dependencies build on get_db, so overriding get_db (tests) moves the
+primary side of the routing as well.
+"""
+import asyncio
+import itertools
+import time
+from typing import List, Optional
+
+from fastapi import Depends, Request, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import DB_REPLICA_URLS, REPLICA_HEALTH_INTERVAL_SECONDS, READ_YOUR_WRITES_SECONDS
+from database import create_db_engine, get_db
+from metrics import DB_READS_ROUTED, DB_REPLICA_HEALTHY
+
+STICKY_COOKIE = "db_primary_until"
+
+
+class Replica:
+    """One read replica: its engine, session factory and health"""
+
+    def __init__(self, name: str, url: str, **engine_options):
+        self.name = name
+        self.url = url
+        self.engine = create_db_engine(url, **engine_options)
+        self.sessionmaker = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        self.healthy = True
+        self.last_error: Optional[str] = None
+
+    async def check(self) -> bool:
+        try:
+            async with self.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            self.healthy, self.last_error = True, None
+        except Exception as e:
+            self.healthy, self.last_error = False, str(e)
+        DB_REPLICA_HEALTHY.labels(self.name).set(1 if self.healthy else 0)
+        return self.healthy
+
+
+class ReplicaSet:
+    """Healthy-replica selection plus the periodic health checker"""
+
+    def __init__(self, urls: List[str], health_interval: float = REPLICA_HEALTH_INTERVAL_SECONDS, **engine_options):
+        self.replicas = [Replica(f"replica-{i}", url, **engine_options) for i, url in enumerate(urls)]
+        self.health_interval = health_interval
+        self._round_robin = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def choose(self) -> Optional[Replica]:
+        """Next healthy replica, or None when reads must go to the primary"""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    async def check_health(self):
+        await asyncio.gather(*(replica.check() for replica in self.replicas))
+
+    def start(self):
+        if self.replicas:
+            self._task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval)
+
+
+def is_sticky(request: Request) -> bool:
+    """True while the client is inside its read-your-writes window"""
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_write_db(response: Response, db: AsyncSession = Depends(get_db)) -> AsyncSession:
+    """Primary session for handlers that write; pins the client's reads to the primary for a while"""
+    if replica_set.replicas:
+        response.set_cookie(
+            STICKY_COOKIE,
+            f"{time.time() + READ_YOUR_WRITES_SECONDS:.3f}",
+            max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+            httponly=True,
+            samesite="lax"
+        )
+    return db
+
+
+async def get_read_db(request: Request, primary: AsyncSession = Depends(get_db)):
+    """Replica session for read-only handlers (primary when sticky or no replica is healthy)"""
+    if not replica_set.replicas:
+        yield primary
+        return
+    if is_sticky(request):
+        DB_READS_ROUTED.labels("sticky").inc()
+        yield primary
+        return
+    replica = replica_set.choose()
+    if replica is None:
+        DB_READS_ROUTED.labels("primary").inc()
+        yield primary
+        return
+    DB_READS_ROUTED.labels("replica").inc()
+    async with replica.sessionmaker() as db:
+        yield db
+
+
+replica_set = ReplicaSet(DB_REPLICA_URLS)
@@ -0,0 +1,369 @@
+"""
+Log shipping to read-only followers (SQLite deployments).
+
+On a primary (REPLICATION_ROLE=primary) triggers on every replicated table
+append each committed row change to `change_log` inside the writing
+transaction, so the log order is the commit order and nothing is recorded
+for rolled-back work. The log is served from /replication/changes.
+
+A follower (REPLICATION_ROLE=follower) starts from a consistent snapshot of
+the primary's database file and then polls for changes after its applied
+LSN, replaying each batch in one local transaction together with the new
+position. The follower's request connections are query_only; write
+requests are redirected to the primary by FollowerRedirectMiddleware, and
+audit entries produced by reads are forwarded to the primary in batches.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from typing import TYPE_CHECKING, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from starlette.concurrency import run_in_threadpool
+
+from config import (
+    REPLICATION_ROLE, REPLICATION_PRIMARY_URL, REPLICATION_TOKEN,
+    REPLICATION_POLL_INTERVAL_MS, REPLICATION_BATCH_SIZE, REPLICATION_LOG_RETENTION_SECONDS
+)
+from database import (
+    Base, ApiKey, Attendee, AuditLog, ChangeLog, RefreshToken, ReplicationState, TokenRevocation, User, sync_engine
+)
+from metrics import REPLICATION_LAG_SECONDS, REPLICATION_LAG_CHANGES
+from write_lane import write_lane
+
+if TYPE_CHECKING:
+    import httpx  # only followers make HTTP calls; imported when one is created
+
+# Attendee is attendees_attendee in SCHEMA_MODE=django
+_TABLES = {
+    model.__table__.name: model.__table__
+    for model in (User, RefreshToken, AuditLog, Attendee, TokenRevocation, ApiKey)
+}
+REPLICATED_TABLES = tuple(_TABLES)
+TOKEN_HEADER = "X-Replication-Token"
+LSN_HEADER = "X-Replication-LSN"
+
+# Unix time with sub-second precision in SQLite
+NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+
+
+class ResyncRequired(Exception):
+    """The primary already pruned changes this follower has not applied"""
+
+
+def _table(name: str):
+    if name not in REPLICATED_TABLES:
+        raise ValueError(f"Table {name!r} is not replicated")
+    return _TABLES[name]
+
+
+def _row_json(table, alias: str) -> str:
+    return "json_object(" + ", ".join(f"'{c.name}', {alias}.\"{c.name}\"" for c in table.columns) + ")"
+
+
+def change_capture_sql(table_name: str) -> List[str]:
+    """CREATE TRIGGER statements that record inserts, updates and deletes of one table"""
+    table = _table(table_name)
+    pk = list(table.primary_key.columns)[0].name
+    row_json = _row_json(table, "NEW")
+    insert_log = f"INSERT INTO change_log (table_name, op, pk, row, committed_at) VALUES ('{table_name}'"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS change_log_{table_name}_insert AFTER INSERT ON \"{table_name}\" BEGIN "
+        f"{insert_log}, 'upsert', NEW.\"{pk}\", {row_json}, {NOW_SQL}); END",
+        f"CREATE TRIGGER IF NOT EXISTS change_log_{table_name}_update AFTER UPDATE ON \"{table_name}\" BEGIN "
+        f"{insert_log}, 'upsert', NEW.\"{pk}\", {row_json}, {NOW_SQL}); END",
+        f"CREATE TRIGGER IF NOT EXISTS change_log_{table_name}_delete AFTER DELETE ON \"{table_name}\" BEGIN "
+        f"{insert_log}, 'delete', OLD.\"{pk}\", NULL, {NOW_SQL}); END",
+    ]
+
+
+def backfill_sql(table_name: str) -> str:
+    """INSERT that logs every current row of a table as an upsert"""
+    table = _table(table_name)
+    pk = list(table.primary_key.columns)[0].name
+    return (
+        f"INSERT INTO change_log (table_name, op, pk, row, committed_at) "
+        f"SELECT '{table_name}', 'upsert', t.\"{pk}\", {_row_json(table, 't')}, {NOW_SQL} "
+        f"FROM \"{table_name}\" AS t ORDER BY t.\"{pk}\""
+    )
+
+
+def install_change_capture(engine=sync_engine):
+    """Create the change-log triggers (primary)
+
+    A table that starts being replicated on a primary that already captures
+    others has its current rows logged too, so followers that bootstrapped
+    earlier catch up with it.
+    """
+    with engine.begin() as conn:
+        installed = set(conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'change_log_%'"
+        ).scalars())
+        for table_name in REPLICATED_TABLES:
+            for statement in change_capture_sql(table_name):
+                conn.exec_driver_sql(statement)
+            if installed and f"change_log_{table_name}_insert" not in installed:
+                conn.exec_driver_sql(backfill_sql(table_name))
+
+
+def remove_change_capture(engine=sync_engine):
+    """Drop the change-log triggers (followers inherit them with the snapshot)"""
+    with engine.begin() as conn:
+        for table_name in REPLICATED_TABLES:
+            for op in ("insert", "update", "delete"):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS change_log_{table_name}_{op}")
+
+
+def head_lsn(conn) -> int:
+    """Last LSN ever issued (survives pruning thanks to AUTOINCREMENT)"""
+    row = conn.exec_driver_sql("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").first()
+    return row[0] if row else 0
+
+
+def serialize_change(change: ChangeLog) -> dict:
+    return {
+        "lsn": change.lsn,
+        "table": change.table_name,
+        "op": change.op,
+        "pk": change.pk,
+        "row": json.loads(change.row) if change.row else None,
+        "committed_at": change.committed_at,
+    }
+
+
+def apply_changes(engine, changes: List[dict]) -> int:
+    """Replay changes in one transaction and advance the applied LSN; returns the new LSN.
+
+    Changes at or below the stored LSN are skipped, so several workers of one
+    follower can poll the same file safely.
+    """
+    with engine.begin() as conn:
+        applied = conn.execute(text("SELECT applied_lsn FROM replication_state WHERE id = 1")).scalar() or 0
+        for change in changes:
+            if change["lsn"] <= applied:
+                continue
+            table = _table(change["table"])
+            pk = list(table.primary_key.columns)[0].name
+            if change["op"] == "delete":
+                conn.exec_driver_sql(f'DELETE FROM "{table.name}" WHERE "{pk}" = ?', (change["pk"],))
+            else:
+                row = {name: value for name, value in change["row"].items() if name in table.c}
+                columns = ", ".join(f'"{name}"' for name in row)
+                placeholders = ", ".join("?" for _ in row)
+                conn.exec_driver_sql(
+                    f'INSERT OR REPLACE INTO "{table.name}" ({columns}) VALUES ({placeholders})',
+                    tuple(row.values())
+                )
+            applied = change["lsn"]
+        conn.execute(
+            text("INSERT OR REPLACE INTO replication_state (id, applied_lsn, updated_at) VALUES (1, :lsn, :now)"),
+            {"lsn": applied, "now": time.time()}
+        )
+    return applied
+
+
+def sqlite_path(url: str) -> str:
+    return make_url(url).database
+
+
+class Follower:
+    """Pulls the primary's change log and replays it into the local database"""
+
+    def __init__(
+        self,
+        primary_url: str = REPLICATION_PRIMARY_URL,
+        token: str = REPLICATION_TOKEN,
+        engine=sync_engine,
+        poll_interval_ms: int = REPLICATION_POLL_INTERVAL_MS,
+        batch_size: int = REPLICATION_BATCH_SIZE,
+        http: Optional["httpx.AsyncClient"] = None
+    ):
+        self.primary_url = primary_url.rstrip("/")
+        self.engine = engine
+        self.poll_interval = poll_interval_ms / 1000
+        self.batch_size = batch_size
+        self._make_http = None
+        if http is None:
+            import httpx
+            self._make_http = lambda: httpx.AsyncClient(
+                base_url=self.primary_url, timeout=30, headers={TOKEN_HEADER: token}
+            )
+            http = self._make_http()
+        self.http = http
+        self.http.headers[TOKEN_HEADER] = token
+        self.bootstrapped = False
+        self.applied_lsn = 0
+        self.head_lsn = 0
+        self.caught_up_at = time.time()
+        self.last_error: Optional[str] = None
+        self.audit_backlog: deque = deque(maxlen=10000)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def lag_seconds(self) -> float:
+        return 0.0 if self.applied_lsn >= self.head_lsn and self.last_error is None \
+            else time.time() - self.caught_up_at
+
+    def status(self) -> dict:
+        return {
+            "role": "follower",
+            "primary": self.primary_url,
+            "applied_lsn": self.applied_lsn,
+            "head_lsn": self.head_lsn,
+            "lag_changes": max(0, self.head_lsn - self.applied_lsn),
+            "lag_seconds": round(self.lag_seconds, 3),
+            "last_error": self.last_error,
+        }
+
+    def redirect_url(self, path: str, query: str = "") -> str:
+        return f"{self.primary_url}{path}" + (f"?{query}" if query else "")
+
+    def _stored_lsn(self) -> Optional[int]:
+        with self.engine.connect() as conn:
+            try:
+                return conn.execute(text("SELECT applied_lsn FROM replication_state WHERE id = 1")).scalar()
+            except Exception:
+                return None
+
+    async def bootstrap(self):
+        """Start from a snapshot of the primary unless this database already follows it"""
+        stored = self._stored_lsn()
+        if stored is not None:
+            self.applied_lsn = self.head_lsn = stored
+            self.bootstrapped = True
+            return
+        path = sqlite_path(str(self.engine.url))
+        response = await self.http.get("/replication/snapshot")
+        response.raise_for_status()
+        snapshot_lsn = int(response.headers[LSN_HEADER])
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".snapshot")
+        with os.fdopen(fd, "wb") as f:
+            f.write(response.content)
+        self.engine.dispose()
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.replace(tmp_path, path)
+
+        remove_change_capture(self.engine)
+        Base.metadata.create_all(bind=self.engine, tables=[ReplicationState.__table__])
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM change_log"))
+            conn.execute(
+                text("INSERT INTO replication_state (id, applied_lsn, updated_at) VALUES (1, :lsn, :now)"),
+                {"lsn": snapshot_lsn, "now": time.time()}
+            )
+        self.applied_lsn = self.head_lsn = snapshot_lsn
+        self.bootstrapped = True
+        print(f"Follower bootstrapped from primary snapshot at LSN {snapshot_lsn}")
+
+    async def release_connections(self):
+        """Close pooled connections to the primary, e.g. before forking workers that must not share them"""
+        if self._make_http is None:
+            return
+        await self.http.aclose()
+        self.http = self._make_http()
+
+    async def poll_once(self) -> int:
+        """Fetch and apply one batch of changes; returns how many were applied"""
+        response = await self.http.get(
+            "/replication/changes", params={"since": self.applied_lsn, "limit": self.batch_size}
+        )
+        if response.status_code == 410:
+            raise ResyncRequired(response.json().get("detail"))
+        response.raise_for_status()
+        payload = response.json()
+        changes = payload["changes"]
+        if changes:
+            self.applied_lsn = await run_in_threadpool(apply_changes, self.engine, changes)
+        self.head_lsn = payload["head_lsn"]
+        self.last_error = None
+        if self.applied_lsn >= self.head_lsn:
+            self.caught_up_at = time.time()
+        REPLICATION_LAG_SECONDS.set(self.lag_seconds)
+        REPLICATION_LAG_CHANGES.set(max(0, self.head_lsn - self.applied_lsn))
+        return len(changes)
+
+    def forward_audit(self, entry: dict):
+        """Queue an audit entry for the primary (followers never write locally)"""
+        self.audit_backlog.append(entry)
+
+    async def flush_audit(self):
+        if not self.audit_backlog:
+            return
+        batch = list(self.audit_backlog)
+        response = await self.http.post("/replication/audit", json=batch)
+        response.raise_for_status()
+        for _ in batch:
+            self.audit_backlog.popleft()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        import httpx
+        try:
+            await self.flush_audit()
+        except httpx.HTTPError as e:
+            print(f"Could not forward {len(self.audit_backlog)} audit entries to the primary: {e}")
+        await self.http.aclose()
+
+    async def _run(self):
+        while True:
+            try:
+                applied = await self.poll_once()
+                await self.flush_audit()
+            except ResyncRequired as e:
+                # The local copy cannot catch up; it needs a fresh snapshot (restart with an empty database)
+                self.last_error = f"Resync required: {e}"
+                print(f"Replication stopped: {self.last_error}")
+                REPLICATION_LAG_SECONDS.set(self.lag_seconds)
+                return
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                REPLICATION_LAG_SECONDS.set(self.lag_seconds)
+                applied = 0
+            # Keep pulling without sleeping while there is a backlog
+            if applied < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+
+def make_query_only(async_engine):
+    """Reject writes on every request connection of a follower"""
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _query_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+async def prune_change_log(retention_seconds: int = REPLICATION_LOG_RETENTION_SECONDS):
+    """Delete change-log entries older than the retention window (primary)"""
+    cutoff = time.time() - retention_seconds
+    await write_lane.submit(
+        lambda session: session.execute(ChangeLog.__table__.delete().where(ChangeLog.committed_at < cutoff))
+    )
+
+
+async def prune_periodically(interval: float = 3600):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await prune_change_log()
+        except Exception as e:
+            print(f"Change log pruning failed: {e}")
+
+
+follower: Optional[Follower] = Follower() if REPLICATION_ROLE == "follower" else None
@@ -0,0 +1,86 @@
+import os
+import secrets
+import sqlite3
+import tempfile
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import FileResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
+
+from config import REPLICATION_ROLE, REPLICATION_TOKEN
+from database import get_db, AuditLog, ChangeLog
+from schemas import AuditLogEntry
+from snapshots import backup_database
+from timing import TimedRoute
+from write_lane import write_lane
+import replication
+
+router = APIRouter(route_class=TimedRoute)
+
+def require_replication_token(x_replication_token: Optional[str] = Header(None)):
+    """Followers authenticate with the shared REPLICATION_TOKEN"""
+    if REPLICATION_ROLE != "primary" or not REPLICATION_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Replication is not enabled")
+    if not x_replication_token or not secrets.compare_digest(x_replication_token, REPLICATION_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid replication token")
+
+@router.get("/changes", dependencies=[Depends(require_replication_token)])
+async def get_changes(since: int = 0, limit: int = 1000, db: AsyncSession = Depends(get_db)):
+    """Committed changes after LSN `since`, oldest first"""
+    conn = await db.connection()
+    head = await conn.run_sync(replication.head_lsn)
+    oldest = await db.scalar(select(ChangeLog.lsn).order_by(ChangeLog.lsn).limit(1))
+    if since < head and (oldest is None or oldest > since + 1):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail=f"Changes after LSN {since} were pruned; take a new snapshot"
+        )
+    changes = (await db.scalars(
+        select(ChangeLog).where(ChangeLog.lsn > since).order_by(ChangeLog.lsn).limit(min(limit, 10000))
+    )).all()
+    return {
+        "changes": [replication.serialize_change(change) for change in changes],
+        "head_lsn": head,
+    }
+
+@router.get("/snapshot", dependencies=[Depends(require_replication_token)])
+async def get_snapshot(db: AsyncSession = Depends(get_db)):
+    """Consistent copy of the database file; X-Replication-LSN is the LSN it contains"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    await backup_database(await db.connection(), path)
+    copy = sqlite3.connect(path)
+    try:
+        row = copy.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    finally:
+        copy.close()
+    return FileResponse(
+        path,
+        media_type="application/vnd.sqlite3",
+        headers={replication.LSN_HEADER: str(row[0] if row else 0)},
+        background=BackgroundTask(os.remove, path)
+    )
+
+@router.post("/audit", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_replication_token)])
+async def receive_follower_audit(entries: List[AuditLogEntry]):
+    """Store audit entries recorded by followers"""
+    rows = [entry.dict() for entry in entries]
+    
+    async def insert_entries(session: AsyncSession):
+        session.add_all(AuditLog(**row) for row in rows)
+    
+    await write_lane.submit(insert_entries)
+    return {"accepted": len(rows)}
+
+@router.get("/status")
+async def replication_status(db: AsyncSession = Depends(get_db)):
+    """Replication role, position and lag of this instance"""
+    if replication.follower is not None:
+        return replication.follower.status()
+    if REPLICATION_ROLE != "primary":
+        return {"role": REPLICATION_ROLE}
+    conn = await db.connection()
+    return {"role": "primary", "head_lsn": await conn.run_sync(replication.head_lsn)}
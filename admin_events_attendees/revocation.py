@@ -0,0 +1,181 @@
+"""
+Access-token revocation checked in memory.
+
+Access JWTs are verified without touching the database, so revoking one
+before its exp needs state every worker can consult cheaply. Logout
+revokes the token's jti, and a password change or deactivation revokes
+every token of the user issued before that moment. Each revocation is a
+row in token_revocations, written in the same commit as the change that
+causes it. Every worker mirrors the table in two dicts: jti -> exp, and
+user id -> cutoff. verify_token() checks them in O(1).
+
+A worker applies its own revocations immediately. It picks up the other
+workers' (and, on a follower, the replicated ones) by reading rows past
+the last id it has seen every REVOCATION_SYNC_INTERVAL_MS. On PostgreSQL
+a lower id can commit after a higher one, so that cursor only moves up to
+the first missing id. Rows past the gap are applied, and read again until
+the gap fills (apply() is idempotent), or until it has stayed open for
+GAP_GRACE_SECONDS and is taken as a rollback or a pruned row. An entry is
+only needed until every token it covers has expired. After that it is
+dropped from memory and the row is pruned, so the working set is the last
+JWT_ACCESS_TOKEN_EXPIRE_MINUTES of revocations.
+
+A Bloom filter in front of the dicts would not save anything here: the
+exact entries have to stay in memory anyway, and a dict lookup is cheaper
+than hashing the jti k times.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import JWT_ACCESS_TOKEN_EXPIRE_MINUTES, REVOCATION_SYNC_INTERVAL_MS
+from database import AsyncSessionLocal, TokenRevocation
+from query_stats import mark_background
+from write_lane import write_lane
+
+PRUNE_INTERVAL_SECONDS = 60
+# Longest a revoking transaction is expected to stay open
+GAP_GRACE_SECONDS = 60
+
+
+def token_entry(jti: str, user_id: int, expires_at: float) -> Dict[str, Any]:
+    """Revocation of one access token"""
+    return {"jti": jti, "user_id": user_id, "issued_before": None, "expires_at": expires_at}
+
+
+def user_entry(user_id: int) -> Dict[str, Any]:
+    """Revocation of every access token the user holds now"""
+    # iat carries sub-second precision, so a login right after this is not caught
+    now = time.time()
+    return {
+        "jti": None, "user_id": user_id, "issued_before": now,
+        "expires_at": now + JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+class RevocationList:
+    """In-memory mirror of token_revocations"""
+
+    def __init__(self, lane=write_lane, sessionmaker=AsyncSessionLocal,
+                 sync_interval_ms: int = REVOCATION_SYNC_INTERVAL_MS):
+        self.lane = lane
+        self.sessionmaker = sessionmaker
+        self.sync_interval = sync_interval_ms / 1000
+        self._tokens: Dict[str, float] = {}
+        self._users: Dict[int, tuple] = {}  # user id -> (cutoff, expires_at)
+        self._last_id = 0  # every id up to this one has been applied
+        self._gap_since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def is_revoked(self, jti: Optional[str], user_id: int, issued_at: Optional[float]) -> bool:
+        """Whether an access token has been revoked; no I/O"""
+        if jti is not None and jti in self._tokens:
+            return True
+        cutoff = self._users.get(user_id)
+        return cutoff is not None and (issued_at or 0) < cutoff[0]
+
+    def record(self, session: AsyncSession, entry: Dict[str, Any]):
+        """Add a revocation to a write unit's transaction; apply() it once committed"""
+        session.add(TokenRevocation(**entry))
+
+    def apply(self, entry: Dict[str, Any]):
+        if entry["expires_at"] <= time.time():
+            return
+        if entry["jti"] is not None:
+            self._tokens[entry["jti"]] = entry["expires_at"]
+        else:
+            cutoff, expires_at = self._users.get(entry["user_id"], (0, 0))
+            self._users[entry["user_id"]] = (
+                max(cutoff, entry["issued_before"]), max(expires_at, entry["expires_at"])
+            )
+
+    async def revoke(self, entry: Dict[str, Any]):
+        """Store a revocation on its own and apply it"""
+        async def unit(session: AsyncSession):
+            self.record(session, entry)
+
+        await self.lane.submit(unit)
+        self.apply(entry)
+
+    async def sync(self) -> int:
+        """Apply revocations committed since the last sync (by any worker); returns how many"""
+        async with self.sessionmaker() as session:
+            # Expired rows are read too: filtering them out would leave gaps in the ids
+            rows = (await session.scalars(
+                select(TokenRevocation).where(TokenRevocation.id > self._last_id).order_by(TokenRevocation.id)
+            )).all()
+        for row in rows:
+            self.apply({
+                "jti": row.jti, "user_id": row.user_id,
+                "issued_before": row.issued_before, "expires_at": row.expires_at,
+            })
+        self._advance([row.id for row in rows])
+        return len(rows)
+
+    def _advance(self, ids: List[int]):
+        """Move the cursor over ids read in order, stopping at a gap that may still commit"""
+        now = time.monotonic()
+        for row_id in ids:
+            # Nothing read yet: lower ids were pruned
+            if self._last_id and row_id != self._last_id + 1:
+                if self._gap_since is None:
+                    self._gap_since = now
+                if now - self._gap_since < GAP_GRACE_SECONDS:
+                    return
+            self._last_id = row_id
+            self._gap_since = None
+
+    def clear(self):
+        """Drop the in-memory entries; rows already synced are not read again"""
+        self._tokens.clear()
+        self._users.clear()
+
+    def forget_expired(self):
+        now = time.time()
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._users = {user_id: entry for user_id, entry in self._users.items() if entry[1] > now}
+
+    async def prune(self) -> int:
+        """Delete rows no token can match any more"""
+        table = TokenRevocation.__table__
+
+        async def unit(session: AsyncSession) -> int:
+            return (await session.execute(table.delete().where(table.c.expires_at < time.time()))).rowcount
+
+        return await self.lane.submit(unit)
+
+    async def start(self, prune: bool = True):
+        """Load current revocations, then follow the table (pruning it unless this is a read-only follower)"""
+        await self.sync()
+        self._task = asyncio.get_running_loop().create_task(self._run(prune))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self, prune: bool):
+        mark_background()
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+                if time.monotonic() - last_prune >= PRUNE_INTERVAL_SECONDS:
+                    last_prune = time.monotonic()
+                    self.forget_expired()
+                    if prune:
+                        await self.prune()
+            except Exception as e:
+                print(f"Revocation sync failed: {e}")
+
+
+revocation_list = RevocationList()
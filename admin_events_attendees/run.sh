@@ -184,6 +184,7 @@ echo "   ✅ Auditoría de acciones"
 echo ""
 echo -e "${YELLOW}🚀 Iniciando servidor...${NC}"
 echo -e "${YELLOW}   (Presiona Ctrl+C para detener)${NC}"
+echo -e "${YELLOW}   (En producción: python3 server.py, un worker por CPU si LOGIN_ATTEMPTS_REDIS_URL es un Redis compartido)${NC}"
 echo ""
 
 # Iniciar el servidor
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, validator, Field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 from enum import Enum
 
 # Authentication schemas
@@ -50,11 +50,51 @@ class TokenData(BaseModel):
     username: Optional[str] = None
     user_id: Optional[int] = None
     scopes: List[str] = []
+    jti: Optional[str] = None
+    expires_at: Optional[float] = None
 
 class RefreshTokenRequest(BaseModel):
     refresh_token: str
 
+# API key schemas
+API_KEY_SCOPES = ["read:attendees", "write:attendees", "delete:attendees", "admin"]
+
+class ApiKeyCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    scopes: List[str] = Field(..., min_items=1)
+    user_id: Optional[int] = None  # defaults to the admin creating the key
+    
+    @validator('scopes')
+    def validate_scopes(cls, v):
+        unknown = set(v) - set(API_KEY_SCOPES)
+        if unknown:
+            raise ValueError(f"Unknown scopes: {', '.join(sorted(unknown))}")
+        return sorted(set(v))
+
+class ApiKeyResponse(BaseModel):
+    id: int
+    name: str
+    prefix: str
+    user_id: int
+    scopes: List[str]
+    created_at: datetime
+    revoked_at: Optional[datetime]
+    
+    @validator('scopes', pre=True)
+    def split_scopes(cls, v):
+        return v.split() if isinstance(v, str) else v
+    
+    class Config:
+        orm_mode = True
+
+class ApiKeyCreated(ApiKeyResponse):
+    key: str  # shown only once
+
 # MFA schemas
+class QRCodeFormat(str, Enum):
+    png = "png"
+    svg = "svg"  # rendered without Pillow
+
 class MFASetupResponse(BaseModel):
     secret: str
     qr_code_url: str
@@ -122,6 +162,26 @@ class AttendeeResponse(AttendeeBase):
     class Config:
         orm_mode = True
 
+class BulkLoadFailure(BaseModel):
+    documents: List[str]  # "DNI - 123"
+    error: str
+
+class BulkLoadResult(BaseModel):
+    inserted: int
+    # Only on 207: shards commit independently, and these rows were not stored
+    failed: Optional[List[BulkLoadFailure]] = None
+
+class AttendeeStats(BaseModel):
+    total: int
+    by_document_type: Dict[str, int]
+    by_gender: Dict[str, int]
+    as_of: datetime
+
+class DuplicateDocument(BaseModel):
+    document_type: Optional[str]
+    document_number: str
+    attendee_ids: List[int]
+
 # Audit log schemas
 class AuditLogResponse(BaseModel):
     id: int
@@ -134,3 +194,22 @@ class AuditLogResponse(BaseModel):
     
     class Config:
         orm_mode = True
+
+class AuditLogEntry(BaseModel):
+    user_id: Optional[int] = None
+    action: str = Field(..., max_length=100)
+    resource: Optional[str] = Field(None, max_length=100)
+    ip_address: Optional[str] = Field(None, max_length=45)
+    user_agent: Optional[str] = None
+    details: Optional[str] = None
+
+# Profiling schemas
+class ProfileInfo(BaseModel):
+    id: str
+    mode: str
+    format: str
+    method: str
+    path: str
+    created_at: float
+    duration_ms: float
+    size_bytes: int
@@ -0,0 +1,42 @@
+"""
+Script para regenerar la caché del esquema de Django (SCHEMA_MODE=django)
+
+Ejecutarlo después de revisar una migración de Django que modifique
+attendees_attendee, attendees_purchase o attendees_ticket. Refleja de nuevo
+las tablas, comprueba que siguen teniendo las columnas que usa el servicio
+y reemplaza DJANGO_SCHEMA_CACHE.
+
+Uso: python scripts/refresh_django_schema.py
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+
+# database.py is not imported: it refuses to load while the cache is stale
+from config import DATABASE_URL, DJANGO_SCHEMA_CACHE
+from django_schema import DJANGO_TABLES, SchemaDriftError, load_django_metadata
+
+def main():
+    print(f"=== Regenerar caché del esquema de Django ({DJANGO_SCHEMA_CACHE}) ===")
+    if os.path.exists(DJANGO_SCHEMA_CACHE):
+        os.remove(DJANGO_SCHEMA_CACHE)
+
+    engine = create_engine(DATABASE_URL)
+    start = time.perf_counter()
+    try:
+        metadata = load_django_metadata(engine, DJANGO_SCHEMA_CACHE)
+    except SchemaDriftError as e:
+        print(f"❌ El esquema no es compatible con el servicio: {e}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+
+    for name in DJANGO_TABLES:
+        print(f"{name}: {len(metadata.tables[name].columns)} columnas")
+    print(f"✅ Caché regenerada en {(time.perf_counter() - start) * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Script para redistribuir los asistentes en un nuevo conjunto de shards
+
+Copia todos los asistentes de la distribución actual (SHARD_URLS, o
+DATABASE_URL si no hay shards) a las bases de destino, que deben estar
+vacías. Detener las escrituras antes de ejecutarlo y, al terminar, cambiar
+SHARD_URLS a las URLs de destino y reiniciar el servicio.
+
+Uso: python scripts/reshard.py sqlite:///./shard-0.db sqlite:///./shard-1.db ...
+"""
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DATABASE_URL, SHARD_URLS
+from sharding import reshard
+
+def main():
+    parser = argparse.ArgumentParser(description="Redistribuir asistentes entre shards")
+    parser.add_argument("targets", nargs="+", help="URLs de las bases de destino, en orden de shard")
+    parser.add_argument("--source", action="append", help="URLs de origen (por defecto SHARD_URLS o DATABASE_URL)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    sources = args.source or SHARD_URLS or [DATABASE_URL]
+    print(f"=== Resharding: {len(sources)} -> {len(args.targets)} shards ===")
+    try:
+        copied = reshard(sources, args.targets, batch_size=args.batch_size)
+    except Exception as e:
+        print(f"Error durante el resharding: {e}")
+        sys.exit(1)
+
+    for index, count in copied.items():
+        print(f"Shard {index} ({args.targets[index]}): {count} asistentes")
+    print(f"✅ Total copiado: {sum(copied.values())} asistentes")
+    print("Actualice SHARD_URLS con las URLs de destino y reinicie el servicio")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Script para rotar la clave de firma de los JWT (JWT_ALGORITHM=ES256)
+
+Añade una clave P-256 nueva a JWT_KEYS_DIR. Tras reiniciar los workers se
+publica en /.well-known/jwks.json enseguida, pero solo empieza a firmar
+cuando han pasado JWT_JWKS_MAX_AGE_SECONDS, de modo que los servicios que
+validan tokens ya la tienen en su caché. Con --retire borra las claves
+más antiguas que la activa que ya no pueden tener tokens vigentes.
+
+Uso: python scripts/rotate_jwt_key.py [--retire]
+"""
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import JWT_ACCESS_TOKEN_EXPIRE_MINUTES, JWT_JWKS_MAX_AGE_SECONDS, JWT_KEYS_DIR
+from signing_keys import generate_key
+
+def retire_old_keys():
+    """Delete keys superseded longer ago than a token lifetime plus a JWKS cache period"""
+    keys = sorted(
+        (os.path.getmtime(os.path.join(JWT_KEYS_DIR, name)), name)
+        for name in os.listdir(JWT_KEYS_DIR) if name.endswith(".pem")
+    )
+    now = time.time()
+    # A key signs from mtime + max-age until the next one takes over
+    signing_from = [mtime + JWT_JWKS_MAX_AGE_SECONDS for mtime, _ in keys]
+    for index, (_, name) in enumerate(keys[:-1]):
+        superseded_at = signing_from[index + 1]
+        if now - superseded_at > JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60:
+            os.remove(os.path.join(JWT_KEYS_DIR, name))
+            print(f"🗑️  Clave retirada: {name[:-len('.pem')]}")
+
+def main():
+    print(f"=== Rotar clave de firma JWT ({JWT_KEYS_DIR}) ===")
+    if "--retire" in sys.argv:
+        retire_old_keys()
+        return
+    kid = generate_key(JWT_KEYS_DIR)
+    print(f"✅ Clave nueva: {kid}")
+    print(f"Reiniciar los workers: firmará a partir de {JWT_JWKS_MAX_AGE_SECONDS} s desde ahora")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Production entry point: pre-forked uvicorn workers sharing one socket.
+
+`python main.py` runs a single process, and reloads on changes while DEBUG
+is on. This runner is meant for deployments:
+
+- The master binds the socket and preloads the app: every module, a
+  follower's bootstrap from the primary's snapshot, the models (with the
+  Django schema, when shared), the schema-version check
+  (done once, not raced by every worker) and the signing keys. It then
+  freezes the heap (gc.freeze) and forks WEB_CONCURRENCY workers, one
+  per CPU by default.
+  Workers start with the code and read-only data already in memory and
+  share those pages copy-on-write.
+- Failed-login counters and used TOTP codes must be shared by the workers
+  (LOGIN_ATTEMPTS_REDIS_URL). With the in-process memory:// store, one per
+  CPU falls back to a single worker and an explicit count above one is
+  refused.
+- Each worker runs the lifespan and serves until it has handled about
+  SERVER_MAX_REQUESTS requests. It then drains and exits, and the master
+  forks a fresh one, which bounds slow leaks. The jitter staggers the
+  restarts.
+- On SIGTERM or SIGINT the master forwards SIGTERM. Each worker stops
+  accepting connections and gives in-flight requests up to
+  SERVER_GRACEFUL_TIMEOUT_SECONDS. The lifespan shutdown then commits the
+  write lane's queue, hands back outbox leases and flushes a follower's
+  audit backlog. A worker still running after that is killed.
+
+Usage:
+    python server.py [--workers N] [--max-requests N]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import signal
+import sys
+import time
+import traceback
+
+import config
+
+# Workers that die faster than this are respawned with a pause (crash loop)
+MIN_WORKER_LIFETIME_SECONDS = 1.0
+# Lifespan shutdown after the drain: commits, lease hand-off, audit flush
+SHUTDOWN_MARGIN_SECONDS = 10
+STARTUP_FAILURE = 3
+
+
+def worker_count(requested: int = 0) -> int:
+    """requested, or one worker per CPU this process may run on"""
+    if requested > 0:
+        return requested
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def per_worker_stores() -> list:
+    """Settings that name an in-process store, which forked workers would not share"""
+    from local_redis import MEMORY_URL
+    return [name for name in ("LOGIN_ATTEMPTS_REDIS_URL",) if getattr(config, name) == MEMORY_URL]
+
+
+def check_shared_state(workers: int, requested: int, allow_per_worker_state: bool = False) -> int:
+    """The worker count to start, given that login lockouts and TOTP replays must be shared
+
+    With the in-process store each worker counts failed logins and used TOTP
+    codes on its own: N workers allow about N times LOGIN_MAX_ATTEMPTS and
+    a code can be replayed on another worker. One per CPU falls back to a
+    single worker; an explicit count above one is refused.
+    """
+    stores = per_worker_stores()
+    if workers <= 1 or not stores or allow_per_worker_state:
+        return workers
+    names = ", ".join(stores)
+    if requested > 0:
+        raise SystemExit(f"{workers} workers need {names} to name a shared Redis server, not memory://")
+    print(f"{names} is memory://; starting a single worker instead of {workers}")
+    return 1
+
+
+def preload():
+    """Import and warm everything workers share, then freeze it for copy-on-write"""
+    # Importing metrics also empties PROMETHEUS_MULTIPROC_DIR, before any worker writes to it
+    from main import app
+    from database import SCHEMA_VERSION, ensure_schema, sync_engine
+    from signing_keys import key_ring
+    import replication
+
+    follower = replication.follower
+    if follower is not None:
+        # The database file is replaced by the primary's snapshot before anything reads it
+        async def bootstrap():
+            await follower.bootstrap()
+            await follower.release_connections()
+
+        asyncio.run(bootstrap())
+    if ensure_schema():
+        print(f"Database schema migrated to version {SCHEMA_VERSION}")
+    key_ring.load()
+    # Pooled connections must not be shared with the forked workers
+    sync_engine.dispose()
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+class Supervisor:
+    """Forks the workers, replaces the ones that exit and drains them on shutdown"""
+
+    def __init__(self, app, sock, workers: int, max_requests: int, max_requests_jitter: int,
+                 graceful_timeout: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.children = {}  # pid -> start time
+        self.stopping = False
+        self.exit_code = 0
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        print(f"Starting {self.workers} workers (pid {os.getpid()})")
+        for _ in range(self.workers):
+            self._spawn()
+        while self.children and not self.stopping:
+            self._reap(respawn=True)
+            time.sleep(0.1)
+        self._drain()
+        return self.exit_code
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            self._serve()
+        self.children[pid] = time.monotonic()
+
+    def _serve(self):
+        """Worker process: serve until recycled or told to stop; never returns"""
+        import uvicorn
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        random.seed()
+        limit = None
+        if self.max_requests > 0:
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        server = uvicorn.Server(uvicorn.Config(
+            self.app,
+            lifespan="on",
+            limit_max_requests=limit,
+            timeout_graceful_shutdown=self.graceful_timeout,
+            access_log=False,  # RequestLoggingMiddleware logs every request
+        ))
+        code = 0
+        try:
+            server.run(sockets=[self.sock])
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            if not server.started:
+                code = STARTUP_FAILURE
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _handle_stop(self, signum, frame):
+        if not self.stopping:
+            print(f"Received {signal.Signals(signum).name}, draining {len(self.children)} workers...")
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self, respawn: bool):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            started = self.children.pop(pid, time.monotonic())
+            self._mark_dead(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if not respawn or self.stopping:
+                continue
+            if code == STARTUP_FAILURE:
+                print(f"Worker {pid} failed to start; shutting down")
+                self.exit_code = STARTUP_FAILURE
+                self._handle_stop(signal.SIGTERM, None)
+                return
+            if code == 0:
+                print(f"Worker {pid} recycled after its request limit")
+            else:
+                print(f"Worker {pid} exited with code {code}; replacing it")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME_SECONDS:
+                time.sleep(MIN_WORKER_LIFETIME_SECONDS)
+            self._spawn()
+
+    def _drain(self):
+        # Also reaches a worker forked while the signal was being handled
+        self._handle_stop(signal.SIGTERM, None)
+        deadline = time.monotonic() + self.graceful_timeout + SHUTDOWN_MARGIN_SECONDS
+        while self.children and time.monotonic() < deadline:
+            self._reap(respawn=False)
+            time.sleep(0.1)
+        for pid in list(self.children):
+            print(f"Worker {pid} did not stop in time; killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self._mark_dead(pid)
+        self.children.clear()
+        print("All workers stopped")
+
+    @staticmethod
+    def _mark_dead(pid: int):
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(pid)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=config.WEB_CONCURRENCY, help="0 = one per CPU")
+    parser.add_argument("--max-requests", type=int, default=config.SERVER_MAX_REQUESTS, help="0 = never recycle")
+    parser.add_argument("--max-requests-jitter", type=int, default=config.SERVER_MAX_REQUESTS_JITTER)
+    parser.add_argument("--graceful-timeout", type=int, default=config.SERVER_GRACEFUL_TIMEOUT_SECONDS)
+    parser.add_argument("--host", default=config.HOST)
+    parser.add_argument("--port", type=int, default=config.PORT)
+    parser.add_argument("--allow-per-worker-state", action="store_true",
+                        help="run several workers with memory:// lockout and TOTP stores (benchmarks, tests)")
+    args = parser.parse_args(argv)
+
+    workers = check_shared_state(worker_count(args.workers), args.workers, args.allow_per_worker_state)
+    # database splits the connection budget by this; it is imported by preload()
+    config.WEB_CONCURRENCY = workers
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    import uvicorn
+    sock = uvicorn.Config(None, host=args.host, port=args.port).bind_socket()
+    app = preload()
+    supervisor = Supervisor(
+        app, sock, workers, args.max_requests, args.max_requests_jitter, args.graceful_timeout
+    )
+    try:
+        return supervisor.run()
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+"""
+Hash-range sharding of attendees.
+
+With SHARD_URLS set, attendees live in those databases instead of
+DATABASE_URL (users, tokens and audit logs stay there). An attendee's shard
+comes from a stable 32-bit hash of (document_type, document_number). The
+hash space is split into len(SHARD_URLS) contiguous ranges, so lookups by
+document and duplicate checks touch one shard. Doubling the shard count
+splits every range in two. Each shard has its own write lane and
+snapshots, so writes to different shards commit in parallel.
+
+Attendee ids are allocated by the shard that creates the row:
+local_sequence * SHARD_ID_STRIDE + shard_index. They stay unique when rows
+move between shards (document changes, resharding). A lookup by id asks
+every shard, because a document change moves the row in two commits
+(copy, then delete) and an interrupted move leaves two copies; the newer
+one wins, here and in reshard().
+
+Routes do not look at the configuration. They take a ShardSessions
+dependency that opens sessions on the shards a request touches. Without
+SHARD_URLS the only "shard" is the regular database with its read/write
+routing, write lane and snapshot service.
+
+Log shipping (replication.py) only covers DATABASE_URL, so followers do not
+see sharded attendees.
+"""
+import asyncio
+import hashlib
+import heapq
+import time
+from contextlib import AsyncExitStack, nullcontext
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import Depends, Request
+from sqlalchemy import Column, Integer, MetaData, Table, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import SHARD_URLS, SNAPSHOT_DIR, WRITE_LANE_ENABLED
+from database import AsyncSessionLocal, Attendee, OutboxEvent, OutboxOffset, create_db_engine, engine, is_sqlite
+from outbox import OutboxRelay, outbox_relay
+from replicas import get_read_db, get_write_db
+from snapshots import SnapshotService, snapshot_session, snapshot_service
+from write_lane import WriteLane, write_lane
+
+# Upper bound on the number of shards; also the id stride
+SHARD_ID_STRIDE = 1024
+
+shard_metadata = MetaData()
+# One row per shard database: its position in SHARD_URLS and its id sequence
+shard_info = Table(
+    "shard_info", shard_metadata,
+    Column("shard", Integer, primary_key=True),
+    Column("shard_count", Integer, nullable=False),
+    Column("next_local_id", Integer, nullable=False),
+)
+
+
+def shard_key(document_type, document_number: str) -> int:
+    """Stable 32-bit hash of a document (Python's hash() changes per process)"""
+    document_type = getattr(document_type, "value", document_type) or "DNI"
+    digest = hashlib.blake2b(f"{document_type}\x1f{document_number}".encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "big")
+
+
+def shard_for_key(key: int, shard_count: int) -> int:
+    """Index of the contiguous hash range that contains `key`"""
+    return key * shard_count >> 32
+
+
+class Shard:
+    """One attendee database with its sessions, write lane, snapshots and outbox"""
+
+    def __init__(self, index: int, engine, sessionmaker, lane: WriteLane, snapshots: SnapshotService,
+                 allocates_ids: bool = True, write_engine=None, outbox: Optional[OutboxRelay] = None):
+        self.index = index
+        self.engine = engine
+        self.write_engine = write_engine or engine
+        self.sessionmaker = sessionmaker
+        self.lane = lane
+        self.snapshots = snapshots
+        self.outbox = outbox or OutboxRelay(lane, sessionmaker, source=f"shard-{index}")
+        self.allocates_ids = allocates_ids
+
+    @classmethod
+    def from_url(cls, index: int, url: str) -> "Shard":
+        shard_engine = create_db_engine(url)
+        # Same split as database.py: the lane owns a single connection on SQLite
+        write_engine = create_db_engine(url, pool_size=1, max_overflow=0) if is_sqlite(url) else shard_engine
+        return cls(
+            index,
+            shard_engine,
+            async_sessionmaker(shard_engine, autoflush=False, expire_on_commit=False),
+            WriteLane(async_sessionmaker(write_engine, autoflush=False, expire_on_commit=False)),
+            SnapshotService(source=shard_engine, directory=f"{SNAPSHOT_DIR}/shard-{index}"),
+            write_engine=write_engine,
+        )
+
+    async def assign_ids(self, session: AsyncSession, rows: List[Dict[str, Any]]):
+        """Give new rows ids from this shard's sequence (call inside the write unit)"""
+        if not self.allocates_ids or not rows:
+            return
+        # UPDATE first: it takes the row lock before the value is read
+        await session.execute(
+            update(shard_info).where(shard_info.c.shard == self.index)
+            .values(next_local_id=shard_info.c.next_local_id + len(rows))
+        )
+        end = await session.scalar(select(shard_info.c.next_local_id).where(shard_info.c.shard == self.index))
+        for local_id, row in enumerate(rows, start=end - len(rows)):
+            row["attendee_id"] = local_id * SHARD_ID_STRIDE + self.index
+
+
+class ShardSet:
+    """The configured shards and the document -> shard mapping"""
+
+    def __init__(self, urls: List[str]):
+        self.sharded = bool(urls)
+        if len(urls) > SHARD_ID_STRIDE:
+            raise ValueError(f"At most {SHARD_ID_STRIDE} shards are supported")
+        if self.sharded:
+            self.shards = [Shard.from_url(index, url) for index, url in enumerate(urls)]
+        else:
+            self.shards = [Shard(
+                0, engine, AsyncSessionLocal, write_lane, snapshot_service, allocates_ids=False, outbox=outbox_relay
+            )]
+
+    def for_document(self, document_type, document_number: str) -> Shard:
+        return self.shards[shard_for_key(shard_key(document_type, document_number), len(self.shards))]
+
+    def for_id(self, attendee_id: int) -> List[Shard]:
+        """Shards to search for an id, the one that allocated it first"""
+        home = attendee_id % SHARD_ID_STRIDE
+        return sorted(self.shards, key=lambda shard: shard.index != home)
+
+    async def start(self):
+        """Create the attendee tables, check each shard's position and start its writer and relay"""
+        if not self.sharded:
+            return
+        for shard in self.shards:
+            async with shard.engine.begin() as conn:
+                await conn.run_sync(Attendee.metadata.create_all, tables=[
+                    Attendee.__table__, OutboxEvent.__table__, OutboxOffset.__table__
+                ])
+                await conn.run_sync(shard_metadata.create_all)
+                row = (await conn.execute(select(shard_info))).first()
+                if row is None:
+                    await conn.execute(insert(shard_info).values(
+                        shard=shard.index, shard_count=len(self.shards), next_local_id=1
+                    ))
+                elif (row.shard, row.shard_count) != (shard.index, len(self.shards)):
+                    raise RuntimeError(
+                        f"{shard.engine.url} is shard {row.shard} of {row.shard_count}, but SHARD_URLS lists it "
+                        f"as shard {shard.index} of {len(self.shards)}; run scripts/reshard.py to change the layout"
+                    )
+            if WRITE_LANE_ENABLED and is_sqlite(str(shard.engine.url)):
+                shard.lane.start()
+            if shard.snapshots.enabled:
+                shard.snapshots.start()
+            await shard.outbox.start()
+
+    async def stop(self):
+        if not self.sharded:
+            return
+        for shard in self.shards:
+            await shard.outbox.stop()
+            await shard.lane.stop()
+            await shard.snapshots.close()
+            await shard.engine.dispose()
+            await shard.write_engine.dispose()
+
+
+class ShardSessions:
+    """The sessions one request holds on the shards it touches, opened on first use"""
+
+    def __init__(self, shards: ShardSet, open_session: Callable[[Shard], Any]):
+        self.shards = shards
+        self._open = open_session
+        self._sessions: Dict[int, AsyncSession] = {}
+        self._stack = AsyncExitStack()
+
+    async def session(self, shard: Shard) -> AsyncSession:
+        if shard.index not in self._sessions:
+            self._sessions[shard.index] = await self._stack.enter_async_context(self._open(shard))
+        return self._sessions[shard.index]
+
+    async def gather(self, query: Callable[[Shard, AsyncSession], Any]) -> list:
+        """Run `query` on every shard concurrently (one session per shard)"""
+        sessions = [await self.session(shard) for shard in self.shards.shards]
+        return await asyncio.gather(*(query(shard, session) for shard, session in zip(self.shards.shards, sessions)))
+
+    async def locate(self, attendee_id: int):
+        """(shard, attendee) for an id, or (None, None)
+
+        A move between shards commits the new copy before it deletes the old
+        one, so an interrupted move can leave both; every shard is asked and
+        the most recently updated copy wins.
+        """
+        shards = self.shards.for_id(attendee_id)
+        sessions = [await self.session(shard) for shard in shards]
+        found = [
+            (shard, attendee)
+            for shard, attendee in zip(shards, await asyncio.gather(*(
+                session.get(Attendee, attendee_id) for session in sessions
+            )))
+            if attendee is not None
+        ]
+        if not found:
+            return None, None
+        if len(found) > 1:
+            print(f"Attendee {attendee_id} has copies on shards {[shard.index for shard, _ in found]}; "
+                  f"serving the newest")
+        return max(found, key=lambda located: located[1].updated_at or located[1].created_at)
+
+    async def rollback(self):
+        for session in self._sessions.values():
+            await session.rollback()
+
+    async def aclose(self):
+        await self._stack.aclose()
+
+
+async def _shard_sessions(open_session):
+    sessions = ShardSessions(shard_set, open_session)
+    try:
+        yield sessions
+    finally:
+        await sessions.aclose()
+
+
+async def get_read_shards(db: AsyncSession = Depends(get_read_db)) -> AsyncIterator[ShardSessions]:
+    """Read sessions per shard (the replica-routed session when not sharded)"""
+    async for sessions in _shard_sessions(lambda shard: shard.sessionmaker() if shard_set.sharded else nullcontext(db)):
+        yield sessions
+
+
+async def get_write_shards(db: AsyncSession = Depends(get_write_db)) -> AsyncIterator[ShardSessions]:
+    """Primary sessions per shard for handlers that write"""
+    async for sessions in _shard_sessions(lambda shard: shard.sessionmaker() if shard_set.sharded else nullcontext(db)):
+        yield sessions
+
+
+async def get_snapshot_shards(request: Request, db: AsyncSession = Depends(get_read_db)) -> AsyncIterator[ShardSessions]:
+    """Snapshot sessions on every shard for long read-only jobs"""
+    async with AsyncExitStack() as stack:
+        opened = {}
+        for shard in shard_set.shards:
+            fallback = shard.sessionmaker() if shard_set.sharded else nullcontext(db)
+            opened[shard.index] = await stack.enter_async_context(snapshot_session(shard.snapshots, request, fallback))
+        # Every shard was copied at its own moment; report the oldest
+        request.state.snapshot_taken_at = min(
+            session.info.get("snapshot_taken_at", time.time()) for session in opened.values()
+        )
+        sessions = ShardSessions(shard_set, lambda shard: nullcontext(opened[shard.index]))
+        yield sessions
+
+
+async def merge_sorted(streams: List[AsyncIterator[Any]], key: Callable[[Any], Any]) -> AsyncIterator[Any]:
+    """Merge async iterators that are each sorted by `key` into one sorted stream"""
+    heap = []
+    for position, stream in enumerate(streams):
+        item = await anext(stream, None)
+        if item is not None:
+            heap.append((key(item), position, item))
+    heapq.heapify(heap)
+    while heap:
+        _, position, item = heap[0]
+        yield item
+        following = await anext(streams[position], None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (key(following), position, following))
+
+
+def reshard(source_urls: List[str], target_urls: List[str], batch_size: int = 1000) -> Dict[int, int]:
+    """Copy every attendee from the source layout into empty target shards; returns rows per target.
+
+    Ids are preserved. Each target's sequence starts above every existing id
+    with its residue, so ids it allocates later cannot collide with copied
+    rows. Writes must be stopped and the outbox relays drained while this
+    runs (outbox events are not copied); switch SHARD_URLS to the targets
+    afterwards.
+    """
+    if not target_urls or len(target_urls) > SHARD_ID_STRIDE:
+        raise ValueError(f"Between 1 and {SHARD_ID_STRIDE} target shards are required")
+    targets = [create_db_engine(url, use_async=False) for url in target_urls]
+    sources = [create_db_engine(url, use_async=False) for url in source_urls]
+    copied = {index: 0 for index in range(len(targets))}
+    max_local: Dict[int, int] = {}
+    try:
+        for target in targets:
+            Attendee.metadata.create_all(target, tables=[Attendee.__table__])
+            shard_metadata.create_all(target)
+            with target.connect() as conn:
+                if conn.execute(select(Attendee.attendee_id).limit(1)).first() is not None:
+                    raise RuntimeError(f"Target shard {target.url} already contains attendees")
+
+        # An interrupted move left copies of an id on two shards: only the newest is copied
+        newest: Dict[int, tuple] = {}  # id -> (last change, source index)
+        duplicated = set()
+        for position, source in enumerate(sources):
+            with source.connect() as conn:
+                stamps = conn.execution_options(yield_per=batch_size).execute(
+                    select(Attendee.attendee_id, Attendee.updated_at, Attendee.created_at)
+                )
+                for attendee_id, updated_at, created_at in stamps:
+                    stamp = (updated_at or created_at, position)
+                    if attendee_id in newest:
+                        duplicated.add(attendee_id)
+                        stamp = max(stamp, newest[attendee_id])
+                    newest[attendee_id] = stamp
+        winners = {attendee_id: newest[attendee_id][1] for attendee_id in duplicated}
+
+        columns = [column.name for column in Attendee.__table__.columns]
+        for position, source in enumerate(sources):
+            with source.connect() as conn:
+                result = conn.execution_options(yield_per=batch_size).execute(
+                    select(Attendee.__table__).order_by(Attendee.attendee_id)
+                )
+                for rows in result.partitions():
+                    batches: Dict[int, list] = {}
+                    for row in rows:
+                        if winners.get(row.attendee_id, position) != position:
+                            continue
+                        record = {name: getattr(row, name) for name in columns}
+                        index = shard_for_key(shard_key(row.document_type, row.document_number), len(targets))
+                        batches.setdefault(index, []).append(record)
+                        residue, local_id = row.attendee_id % SHARD_ID_STRIDE, row.attendee_id // SHARD_ID_STRIDE
+                        max_local[residue] = max(max_local.get(residue, 0), local_id)
+                    for index, records in batches.items():
+                        with targets[index].begin() as target_conn:
+                            target_conn.execute(insert(Attendee.__table__), records)
+                        copied[index] += len(records)
+
+        for index, target in enumerate(targets):
+            with target.begin() as conn:
+                conn.execute(delete(shard_info))
+                conn.execute(insert(shard_info).values(
+                    shard=index, shard_count=len(targets), next_local_id=max_local.get(index, 0) + 1
+                ))
+    finally:
+        for db_engine in sources + targets:
+            db_engine.dispose()
+    return copied
+
+
+shard_set = ShardSet(SHARD_URLS)
@@ -0,0 +1,173 @@
+"""
+JWT signing keys and the JWKS document.
+
+With JWT_ALGORITHM=ES256 access tokens are signed with a P-256 key from
+JWT_KEYS_DIR. Each key is a PKCS#8 PEM file named after its kid, the
+RFC 7638 thumbprint. Tokens carry the kid in their header, and every key
+in the directory is published at /.well-known/jwks.json. The Django
+monolith and gateways can therefore verify tokens offline with the public
+keys.
+
+Rotation overlap: scripts/rotate_jwt_key.py adds a key. Once the workers
+restart, the key is published at once but only signs JWT_JWKS_MAX_AGE_SECONDS
+after its file was written, so every consumer's cached JWKS has it by then.
+JWT_ACTIVE_KID pins the signing key instead. A retired key's file can be
+deleted once the tokens it signed have expired. If the directory is empty
+at startup, a first key is generated.
+
+Signers and verifiers are built once per key. Verified tokens are kept in
+a bounded LRU until they expire, so a client reusing its access token pays
+for the signature check once. HS256 with JWT_SECRET_KEY is still
+available; its JWKS has no keys.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from jose import JWTError, jwk, jwt
+from jose.utils import base64url_encode
+
+from config import (
+    JWT_ACTIVE_KID, JWT_ALGORITHM, JWT_JWKS_MAX_AGE_SECONDS, JWT_KEYS_DIR, JWT_SECRET_KEY,
+    JWT_VERIFIED_CACHE_SIZE
+)
+
+
+def thumbprint(public_jwk: Dict[str, str]) -> str:
+    """RFC 7638 thumbprint of an EC public key, used as its kid"""
+    members = {name: public_jwk[name] for name in ("crv", "kty", "x", "y")}
+    digest = hashlib.sha256(json.dumps(members, separators=(",", ":"), sort_keys=True).encode()).digest()
+    return base64url_encode(digest).decode()
+
+
+def generate_key(directory: str) -> str:
+    """Write a new P-256 signing key to the directory; returns its kid"""
+    pem = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    kid = thumbprint(jwk.construct(pem, "ES256").public_key().to_dict())
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{kid}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    os.replace(tmp_path, os.path.join(directory, f"{kid}.pem"))
+    return kid
+
+
+class KeyRing:
+    """Signing key, verifiers by kid and the JWKS document"""
+
+    def __init__(
+        self,
+        algorithm: str = JWT_ALGORITHM,
+        directory: str = JWT_KEYS_DIR,
+        active_kid: str = JWT_ACTIVE_KID,
+        secret: str = JWT_SECRET_KEY,
+        publish_delay: float = JWT_JWKS_MAX_AGE_SECONDS,
+        cache_size: int = JWT_VERIFIED_CACHE_SIZE,
+    ):
+        self.algorithm = algorithm
+        self.directory = directory
+        self.active_kid = active_kid
+        self.secret = secret
+        self.publish_delay = publish_delay
+        self.cache_size = cache_size
+        self.jwks = b'{"keys":[]}'
+        self._loaded = False
+        self._signers: Dict[str, Any] = {}
+        self._verifiers: Dict[str, Any] = {}
+        self._published_at: Dict[str, float] = {}
+        self._kid: Optional[str] = None
+        self._promote_at: Optional[float] = None
+        self._verified: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    @property
+    def symmetric(self) -> bool:
+        return self.algorithm.startswith("HS")
+
+    def load(self):
+        """Read the key directory (creating a first key if it is empty)"""
+        self._loaded = True
+        if self.symmetric:
+            return
+        if self.algorithm != "ES256":
+            raise ValueError(f"JWT_ALGORITHM {self.algorithm} is not supported (use ES256 or HS256)")
+        os.makedirs(self.directory, exist_ok=True)
+        # Workers starting together must not each generate a different first key
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not self._key_files():
+                kid = generate_key(self.directory)
+                print(f"Generated JWT signing key {kid} in {self.directory}")
+            files = self._key_files()
+        for kid, path in files.items():
+            with open(path, "rb") as f:
+                signer = jwk.construct(f.read(), self.algorithm)
+            self._signers[kid] = signer
+            self._verifiers[kid] = signer.public_key()
+            self._published_at[kid] = os.path.getmtime(path)
+        self.jwks = json.dumps({"keys": [
+            dict(verifier.to_dict(), kid=kid, use="sig") for kid, verifier in sorted(self._verifiers.items())
+        ]}).encode()
+        self._choose_signing_key()
+
+    def _key_files(self) -> Dict[str, str]:
+        return {
+            name[:-len(".pem")]: os.path.join(self.directory, name)
+            for name in os.listdir(self.directory) if name.endswith(".pem")
+        }
+
+    def _choose_signing_key(self):
+        if self.active_kid:
+            if self.active_kid not in self._signers:
+                raise ValueError(f"JWT_ACTIVE_KID {self.active_kid} is not in {self.directory}")
+            self._kid = self.active_kid
+            return
+        # The newest key that every cached JWKS already lists; with none
+        # published long enough (first start), the oldest one
+        now = time.time()
+        by_age = sorted(self._published_at, key=self._published_at.get)
+        ready = [kid for kid in by_age if self._published_at[kid] + self.publish_delay <= now]
+        self._kid = ready[-1] if ready else by_age[0]
+        pending = [self._published_at[kid] + self.publish_delay for kid in by_age if kid not in ready]
+        self._promote_at = min(pending) if pending else None
+
+    def sign(self, claims: Dict[str, Any]) -> str:
+        if not self._loaded:
+            self.load()
+        if self.symmetric:
+            return jwt.encode(claims, self.secret, algorithm=self.algorithm)
+        if self._promote_at is not None and time.time() >= self._promote_at:
+            self._choose_signing_key()
+        return jwt.encode(claims, self._signers[self._kid], algorithm=self.algorithm, headers={"kid": self._kid})
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """Verified claims of a token; raises JWTError"""
+        cached = self._verified.get(token)
+        if cached is not None and cached["exp"] > time.time():
+            self._verified.move_to_end(token)
+            return cached
+        if not self._loaded:
+            self.load()
+        if self.symmetric:
+            key = self.secret
+        else:
+            key = self._verifiers.get(jwt.get_unverified_header(token).get("kid"))
+            if key is None:
+                raise JWTError("Unknown signing key")
+        payload = jwt.decode(token, key, algorithms=[self.algorithm])
+        if "exp" in payload:
+            self._verified[token] = payload
+            if len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        return payload
+
+
+key_ring = KeyRing()
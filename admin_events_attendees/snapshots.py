@@ -0,0 +1,188 @@
+"""
+Point-in-time snapshots for long-running reads (SQLite).
+
+An export or report that reads the live database keeps one read transaction
+open for as long as it runs, often as long as a slow client takes to download
+it. In WAL mode the checkpointer cannot get past that reader, so the WAL keeps
+growing. In rollback-journal mode writers are locked out.
+
+SnapshotService copies the database into SNAPSHOT_DIR with the online backup
+API. The copy holds a read lock only while pages are copied. Heavy read-only
+jobs then get a session on the copy. A copy younger than the freshness bound
+(SNAPSHOT_MAX_AGE_SECONDS) is shared by later jobs, and replaced copies are
+deleted once their last reader releases them.
+
+Every worker keeps its own copies, named after its pid, in the shared
+directory. A worker starting up (server.py forks and recycles them at any
+time) only deletes the copies of processes that are gone.
+
+On other dialects readers already get MVCC snapshots, so snapshot_session
+falls back to a regular session.
+"""
+import asyncio
+import glob
+import os
+import re
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from config import SNAPSHOT_DIR, SNAPSHOT_MAX_AGE_SECONDS
+from database import engine, is_sqlite
+from metrics import SNAPSHOT_REQUESTS, SNAPSHOT_BACKUP_DURATION
+from replicas import is_sticky
+
+SNAPSHOT_NAME = re.compile(r"snapshot-(\d+)-[0-9a-f]+\.db")
+
+
+async def backup_database(conn: AsyncConnection, path: str):
+    """Copy the database behind an aiosqlite connection into `path`"""
+    raw = await conn.get_raw_connection()
+    target = sqlite3.connect(path, check_same_thread=False)
+    try:
+        # One step: a stepped backup restarts whenever a writer commits in between
+        await raw.driver_connection.backup(target)
+        # Leave a single self-contained file that opens read-only
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+class Snapshot:
+    """One backup file and a read-only engine on it"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.taken_at = time.time()
+        self.readers = 0
+        self.retired = False
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///file:{path}?mode=ro&uri=true", poolclass=NullPool)
+        self.sessionmaker = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.taken_at
+
+    async def remove(self):
+        await self.engine.dispose()
+        for suffix in ("", "-journal"):
+            try:
+                os.remove(self.path + suffix)
+            except FileNotFoundError:
+                pass
+
+
+class SnapshotService:
+    """Takes, shares and retires snapshots of the primary database"""
+
+    def __init__(self, source=engine, directory: str = SNAPSHOT_DIR, max_age: float = SNAPSHOT_MAX_AGE_SECONDS):
+        self.source = source
+        self.directory = directory
+        self.max_age = max_age
+        self.current: Optional[Snapshot] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def enabled(self) -> bool:
+        return is_sqlite(str(self.source.url))
+
+    def start(self):
+        """Bind to the running loop and delete copies left behind by processes that have exited"""
+        self._lock = asyncio.Lock()
+        for path in glob.glob(os.path.join(self.directory, "snapshot-*.db*")):
+            owner = SNAPSHOT_NAME.match(os.path.basename(path))
+            if owner is None or process_alive(int(owner.group(1))):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # another worker starting at the same time got it first
+
+    async def close(self):
+        if self.current is not None:
+            self.current.retired = True
+            if self.current.readers == 0:
+                await self.current.remove()
+            self.current = None
+
+    async def acquire(self, max_age: Optional[float] = None) -> Snapshot:
+        """A snapshot at most `max_age` seconds old; release() it when done"""
+        max_age = self.max_age if max_age is None else max_age
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Jobs arriving while a backup runs wait for it instead of taking their own
+        async with self._lock:
+            snapshot = self.current
+            if snapshot is not None and snapshot.age <= max_age:
+                SNAPSHOT_REQUESTS.labels("reused").inc()
+            else:
+                snapshot = await self._take()
+                SNAPSHOT_REQUESTS.labels("taken").inc()
+                previous, self.current = self.current, snapshot
+                if previous is not None:
+                    previous.retired = True
+                    if previous.readers == 0:
+                        await previous.remove()
+            snapshot.readers += 1
+            return snapshot
+
+    async def release(self, snapshot: Snapshot):
+        snapshot.readers -= 1
+        if snapshot.retired and snapshot.readers == 0:
+            await snapshot.remove()
+
+    @asynccontextmanager
+    async def session(self, max_age: Optional[float] = None) -> AsyncIterator[AsyncSession]:
+        """Read-only session on a recent snapshot"""
+        snapshot = await self.acquire(max_age)
+        try:
+            async with snapshot.sessionmaker() as session:
+                session.info["snapshot_taken_at"] = snapshot.taken_at
+                yield session
+        finally:
+            await self.release(snapshot)
+
+    async def _take(self) -> Snapshot:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"snapshot-{os.getpid()}-{uuid.uuid4().hex[:12]}.db")
+        start = time.perf_counter()
+        try:
+            async with self.source.connect() as conn:
+                await backup_database(conn, path)
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        SNAPSHOT_BACKUP_DURATION.observe(time.perf_counter() - start)
+        return Snapshot(path)
+
+
+@asynccontextmanager
+async def snapshot_session(service: SnapshotService, request: Request, fallback) -> AsyncIterator[AsyncSession]:
+    """Session on a recent snapshot of `service`'s database; `fallback` (a session context) where snapshots do not apply"""
+    if not service.enabled:
+        async with fallback as session:
+            yield session
+        return
+    # Clients inside their read-your-writes window must see their own writes
+    async with service.session(0 if is_sticky(request) else None) as session:
+        yield session
+
+
+snapshot_service = SnapshotService()
@@ -0,0 +1,141 @@
+"""Shared fixtures: an isolated SQLite test database plus users and tokens"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from database import Base, get_db, User, Attendee
+from main import app
+from middleware import RateLimitMiddleware
+from auth import auth_service
+from snapshots import snapshot_service
+from write_lane import write_lane
+from outbox import outbox_relay
+from revocation import revocation_list
+from api_keys import api_key_cache
+from admission import admission_controller
+from lockout import login_attempts
+from mfa import mfa_service
+from local_redis import LocalRedis
+
+# Test database
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# The app uses async sessions; every TestClient runs its own event loop, so
+# connections must not be pooled across tests
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def override_get_db():
+    async with AsyncTestingSessionLocal() as db:
+        yield db
+
+app.dependency_overrides[get_db] = override_get_db
+write_lane.session_factory = AsyncTestingSessionLocal
+outbox_relay.sessionmaker = AsyncTestingSessionLocal
+revocation_list.sessionmaker = AsyncTestingSessionLocal
+# Fresh copy for every job: tests read right after writing
+snapshot_service.source = async_engine
+snapshot_service.max_age = 0
+
+@pytest.fixture(scope="session")
+def setup_database():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+def reset_rate_limits():
+    """The middleware stack outlives a TestClient; start each test with an empty rate-limit window"""
+    layer = app.middleware_stack
+    while layer is not None:
+        if isinstance(layer, RateLimitMiddleware):
+            layer.clients.clear()
+        layer = getattr(layer, "app", None)
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        reset_rate_limits()
+        login_attempts.client = LocalRedis()
+        mfa_service.client = LocalRedis()
+        # User ids are reused across tests; so would be their revocations
+        revocation_list.clear()
+        api_key_cache.clear()
+        # Limiters hold futures of the previous test's event loop
+        admission_controller.reset()
+        yield client
+
+@pytest.fixture
+def test_user():
+    db = TestingSessionLocal()
+    hashed_password = auth_service.get_password_hash("testpassword123")
+    user = User(
+        username="testuser",
+        email="test@example.com",
+        hashed_password=hashed_password,
+        is_admin=False
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    yield user
+    
+    # Clean up refresh tokens first to avoid foreign key constraint violation
+    from database import RefreshToken
+    db.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete()
+    db.commit()
+    
+    # Now we can safely delete the user
+    db.delete(user)
+    db.commit()
+    db.close()
+
+@pytest.fixture
+def admin_user():
+    db = TestingSessionLocal()
+    hashed_password = auth_service.get_password_hash("adminpassword123")
+    user = User(
+        username="admin",
+        email="admin@example.com",
+        hashed_password=hashed_password,
+        is_admin=True
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    yield user
+    
+    # Clean up refresh tokens first to avoid foreign key constraint violation
+    from database import RefreshToken
+    db.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete()
+    db.commit()
+    
+    # Now we can safely delete the user
+    db.delete(user)
+    db.commit()
+    db.close()
+
+@pytest.fixture
+def user_token(client, test_user):
+    login_data = {
+        "username": "testuser",
+        "password": "testpassword123"
+    }
+    response = client.post("/auth/login", json=login_data)
+    assert response.status_code == 200
+    token_data = response.json()
+    return token_data["access_token"]
+
+@pytest.fixture
+def admin_token(client, admin_user):
+    login_data = {
+        "username": "admin",
+        "password": "adminpassword123"
+    }
+    response = client.post("/auth/login", json=login_data)
+    assert response.status_code == 200
+    token_data = response.json()
+    return token_data["access_token"]
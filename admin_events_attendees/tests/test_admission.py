@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import replication
+from admission import AdaptiveLimiter, Overloaded, admission_controller, route_class
+
+
+def test_route_classes():
+    assert route_class("GET", "/health") is None
+    assert route_class("POST", "/auth/refresh") is None
+    assert route_class("POST", "/auth/login") == "auth"
+    assert route_class("GET", "/attendees/export") == "bulk"
+    assert route_class("POST", "/attendees/bulk") == "bulk"
+    assert route_class("GET", "/attendees/") == "read"
+    assert route_class("DELETE", "/attendees/7") == "write"
+
+
+def test_queue_admits_in_order_and_sheds_past_its_bounds():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", 1, max_queue=2, queue_timeout=0.2, target_delay=0.05)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert len(limiter.waiters) == 1
+
+        # The slot passes straight to the waiter
+        limiter.release(0.001)
+        await waiter
+        assert limiter.in_flight == 1 and not limiter.waiters
+
+        # Nobody releases: the waiter hits the deadline
+        with pytest.raises(Overloaded) as shed:
+            await limiter.acquire()
+        assert shed.value.reason == "queue_timeout" and shed.value.retry_after >= 1
+        assert not limiter.waiters
+
+        # Once the oldest waiter is past the target delay, new arrivals are shed at once
+        stuck = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.06)
+        with pytest.raises(Overloaded) as shed:
+            await limiter.acquire()
+        assert shed.value.reason == "queue_delay"
+        stuck.cancel()
+        await asyncio.gather(stuck, return_exceptions=True)
+        assert not limiter.waiters and limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_limit_follows_latency():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", 10, tolerance=2.0)
+        limiter.limit = 5.0
+        for _ in range(20):
+            for _ in range(5):
+                await limiter.acquire()
+            for _ in range(5):
+                limiter.release(0.02)
+        assert limiter.limit > 5.0
+        limiter.last_decrease = 0
+        grown = limiter.limit
+        for _ in range(30):
+            await limiter.acquire()
+            limiter.release(0.5)
+        assert limiter.limit < grown
+        assert limiter.limit >= 1
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.usefixtures("setup_database")
+def test_overloaded_class_is_shed_while_priority_routes_pass(client, test_user, user_token, monkeypatch):
+    limiter = admission_controller.limiters["read"]
+    monkeypatch.setattr(limiter, "in_flight", int(limiter.limit))
+    monkeypatch.setattr(limiter, "max_queue", 0)
+
+    response = client.get("/attendees/", headers={"Authorization": f"Bearer {user_token}"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+    assert client.get("/health").status_code == 200
+    login = client.post("/auth/login", json={"username": "testuser", "password": "testpassword123"})
+    assert login.status_code == 200
+    refresh = client.post("/auth/refresh", json={"refresh_token": login.json()["refresh_token"]})
+    assert refresh.status_code == 200
+
+
+@pytest.mark.usefixtures("setup_database")
+def test_follower_redirects_writes_without_taking_a_slot(client, user_token, monkeypatch):
+    monkeypatch.setattr(replication, "follower", replication.Follower(primary_url="http://primary:3000", token="t"))
+    limiter = admission_controller.limiters["write"]
+    monkeypatch.setattr(limiter, "in_flight", int(limiter.limit))
+    monkeypatch.setattr(limiter, "max_queue", 0)
+
+    response = client.delete("/attendees/7", headers={"Authorization": f"Bearer {user_token}"},
+                             follow_redirects=False)
+    assert response.status_code == 307
+    assert limiter.in_flight == int(limiter.limit) and limiter.latency is None
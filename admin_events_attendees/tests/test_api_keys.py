@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import select
+
+from api_keys import api_key_digest
+from conftest import TestingSessionLocal
+from database import ApiKey, Attendee
+from query_stats import assert_max_queries
+
+pytestmark = pytest.mark.usefixtures("setup_database")
+
+ATTENDEE = {
+    "name": "Synced Attendee", "email": "synced@example.com",
+    "document_type": "DNI", "document_number": "APIKEY-001", "phone_number": "555-0400"
+}
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def create_key(client, admin_token, test_user):
+    created = []
+
+    def create(scopes, user_id=None):
+        response = client.post(
+            "/auth/api-keys", headers=bearer(admin_token),
+            json={"name": "django-sync", "scopes": scopes, "user_id": user_id or test_user.id}
+        )
+        assert response.status_code == 201
+        created.append(response.json()["id"])
+        return response.json()
+
+    yield create
+    with TestingSessionLocal() as db:
+        db.query(ApiKey).filter(ApiKey.id.in_(created)).delete()
+        db.commit()
+
+
+def test_only_the_digest_is_stored(create_key):
+    created = create_key(["read:attendees"])
+    assert created["key"].startswith("ak_") and created["scopes"] == ["read:attendees"]
+    with TestingSessionLocal() as db:
+        stored = db.get(ApiKey, created["id"])
+    assert stored.key_digest == api_key_digest(created["key"])
+    assert created["key"] not in (stored.key_digest, stored.prefix)
+
+
+def test_cached_key_skips_the_user_query(client, create_key, test_user):
+    key = create_key(["read:attendees", "write:attendees"])["key"]
+    assert client.post("/attendees/", json=ATTENDEE, headers=bearer(key)).status_code == 201
+    # The key and its user are cached: listing costs the list queries only
+    with assert_max_queries(2):
+        response = client.get("/attendees/", headers=bearer(key))
+    assert response.status_code == 200
+    assert [a["document_number"] for a in response.json()] == ["APIKEY-001"]
+    with TestingSessionLocal() as db:
+        db.query(Attendee).filter(Attendee.document_number == "APIKEY-001").delete()
+        db.commit()
+
+
+def test_key_scopes_are_enforced(client, create_key, admin_user):
+    read_only = create_key(["read:attendees"])["key"]
+    assert client.post("/attendees/", json=ATTENDEE, headers=bearer(read_only)).status_code == 403
+    # Not a login session: no password, MFA or logout routes
+    assert client.post("/auth/mfa/setup", headers=bearer(read_only)).status_code == 403
+    # An admin-owned key still needs the admin scope for admin routes
+    admin_owned = create_key(["read:attendees"], user_id=admin_user.id)["key"]
+    assert client.get("/auth/users", headers=bearer(admin_owned)).status_code == 403
+    admin_key = create_key(["admin"], user_id=admin_user.id)["key"]
+    assert client.get("/auth/users", headers=bearer(admin_key)).status_code == 200
+
+
+def test_revoked_key_is_rejected(client, admin_token, create_key):
+    created = create_key(["read:attendees"])
+    assert client.get("/attendees/", headers=bearer(created["key"])).status_code == 200
+    response = client.delete(f"/auth/api-keys/{created['id']}", headers=bearer(admin_token))
+    assert response.status_code == 200
+    assert client.get("/attendees/", headers=bearer(created["key"])).status_code == 401
+    listed = client.get("/auth/api-keys", headers=bearer(admin_token)).json()
+    assert [k["revoked_at"] is not None for k in listed if k["id"] == created["id"]] == [True]
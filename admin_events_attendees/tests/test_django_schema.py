@@ -0,0 +1,134 @@
+import json
+
+import pytest
+import sqlalchemy
+from sqlalchemy import MetaData, create_engine, text
+from sqlalchemy.orm import Session, declarative_base
+
+import django_schema
+from django_schema import SchemaDriftError, attendee_table, load_django_metadata
+
+# Tables as Django's migrations create them (no server-side defaults)
+DJANGO_DDL = [
+    'CREATE TABLE "attendees_attendee" ("attendee_id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, '
+    '"name" varchar(255) NOT NULL, "email" varchar(254) NOT NULL, "document_type" varchar(50) NOT NULL, '
+    '"document_number" varchar(100) NOT NULL, "phone_number" varchar(100) NOT NULL, "address" varchar(255) NULL, '
+    '"date_of_birth" datetime NULL, "gender" varchar(1) NULL, '
+    '"created_at" datetime NOT NULL, "updated_at" datetime NOT NULL)',
+    'CREATE TABLE "attendees_purchase" ("id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, '
+    '"amount" decimal NOT NULL, "attendee_id" integer NOT NULL REFERENCES "attendees_attendee" ("attendee_id"))',
+    'CREATE TABLE "attendees_ticket" ("id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, '
+    '"code" varchar(50) NOT NULL UNIQUE, "attendee_id" integer NOT NULL REFERENCES "attendees_attendee" ("attendee_id"))',
+    'CREATE INDEX "attendees_purchase_attendee_id_idx" ON "attendees_purchase" ("attendee_id")',
+]
+
+
+@pytest.fixture
+def django_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/django.db")
+    with engine.begin() as conn:
+        for statement in DJANGO_DDL:
+            conn.execute(text(statement))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "django_schema.cache")
+
+
+def test_cold_start_loads_the_cached_metadata(django_db, cache_path, monkeypatch):
+    metadata = load_django_metadata(django_db, cache_path)
+    assert set(metadata.tables) == set(django_schema.DJANGO_TABLES)
+    with open(cache_path, "rb") as f:
+        header = json.loads(f.readline())
+    assert header["format"] == django_schema.CACHE_FORMAT
+    assert set(header["tables"]) == set(django_schema.DJANGO_TABLES)
+
+    def reflect(*args, **kwargs):
+        raise AssertionError("the schema should come from the cache")
+
+    monkeypatch.setattr(MetaData, "reflect", reflect)
+    cached = load_django_metadata(django_db, cache_path)
+    assert [c.name for c in cached.tables["attendees_attendee"].columns] == \
+        [c.name for c in metadata.tables["attendees_attendee"].columns]
+    assert cached.tables["attendees_ticket"].c.attendee_id.foreign_keys
+    for name, table in metadata.tables.items():
+        for column in table.columns:
+            rebuilt = cached.tables[name].c[column.name]
+            assert type(rebuilt.type) is type(column.type)
+            assert (rebuilt.nullable, rebuilt.primary_key) == (column.nullable, column.primary_key)
+    assert cached.tables["attendees_attendee"].c.name.type.length == 255
+
+
+def test_cache_naming_other_callables_is_rebuilt(django_db, cache_path, monkeypatch):
+    load_django_metadata(django_db, cache_path)
+    with open(cache_path) as f:
+        header, payload = f.read().split("\n", 1)
+    tables = json.loads(payload)
+    tables["attendees_ticket"][0]["type"] = "os:system"
+    with open(cache_path, "w") as f:
+        f.write(header + "\n" + json.dumps(tables))
+
+    calls = []
+    monkeypatch.setattr("os.system", lambda *args: calls.append(args))
+    metadata = load_django_metadata(django_db, cache_path)
+    assert not calls
+    assert type(metadata.tables["attendees_ticket"].c.id.type).__name__ == "INTEGER"
+    with open(cache_path) as f:
+        assert "os:system" not in f.read()
+
+
+def test_schema_drift_refuses_to_load(django_db, cache_path):
+    load_django_metadata(django_db, cache_path)
+    with django_db.begin() as conn:
+        conn.execute(text('ALTER TABLE "attendees_ticket" ADD COLUMN "seat" varchar(10) NULL'))
+
+    with pytest.raises(SchemaDriftError, match=r"\(attendees_ticket\).*refresh_django_schema"):
+        load_django_metadata(django_db, cache_path)
+
+
+def test_missing_column_is_rejected_and_not_cached(tmp_path, cache_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        conn.execute(text(DJANGO_DDL[0].replace(', "gender" varchar(1) NULL', "")))
+        for statement in DJANGO_DDL[1:]:
+            conn.execute(text(statement))
+
+    with pytest.raises(SchemaDriftError, match="lacks columns: gender"):
+        load_django_metadata(engine, cache_path)
+    engine.dispose()
+    with pytest.raises(FileNotFoundError):
+        open(cache_path)
+
+
+def test_cache_of_another_sqlalchemy_version_is_rebuilt(django_db, cache_path, monkeypatch):
+    load_django_metadata(django_db, cache_path)
+    monkeypatch.setattr(sqlalchemy, "__version__", "0.0.0")
+    reflected = []
+    original = MetaData.reflect
+
+    def reflect(self, *args, **kwargs):
+        reflected.append(True)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(MetaData, "reflect", reflect)
+    load_django_metadata(django_db, cache_path)
+    assert reflected
+    with open(cache_path, "rb") as f:
+        assert json.loads(f.readline())["sqlalchemy"] == "0.0.0"
+
+
+def test_mapped_attendee_gets_django_defaults(django_db, cache_path):
+    Base = declarative_base()
+
+    class DjangoAttendee(Base):
+        __table__ = attendee_table(load_django_metadata(django_db, cache_path))
+
+    with Session(django_db) as session:
+        attendee = DjangoAttendee(name="Ana", email="ana@example.com", document_number="1", phone_number="555")
+        session.add(attendee)
+        session.commit()
+        assert attendee.document_type == "DNI"
+        assert attendee.created_at is not None and attendee.updated_at is not None
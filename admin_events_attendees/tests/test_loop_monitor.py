@@ -0,0 +1,37 @@
+import asyncio
+import time
+from loop_monitor import LoopLagMonitor
+
+def blocking_handler():
+    time.sleep(0.3)
+
+class TestLoopLagMonitor:
+    """Test event-loop stall detection"""
+    
+    def test_blocking_call_is_reported_with_stack(self):
+        monitor = LoopLagMonitor(interval_ms=10, threshold_ms=100)
+        
+        async def scenario():
+            monitor.start()
+            await asyncio.sleep(0.05)
+            blocking_handler()
+            await asyncio.sleep(0.05)
+            await monitor.stop()
+        
+        asyncio.run(scenario())
+        assert len(monitor.stalls) == 1
+        stall = monitor.stalls[0]
+        assert stall["lag_ms"] >= 200
+        assert stall["location"] == "tests/test_loop_monitor.py:blocking_handler"
+        assert "time.sleep(0.3)" in stall["stack"]
+    
+    def test_idle_loop_reports_nothing(self):
+        monitor = LoopLagMonitor(interval_ms=10, threshold_ms=100)
+        
+        async def scenario():
+            monitor.start()
+            await asyncio.sleep(0.1)
+            await monitor.stop()
+        
+        asyncio.run(scenario())
+        assert len(monitor.stalls) == 0
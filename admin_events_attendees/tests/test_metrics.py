@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from main import app
+
+client = TestClient(app)
+
+class TestMetrics:
+    """Test the Prometheus metrics endpoint"""
+    
+    def test_metrics_exposition_format(self):
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "http_requests_in_flight" in response.text
+        assert "db_pool_checkout_wait_seconds" in response.text
+    
+    def test_request_latency_uses_route_template(self):
+        client.get("/health")
+        client.get("/does-not-exist")
+        body = client.get("/metrics").text
+        assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in body
+        assert 'route="unmatched",status="404"' in body
+        assert "/does-not-exist" not in body
+
+
+def test_multiprocess_dir_is_emptied_by_its_first_process(tmp_path):
+    env = dict(
+        os.environ,
+        PROMETHEUS_MULTIPROC_DIR=str(tmp_path),
+        PYTHONPATH=os.pathsep.join(
+            os.path.abspath(path) for path in os.environ.get("PYTHONPATH", "").split(os.pathsep) if path
+        ),
+    )
+    env.pop("PROMETHEUS_MULTIPROC_OWNER", None)
+
+    def start(**extra):
+        (tmp_path / "counter_999999.db").write_bytes(b"")
+        subprocess.run([sys.executable, "-c", "import metrics"], env=dict(env, **extra),
+                       cwd=Path(__file__).parents[1], check=True)
+        return (tmp_path / "counter_999999.db").exists()
+
+    # A stale file from an earlier run is deleted; a worker of the owner keeps the files
+    assert not start()
+    assert start(PROMETHEUS_MULTIPROC_OWNER="1")
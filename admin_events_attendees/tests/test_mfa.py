@@ -0,0 +1,71 @@
+import asyncio
+import base64
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pyotp
+import pytest
+
+import auth_routes
+from conftest import TestingSessionLocal
+from database import User
+from local_redis import LocalRedis
+from mfa import MFAService
+
+
+def test_code_is_accepted_once_per_user():
+    service = MFAService(LocalRedis())
+    secret = pyotp.random_base32()
+    code = pyotp.TOTP(secret).now()
+
+    async def scenario():
+        return [
+            await service.verify_mfa_code(1, secret, code),
+            await service.verify_mfa_code(1, secret, code),
+            await service.verify_mfa_code(2, secret, code),
+            await service.verify_mfa_code(1, secret, "000000" if code != "000000" else "111111"),
+        ]
+
+    assert asyncio.run(scenario()) == [True, False, True, False]
+
+
+def test_previous_step_is_still_accepted():
+    service = MFAService(LocalRedis())
+    secret = pyotp.random_base32()
+    totp = pyotp.TOTP(secret)
+    now = time.time()
+    assert service.matching_step(secret, totp.at(now - totp.interval), now) == int(now // totp.interval) - 1
+    assert service.matching_step(secret, totp.at(now - 3 * totp.interval), now) == -1
+
+
+@pytest.mark.usefixtures("setup_database")
+def test_setup_returns_svg_and_codes_cannot_be_replayed(client, user_token, test_user, monkeypatch):
+    monkeypatch.setattr(auth_routes, "MFA_ENABLED", True)
+    headers = {"Authorization": f"Bearer {user_token}"}
+
+    response = client.post("/auth/mfa/setup?qr_format=svg", headers=headers)
+    assert response.status_code == 200
+    prefix, _, encoded = response.json()["qr_code_url"].partition(",")
+    assert prefix == "data:image/svg+xml;base64"
+    assert base64.b64decode(encoded).lstrip().startswith(b"<?xml")
+
+    code = {"mfa_code": pyotp.TOTP(response.json()["secret"]).now()}
+    assert client.post("/auth/mfa/verify", json=code, headers=headers).status_code == 200
+    # The code that enabled MFA cannot be used again (here, to log in)
+    response = client.post("/auth/login", json={"username": "testuser", "password": "testpassword123", **code})
+    assert response.status_code == 401
+    with TestingSessionLocal() as db:
+        user = db.get(User, test_user.id)
+        user.mfa_enabled, user.mfa_secret = False, None
+        db.commit()
+
+
+def test_qrcode_is_not_imported_at_startup():
+    check = "import sys, main; print('qrcode' in sys.modules, 'PIL' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", check], cwd=Path(__file__).parents[1], capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-2:] == ["False", "False"]
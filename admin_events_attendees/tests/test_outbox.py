@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+
+import httpx
+import pytest
+from sqlalchemy import delete, select
+
+from conftest import AsyncTestingSessionLocal, TestingSessionLocal
+from database import OutboxEvent, OutboxOffset
+from local_redis import LocalRedis
+from outbox import (
+    SIGNATURE_HEADER, EventBus, OutboxRelay, RedisStreamSubscriber, WebhookSubscriber, event_bus
+)
+from write_lane import WriteLane
+
+pytestmark = pytest.mark.usefixtures("setup_database")
+
+
+def attendee(number):
+    return {
+        "name": f"Outbox {number}", "email": f"outbox{number}@example.com",
+        "document_type": "DNI", "document_number": f"OUTBOX-{number}", "phone_number": "555-0300"
+    }
+
+
+@pytest.fixture
+def empty_outbox():
+    with TestingSessionLocal() as db:
+        db.execute(delete(OutboxEvent))
+        db.execute(delete(OutboxOffset))
+        db.commit()
+
+
+def outbox_rows():
+    with TestingSessionLocal() as db:
+        return [(row.event_type, row.aggregate_id) for row in db.scalars(select(OutboxEvent).order_by(OutboxEvent.id))]
+
+
+def add_events(count, start=0):
+    with TestingSessionLocal() as db:
+        db.add_all(
+            OutboxEvent(
+                event_type="attendee.created", aggregate_id=number,
+                payload=json.dumps({"attendee_id": number}), created_at=time.time()
+            )
+            for number in range(start, start + count)
+        )
+        db.commit()
+
+
+def relay(subscribers, **kwargs):
+    return OutboxRelay(WriteLane(AsyncTestingSessionLocal), AsyncTestingSessionLocal, subscribers=subscribers, **kwargs)
+
+
+def test_write_paths_record_events_in_their_transaction(empty_outbox, client, user_token, admin_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    created = client.post("/attendees/", json=attendee(1), headers=headers).json()
+    assert client.post("/attendees/", json=attendee(1), headers=headers).status_code == 400
+    client.put(f"/attendees/{created['attendee_id']}", json={"name": "Renamed"}, headers=headers)
+    bulk = client.post("/attendees/bulk", json=[attendee(2), attendee(3)], headers=headers)
+    assert bulk.json() == {"inserted": 2}
+    client.delete(f"/attendees/{created['attendee_id']}", headers={"Authorization": f"Bearer {admin_token}"})
+
+    rows = outbox_rows()
+    assert [event_type for event_type, _ in rows] == [
+        "attendee.created", "attendee.updated", "attendee.created", "attendee.created", "attendee.deleted"
+    ]
+    assert rows[0][1] == rows[1][1] == rows[4][1] == created["attendee_id"]
+    with TestingSessionLocal() as db:
+        update = db.scalars(select(OutboxEvent).where(OutboxEvent.event_type == "attendee.updated")).one()
+    assert json.loads(update.payload)["name"] == "Renamed"
+
+
+def test_bus_receives_committed_changes(empty_outbox, client, user_token):
+    received = []
+
+    async def handler(events):
+        received.extend(events)
+
+    event_bus.subscribe(handler)
+    try:
+        created = client.post(
+            "/attendees/", json=attendee(10), headers={"Authorization": f"Bearer {user_token}"}
+        ).json()
+        deadline = time.time() + 5
+        while not received and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        event_bus.unsubscribe(handler)
+    assert [(e["type"], e["attendee_id"]) for e in received] == [("attendee.created", created["attendee_id"])]
+    assert received[0]["data"]["document_number"] == "OUTBOX-10"
+
+
+def test_failed_batches_are_redelivered_in_order(empty_outbox):
+    add_events(5)
+    requests = []
+    answers = iter([500, 200, 200])
+
+    def webhook(request):
+        requests.append(request)
+        return httpx.Response(next(answers))
+
+    subscriber = WebhookSubscriber(
+        "http://consumer/events", secret="s3cret", http=httpx.AsyncClient(transport=httpx.MockTransport(webhook))
+    )
+    outbox = relay([subscriber], batch_size=3, poll_interval_ms=0)
+
+    async def scenario():
+        assert await outbox.relay_once() == 0  # 500: the offset stays put
+        assert await outbox.relay_once() == 3
+        assert await outbox.relay_once() == 2
+
+    asyncio.run(scenario())
+    batches = [[e["attendee_id"] for e in json.loads(r.content)["events"]] for r in requests]
+    assert batches == [[0, 1, 2], [0, 1, 2], [3, 4]]
+    signature = hmac.new(b"s3cret", requests[0].content, hashlib.sha256).hexdigest()
+    assert requests[0].headers[SIGNATURE_HEADER] == f"sha256={signature}"
+    with TestingSessionLocal() as db:
+        last_id = db.scalar(select(OutboxEvent.id).order_by(OutboxEvent.id.desc()).limit(1))
+        assert db.get(OutboxOffset, subscriber.name).delivered_id == last_id
+
+
+def test_workers_share_a_durable_subscriber_through_its_lease(empty_outbox):
+    add_events(4)
+    stream = LocalRedis()
+    first = relay([RedisStreamSubscriber(stream, "attendees")])
+    second = relay([RedisStreamSubscriber(stream, "attendees")])
+
+    async def scenario():
+        assert await first.relay_once() == 4
+        add_events(2, start=4)
+        assert await second.relay_once() == 0  # the first relay holds the lease
+        # The first worker died without releasing it
+        with TestingSessionLocal() as db:
+            db.get(OutboxOffset, "redis:attendees").leased_until = 0
+            db.commit()
+        assert await second.relay_once() == 2
+
+    asyncio.run(scenario())
+    entries = asyncio.run(stream.xrange("attendees"))
+    assert [json.loads(fields["event"])["attendee_id"] for _, fields in entries] == list(range(6))
+
+
+def test_prune_keeps_undelivered_events(empty_outbox):
+    add_events(3)
+    stream = LocalRedis()
+    outbox = relay([EventBus(), RedisStreamSubscriber(stream, "attendees")], batch_size=2, retention_seconds=0)
+
+    async def scenario():
+        assert await outbox.prune() == 0  # the stream has not received anything
+        await outbox.relay_once()
+        return await outbox.prune()
+
+    assert asyncio.run(scenario()) == 2
+    assert [attendee_id for _, attendee_id in outbox_rows()] == [2]
+
+
+def test_relay_waits_for_ids_that_commit_out_of_order(empty_outbox):
+    add_events(1)
+    with TestingSessionLocal() as db:
+        first = db.scalar(select(OutboxEvent.id))
+
+    def add_event(event_id, created_at=None):
+        with TestingSessionLocal() as db:
+            db.add(OutboxEvent(
+                id=event_id, event_type="attendee.created", aggregate_id=event_id,
+                payload=json.dumps({"attendee_id": event_id}), created_at=created_at or time.time()
+            ))
+            db.commit()
+
+    received = []
+    bus = EventBus()
+
+    @bus.subscribe
+    async def handler(events):
+        received.extend(event["id"] for event in events)
+
+    outbox = relay([bus], gap_grace_seconds=30)
+
+    async def scenario():
+        assert await outbox.relay_once() == 1
+        # first + 2 commits while first + 1 is still open
+        add_event(first + 2)
+        assert await outbox.relay_once() == 0
+        add_event(first + 1)
+        assert await outbox.relay_once() == 2
+        # first + 3 was rolled back long enough ago
+        add_event(first + 4, created_at=time.time() - 60)
+        assert await outbox.relay_once() == 1
+
+    asyncio.run(scenario())
+    assert received == [first, first + 1, first + 2, first + 4]
@@ -0,0 +1,47 @@
+import pstats
+import pytest
+from profiling import profile_store
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profile_store, "directory", str(tmp_path))
+    return tmp_path
+
+class TestProfiling:
+    """Test on-demand request profiling"""
+    
+    def test_admin_can_request_cprofile(self, client, admin_token, profile_dir, setup_database):
+        headers = {"Authorization": f"Bearer {admin_token}", "X-Profile": "cprofile"}
+        response = client.get("/auth/me", headers=headers)
+        assert response.status_code == 200
+        profile_id = response.headers["X-Profile-Id"]
+        
+        listing = client.get("/auth/profiles", headers={"Authorization": f"Bearer {admin_token}"})
+        assert listing.status_code == 200
+        assert listing.json()[0]["id"] == profile_id
+        assert listing.json()[0]["format"] == "pstats"
+        
+        download = client.get(f"/auth/profiles/{profile_id}", headers={"Authorization": f"Bearer {admin_token}"})
+        assert download.status_code == 200
+        stats_file = profile_dir / "downloaded.pstats"
+        stats_file.write_bytes(download.content)
+        assert pstats.Stats(str(stats_file)).total_calls > 0
+    
+    def test_sampling_mode_produces_collapsed_stacks(self, client, admin_token, profile_dir):
+        headers = {"Authorization": f"Bearer {admin_token}", "X-Profile": "sample"}
+        profile_id = client.get("/auth/me", headers=headers).headers["X-Profile-Id"]
+        assert (profile_dir / f"{profile_id}.collapsed").exists()
+    
+    def test_non_admin_header_is_ignored(self, client, user_token, profile_dir):
+        headers = {"Authorization": f"Bearer {user_token}", "X-Profile": "cprofile"}
+        response = client.get("/auth/me", headers=headers)
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response.headers
+        assert list(profile_dir.iterdir()) == []
+    
+    def test_ring_is_bounded(self, client, admin_token, profile_dir, monkeypatch):
+        monkeypatch.setattr(profile_store, "max_profiles", 2)
+        headers = {"Authorization": f"Bearer {admin_token}", "X-Profile": "sample"}
+        for _ in range(4):
+            client.get("/health", headers=headers)
+        assert len(profile_store.list_profiles()) == 2
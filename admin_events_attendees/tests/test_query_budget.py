@@ -0,0 +1,70 @@
+import pytest
+from query_stats import assert_max_queries, parameter_shape
+
+# Maximum SQL statements per endpoint. Raise a budget only together with the
+# change that legitimately needs the extra query.
+ATTENDEE = {
+    "name": "Budget Test",
+    "email": "budget@example.com",
+    "document_type": "DNI",
+    "document_number": "BUDGET-001",
+    "phone_number": "555-0000"
+}
+
+pytestmark = pytest.mark.usefixtures("setup_database")
+
+class TestQueryBudget:
+    """Fail when an endpoint starts issuing more queries than expected"""
+    
+    def test_me_budget(self, client, user_token):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        with assert_max_queries(1):
+            response = client.get("/auth/me", headers=headers)
+        assert response.status_code == 200
+    
+    def test_create_attendee_budget(self, client, user_token):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        # 6th statement: the outbox event written with the attendee
+        with assert_max_queries(6):
+            response = client.post("/attendees/", json=ATTENDEE, headers=headers)
+        assert response.status_code == 201
+    
+    def test_refresh_budget(self, client, test_user):
+        login = client.post("/auth/login", json={"username": "testuser", "password": "testpassword123"})
+        # Token and user in one SELECT, then the rotation's UPDATE and INSERT
+        with assert_max_queries(3):
+            response = client.post("/auth/refresh", json={"refresh_token": login.json()["refresh_token"]})
+        assert response.status_code == 200
+    
+    def test_list_attendees_budget(self, client, user_token):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        with assert_max_queries(3):
+            response = client.get("/attendees/", headers=headers)
+        assert response.status_code == 200
+    
+    def test_budget_violation_is_reported(self, client, user_token):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        with pytest.raises(AssertionError, match="Query budget exceeded"):
+            with assert_max_queries(0):
+                client.get("/auth/me", headers=headers)
+
+class TestServerTiming:
+    """Test per-request SQL accounting headers"""
+    
+    def test_db_server_timing_header(self, client, user_token):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.get("/auth/me", headers=headers)
+        assert 'db;dur=' in response.headers["Server-Timing"]
+        assert 'desc="1 queries"' in response.headers["Server-Timing"]
+    
+    def test_phase_breakdown(self, client, user_token):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.get("/attendees/", headers=headers)
+        phases = [entry.split(";")[0].strip() for entry in response.headers["Server-Timing"].split(",")]
+        for name in ("middleware", "token", "user", "audit", "serialize", "app", "db", "total"):
+            assert name in phases
+    
+    def test_parameter_shape_hides_values(self):
+        assert parameter_shape({"username": "secret", "id": 3}) == "{username: str, id: int}"
+        assert parameter_shape(("secret", 3)) == "(str, int)"
+        assert parameter_shape([("a",), ("b",)], executemany=True) == "2 x (str)"
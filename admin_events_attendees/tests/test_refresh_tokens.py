@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+import asyncio
+import pytest
+from sqlalchemy import create_engine, func, inspect, select, text
+
+from conftest import TestingSessionLocal
+from database import AuditLog, RefreshToken, migrate_refresh_token_digests
+from refresh_tokens import sweep_refresh_tokens, token_digest
+
+pytestmark = pytest.mark.usefixtures("setup_database")
+
+LOGIN = {"username": "testuser", "password": "testpassword123"}
+
+
+def refresh(client, token):
+    return client.post("/auth/refresh", json={"refresh_token": token})
+
+
+def test_only_the_digest_is_stored(client, test_user):
+    token = client.post("/auth/login", json=LOGIN).json()["refresh_token"]
+    with TestingSessionLocal() as db:
+        stored = db.scalars(select(RefreshToken.token_hash).where(RefreshToken.user_id == test_user.id)).all()
+    assert stored == [token_digest(token)]
+    assert len(stored[0]) == 64 and token not in stored[0]
+
+
+def test_refresh_rotates_and_detects_reuse(client, test_user):
+    first = client.post("/auth/login", json=LOGIN).json()["refresh_token"]
+    rotated = refresh(client, first)
+    assert rotated.status_code == 200
+    second = rotated.json()["refresh_token"]
+    assert second != first
+    assert refresh(client, second).status_code == 200
+
+    # The first token was copied: presenting it again ends the session
+    third = client.post("/auth/login", json=LOGIN).json()["refresh_token"]
+    assert refresh(client, first).status_code == 401
+    assert refresh(client, third).status_code == 401
+    with TestingSessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(RefreshToken).where(
+            RefreshToken.user_id == test_user.id, RefreshToken.is_revoked == False
+        )) == 0
+        assert db.scalar(select(AuditLog.action).where(AuditLog.user_id == test_user.id)
+                         .order_by(AuditLog.id.desc()).limit(1)) == "REFRESH_TOKEN_REUSED"
+
+
+def test_sweeper_deletes_expired_rows_in_batches(test_user):
+    now = datetime.now(timezone.utc)
+    with TestingSessionLocal() as db:
+        db.add_all(
+            RefreshToken(token_hash=token_digest(f"old-{n}"), user_id=test_user.id, is_revoked=True,
+                         expires_at=now - timedelta(minutes=n + 1))
+            for n in range(25)
+        )
+        db.add(RefreshToken(token_hash=token_digest("live"), user_id=test_user.id, expires_at=now + timedelta(days=1)))
+        db.commit()
+
+    assert asyncio.run(sweep_refresh_tokens(batch_size=10)) == 25
+    with TestingSessionLocal() as db:
+        assert db.scalars(select(RefreshToken.token_hash).where(RefreshToken.user_id == test_user.id)).all() == \
+            [token_digest("live")]
+
+
+def test_plaintext_tokens_are_migrated_to_digests(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE refresh_tokens (id INTEGER PRIMARY KEY, token VARCHAR(255) NOT NULL, "
+            "user_id INTEGER NOT NULL, expires_at DATETIME NOT NULL, created_at DATETIME, is_revoked BOOLEAN)"
+        ))
+        conn.execute(text("CREATE UNIQUE INDEX ix_refresh_tokens_token ON refresh_tokens (token)"))
+        conn.execute(text("INSERT INTO refresh_tokens VALUES (1, 'plain-token', 1, '2100-01-01', NULL, 0)"))
+        migrate_refresh_token_digests(conn)
+
+    with engine.connect() as conn:
+        assert conn.scalar(text("SELECT token_hash FROM refresh_tokens")) == token_digest("plain-token")
+        assert "ix_refresh_tokens_token" not in {index["name"] for index in inspect(conn).get_indexes("refresh_tokens")}
+    engine.dispose()
@@ -0,0 +1,75 @@
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy.pool import NullPool
+
+import replicas
+from replicas import ReplicaSet, STICKY_COOKIE
+
+pytestmark = pytest.mark.usefixtures("setup_database")
+
+
+def replicate(source: str, target: str):
+    """Copy the primary into a replica file (what log shipping / a backup would do)"""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+def insert_attendee(path: str, document_number: str):
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "INSERT INTO attendees (name, email, document_type, document_number, phone_number) "
+            "VALUES ('Replica', 'replica@example.com', 'DNI', ?, '555-0000')",
+            (document_number,)
+        )
+
+
+@pytest.fixture
+def replica_path(tmp_path, monkeypatch, test_user):
+    path = str(tmp_path / "replica.db")
+    replicate("./test.db", path)
+    # NullPool: every TestClient runs its own event loop
+    monkeypatch.setattr(replicas, "replica_set", ReplicaSet([f"sqlite:///{path}"], poolclass=NullPool))
+    return path
+
+
+def search(client, token, document_number):
+    return client.get(
+        f"/attendees/search/by-document/DNI/{document_number}",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+
+def test_reads_go_to_replica(client, user_token, replica_path):
+    insert_attendee(replica_path, "REPLICA-ONLY")
+    assert search(client, user_token, "REPLICA-ONLY").status_code == 200
+
+
+def test_read_your_writes(client, user_token, replica_path):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.post("/attendees/", headers=headers, json={
+        "name": "Primary", "email": "primary@example.com",
+        "document_number": "PRIMARY-ONLY", "phone_number": "555-0000"
+    })
+    assert response.status_code == 201
+    assert STICKY_COOKIE in response.cookies
+
+    # The writer reads its own write from the primary...
+    assert search(client, user_token, "PRIMARY-ONLY").status_code == 200
+    # ...while other clients read the (lagging) replica
+    client.cookies.clear()
+    assert search(client, user_token, "PRIMARY-ONLY").status_code == 404
+
+
+def test_unhealthy_replica_falls_back_to_primary(client, user_token, tmp_path, monkeypatch):
+    missing = f"sqlite:///file:{tmp_path}/missing/replica.db?mode=ro&uri=true"
+    replica_set = ReplicaSet([missing], poolclass=NullPool)
+    monkeypatch.setattr(replicas, "replica_set", replica_set)
+
+    asyncio.run(replica_set.check_health())
+    assert not replica_set.replicas[0].healthy
+    assert replica_set.choose() is None
+
+    response = client.get("/attendees/", headers={"Authorization": f"Bearer {user_token}"})
+    assert response.status_code == 200
@@ -0,0 +1,197 @@
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import select, text
+
+import replication
+import replication_routes
+from conftest import engine as primary_engine
+from database import ApiKey, Attendee, Base, User, create_db_engine
+from main import app
+from replication import Follower, apply_changes, install_change_capture, remove_change_capture
+
+pytestmark = pytest.mark.usefixtures("setup_database")
+
+TOKEN = "replication-secret"
+ATTENDEE = {
+    "name": "Replicated", "email": "replicated@example.com",
+    "document_number": "REPL-001", "phone_number": "555-0000"
+}
+
+
+@pytest.fixture
+def primary(monkeypatch):
+    """test.db acts as the primary: change capture on, replication endpoints enabled"""
+    monkeypatch.setattr(replication_routes, "REPLICATION_ROLE", "primary")
+    monkeypatch.setattr(replication_routes, "REPLICATION_TOKEN", TOKEN)
+    install_change_capture(primary_engine)
+    yield
+    remove_change_capture(primary_engine)
+    with primary_engine.begin() as conn:
+        conn.execute(text("DELETE FROM change_log"))
+
+
+@pytest.fixture
+def follower_engine(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path}/follower.db", use_async=False)
+    yield engine
+    engine.dispose()
+
+
+def make_follower(engine):
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://primary")
+    return Follower(primary_url="http://primary", token=TOKEN, engine=engine, http=http)
+
+
+def follower_documents(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT document_number FROM attendees")).scalars().all()
+
+
+def test_triggers_record_committed_changes(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path}/capture.db", use_async=False)
+    Base.metadata.create_all(bind=engine)
+    install_change_capture(engine)
+    with engine.begin() as conn:
+        conn.execute(Attendee.__table__.insert().values(
+            name="A", email="a@example.com", document_number="1", phone_number="1"))
+        conn.execute(Attendee.__table__.update().values(name="B"))
+    with engine.connect() as conn:
+        conn.execute(Attendee.__table__.insert().values(
+            name="C", email="c@example.com", document_number="2", phone_number="2"))
+        conn.rollback()
+    with engine.begin() as conn:
+        conn.execute(Attendee.__table__.delete())
+        rows = conn.execute(text("SELECT table_name, op, pk, row FROM change_log ORDER BY lsn")).all()
+    engine.dispose()
+
+    assert [(r.table_name, r.op, r.pk) for r in rows] == [
+        ("attendees", "upsert", 1), ("attendees", "upsert", 1), ("attendees", "delete", 1)
+    ]
+    assert '"name":"B"' in rows[1].row
+
+
+def test_tables_added_to_replication_are_backfilled(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path}/capture.db", use_async=False)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(
+            id=1, username="svc", email="svc@example.com", hashed_password="x"))
+        conn.execute(ApiKey.__table__.insert().values(
+            id=7, name="sync", prefix="ak_1", key_digest="d" * 64, user_id=1, scopes="read:attendees"))
+    install_change_capture(engine)
+    with engine.begin() as conn:
+        # A primary from before api_keys was replicated
+        conn.execute(text("DELETE FROM change_log"))
+        for op in ("insert", "update", "delete"):
+            conn.exec_driver_sql(f"DROP TRIGGER change_log_api_keys_{op}")
+    install_change_capture(engine)
+    install_change_capture(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT table_name, op, pk, row FROM change_log")).all()
+    engine.dispose()
+
+    assert [(r.table_name, r.op, r.pk) for r in rows] == [("api_keys", "upsert", 7)]
+    assert '"scopes":"read:attendees"' in rows[0].row
+
+
+def test_follower_sees_api_keys_created_and_revoked(primary, follower_engine, client, admin_token, test_user):
+    follower = make_follower(follower_engine)
+    asyncio.run(follower.bootstrap())
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    def follower_key(key_id):
+        asyncio.run(follower.poll_once())
+        with follower_engine.connect() as conn:
+            return conn.execute(
+                select(ApiKey.key_digest, ApiKey.revoked_at).where(ApiKey.id == key_id)
+            ).one_or_none()
+
+    created = client.post("/auth/api-keys", headers=headers, json={
+        "name": "follower-sync", "scopes": ["read:attendees"], "user_id": test_user.id
+    }).json()
+    try:
+        row = follower_key(created["id"])
+        assert row is not None and row.revoked_at is None
+        assert client.delete(f"/auth/api-keys/{created['id']}", headers=headers).status_code == 200
+        assert follower_key(created["id"]).revoked_at is not None
+    finally:
+        with primary_engine.begin() as conn:
+            conn.execute(ApiKey.__table__.delete().where(ApiKey.id == created["id"]))
+
+
+def test_follower_replays_primary(primary, follower_engine, client, user_token, admin_token):
+    follower = make_follower(follower_engine)
+    asyncio.run(follower.bootstrap())
+    assert follower.bootstrapped
+    with primary_engine.connect() as conn:
+        existing = conn.execute(text("SELECT document_number FROM attendees")).scalars().all()
+    assert follower_documents(follower_engine) == existing
+
+    headers = {"Authorization": f"Bearer {user_token}"}
+    created = client.post("/attendees/", json=ATTENDEE, headers=headers).json()
+    assert asyncio.run(follower.poll_once()) > 0
+    assert follower_documents(follower_engine) == existing + ["REPL-001"]
+    assert follower.status()["lag_changes"] == 0
+
+    client.delete(f"/attendees/{created['attendee_id']}", headers={"Authorization": f"Bearer {admin_token}"})
+    asyncio.run(follower.poll_once())
+    assert follower_documents(follower_engine) == existing
+
+    # Replaying the same changes again is a no-op
+    with primary_engine.connect() as conn:
+        lsn = conn.execute(text("SELECT MAX(lsn) FROM change_log")).scalar()
+    assert apply_changes(follower_engine, []) == lsn
+
+
+def test_changes_require_token(primary, client):
+    assert client.get("/replication/changes").status_code == 403
+    with primary_engine.connect() as conn:
+        head = replication.head_lsn(conn)
+    response = client.get(f"/replication/changes?since={head}", headers={"X-Replication-Token": TOKEN})
+    assert response.status_code == 200
+    assert response.json() == {"changes": [], "head_lsn": head}
+
+
+def test_pruned_log_requires_resync(primary, client, user_token):
+    client.post("/attendees/", json=ATTENDEE | {"document_number": "REPL-002"},
+                headers={"Authorization": f"Bearer {user_token}"})
+    with primary_engine.begin() as conn:
+        conn.execute(text("DELETE FROM change_log"))
+    response = client.get("/replication/changes?since=0", headers={"X-Replication-Token": TOKEN})
+    assert response.status_code == 410
+
+
+def test_release_connections_gives_the_follower_a_fresh_client(follower_engine):
+    follower = Follower(primary_url="http://primary:3000", token=TOKEN, engine=follower_engine)
+    before = follower.http
+    asyncio.run(follower.release_connections())
+    assert before.is_closed and not follower.http.is_closed
+    assert follower.http.headers["X-Replication-Token"] == TOKEN
+    assert str(follower.http.base_url) == "http://primary:3000"
+
+
+@pytest.fixture
+def follower_mode(client, follower_engine, monkeypatch):
+    """Run the app as a follower (set after the client started, so lifespan does not bootstrap it)"""
+    follower = Follower(primary_url="http://primary:3000", token=TOKEN, engine=follower_engine)
+    monkeypatch.setattr(replication, "follower", follower)
+    return follower
+
+
+def test_follower_redirects_writes(client, user_token, follower_mode):
+    response = client.post(
+        "/attendees/?source=edge", json=ATTENDEE, headers={"Authorization": f"Bearer {user_token}"},
+        follow_redirects=False
+    )
+    assert response.status_code == 307
+    assert response.headers["location"] == "http://primary:3000/attendees/?source=edge"
+
+
+def test_follower_reports_lag_and_forwards_audit(client, user_token, follower_mode):
+    response = client.get("/attendees/", headers={"Authorization": f"Bearer {user_token}"})
+    assert response.status_code == 200
+    assert "X-Replication-Lag" in response.headers
+    assert [entry["action"] for entry in follower_mode.audit_backlog] == ["READ_ATTENDEES"]
+    assert client.get("/replication/status").json()["role"] == "follower"
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+from auth import auth_service
+from conftest import AsyncTestingSessionLocal, TestingSessionLocal
+from database import TokenRevocation
+from query_stats import assert_max_queries
+from revocation import RevocationList
+
+pytestmark = pytest.mark.usefixtures("setup_database")
+
+LOGIN = {"username": "testuser", "password": "testpassword123"}
+
+
+def login(client):
+    return client.post("/auth/login", json=LOGIN).json()
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_logout_revokes_only_the_presented_access_token(client, test_user):
+    first, second = login(client), login(client)
+    response = client.post(
+        "/auth/logout", json={"refresh_token": second["refresh_token"]}, headers=bearer(first["access_token"])
+    )
+    assert response.status_code == 200
+    assert client.get("/auth/me", headers=bearer(first["access_token"])).status_code == 401
+    assert client.get("/auth/me", headers=bearer(second["access_token"])).status_code == 200
+
+    # The check is in memory
+    with assert_max_queries(0):
+        assert auth_service.verify_token(first["access_token"]) is None
+        assert auth_service.verify_token(second["access_token"]) is not None
+
+
+def test_password_change_revokes_every_access_token(client, test_user):
+    tokens = [login(client)["access_token"] for _ in range(2)]
+    response = client.post(
+        "/auth/change-password", headers=bearer(tokens[0]),
+        json={"current_password": "testpassword123", "new_password": "NewPassword456"}
+    )
+    assert response.status_code == 200
+    for token in tokens:
+        assert client.get("/auth/me", headers=bearer(token)).status_code == 401
+    # Issued within the same second as the change, but after it
+    fresh = client.post("/auth/login", json={**LOGIN, "password": "NewPassword456"}).json()
+    assert client.get("/auth/me", headers=bearer(fresh["access_token"])).status_code == 200
+
+
+def test_deactivation_reaches_scope_checks_and_other_workers(client, test_user, user_token, admin_token):
+    other_worker = RevocationList(sessionmaker=AsyncTestingSessionLocal)
+    asyncio.run(other_worker.sync())
+    other_worker.clear()  # earlier tests' revocations of a user with the same id
+    token_data = auth_service.verify_token(user_token)
+    assert not other_worker.is_revoked(token_data.jti, token_data.user_id, 0)
+
+    response = client.post(f"/auth/users/{test_user.id}/deactivate", headers=bearer(admin_token))
+    assert response.status_code == 200
+    # Rejected as a token (401) before the inactive user row is even read (403)
+    assert client.get("/attendees/", headers=bearer(user_token)).status_code == 401
+    with assert_max_queries(0):
+        assert auth_service.verify_token(user_token) is None
+
+    assert asyncio.run(other_worker.sync()) == 1
+    assert other_worker.is_revoked(token_data.jti, token_data.user_id, 0)
+
+
+def test_sync_picks_up_revocations_committed_out_of_id_order():
+    def add(row_id, jti):
+        with TestingSessionLocal() as db:
+            db.add(TokenRevocation(id=row_id, jti=jti, user_id=1, expires_at=time.time() + 60))
+            db.commit()
+
+    worker = RevocationList(sessionmaker=AsyncTestingSessionLocal)
+    asyncio.run(worker.sync())
+    with TestingSessionLocal() as db:
+        last = db.scalar(select(func.max(TokenRevocation.id))) or 0
+    add(last + 1, "first")
+    asyncio.run(worker.sync())
+    # last + 3 commits while last + 2 is still open
+    add(last + 3, "third")
+    asyncio.run(worker.sync())
+    assert worker.is_revoked("third", 1, None)
+    add(last + 2, "second")
+    asyncio.run(worker.sync())
+    assert worker.is_revoked("second", 1, None)
@@ -1,109 +1,10 @@
 import pytest
-import asyncio
-from httpx import AsyncClient
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from database import Base, get_db, User, Attendee
-from main import app
-from auth import auth_service
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
 
-# Test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
-
-@pytest.fixture(scope="session")
-def setup_database():
-    Base.metadata.create_all(bind=engine)
-    yield
-    Base.metadata.drop_all(bind=engine)
-
-@pytest.fixture
-def client():
-    with TestClient(app) as client:
-        yield client
-
-@pytest.fixture
-def test_user():
-    db = TestingSessionLocal()
-    hashed_password = auth_service.get_password_hash("testpassword123")
-    user = User(
-        username="testuser",
-        email="test@example.com",
-        hashed_password=hashed_password,
-        is_admin=False
-    )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    yield user
-    
-    # Clean up refresh tokens first to avoid foreign key constraint violation
-    from database import RefreshToken
-    db.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete()
-    db.commit()
-    
-    # Now we can safely delete the user
-    db.delete(user)
-    db.commit()
-    db.close()
-
-@pytest.fixture
-def admin_user():
-    db = TestingSessionLocal()
-    hashed_password = auth_service.get_password_hash("adminpassword123")
-    user = User(
-        username="admin",
-        email="admin@example.com",
-        hashed_password=hashed_password,
-        is_admin=True
-    )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    yield user
-    
-    # Clean up refresh tokens first to avoid foreign key constraint violation
-    from database import RefreshToken
-    db.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete()
-    db.commit()
-    
-    # Now we can safely delete the user
-    db.delete(user)
-    db.commit()
-    db.close()
-
-@pytest.fixture
-def user_token(client, test_user):
-    login_data = {
-        "username": "testuser",
-        "password": "testpassword123"
-    }
-    response = client.post("/auth/login", json=login_data)
-    assert response.status_code == 200
-    token_data = response.json()
-    return token_data["access_token"]
-
-@pytest.fixture
-def admin_token(client, admin_user):
-    login_data = {
-        "username": "admin",
-        "password": "adminpassword123"
-    }
-    response = client.post("/auth/login", json=login_data)
-    assert response.status_code == 200
-    token_data = response.json()
-    return token_data["access_token"]
+from conftest import TestingSessionLocal
+from database import AuditLog, RefreshToken, User
+from refresh_tokens import token_digest
 
 class TestAuthentication:
     """Test authentication endpoints"""
@@ -260,5 +161,100 @@ class TestSecurity:
         response = client.get("/auth/audit-logs", headers=admin_headers)
         assert response.status_code == 200
 
+class TestLoginUnitOfWork:
+    """A login is one transaction"""
+    
+    LOGIN = {"username": "testuser", "password": "testpassword123"}
+    
+    def test_login_commits_once(self, client, test_user):
+        commits = []
+        listener = lambda conn: commits.append(conn)
+        event.listen(Engine, "commit", listener)
+        try:
+            response = client.post("/auth/login", json=self.LOGIN)
+        finally:
+            event.remove(Engine, "commit", listener)
+        assert response.status_code == 200
+        assert len(commits) == 1
+        
+        with TestingSessionLocal() as db:
+            assert db.get(User, test_user.id).last_login is not None
+            assert db.scalar(select(AuditLog.action).where(AuditLog.user_id == test_user.id)
+                             .order_by(AuditLog.id.desc()).limit(1)) == "LOGIN_SUCCESS"
+    
+    def test_login_replaces_the_active_refresh_token(self, client, test_user):
+        first = client.post("/auth/login", json=self.LOGIN).json()["refresh_token"]
+        second = client.post("/auth/login", json=self.LOGIN).json()["refresh_token"]
+        
+        with TestingSessionLocal() as db:
+            active = db.scalars(select(RefreshToken.token_hash).where(
+                RefreshToken.user_id == test_user.id, RefreshToken.is_revoked == False
+            )).all()
+        assert active == [token_digest(second)]
+        assert client.post("/auth/refresh", json={"refresh_token": first}).status_code == 401
+        assert client.post("/auth/refresh", json={"refresh_token": second}).status_code == 200
+    
+    def test_last_login_writes_can_be_coalesced(self, client, test_user, monkeypatch):
+        import auth
+        client.post("/auth/login", json=self.LOGIN)
+        with TestingSessionLocal() as db:
+            first_login = db.get(User, test_user.id).last_login
+        
+        monkeypatch.setattr(auth, "LAST_LOGIN_WRITE_INTERVAL_SECONDS", 300)
+        client.post("/auth/login", json=self.LOGIN)
+        with TestingSessionLocal() as db:
+            assert db.get(User, test_user.id).last_login == first_login
+
+class TestLockout:
+    """Failed logins are counted outside the users table"""
+    
+    LOGIN = {"username": "testuser", "password": "testpassword123"}
+    BAD_LOGIN = {"username": "testuser", "password": "wrong-password"}
+    
+    def user_updates(self, client, logins):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(Engine, "before_cursor_execute", listener)
+        try:
+            codes = [client.post("/auth/login", json=login).status_code for login in logins]
+        finally:
+            event.remove(Engine, "before_cursor_execute", listener)
+        return codes, [s for s in statements if s.startswith("UPDATE users")]
+    
+    def test_only_the_locking_failure_writes_the_user_row(self, client, test_user):
+        codes, updates = self.user_updates(client, [self.BAD_LOGIN] * 4)
+        assert codes == [401] * 4 and updates == []
+        assert client.post("/auth/login", json=self.LOGIN).status_code == 200
+        
+        codes, updates = self.user_updates(client, [self.BAD_LOGIN] * 5 + [self.LOGIN])
+        assert codes == [401] * 5 + [423]
+        assert len(updates) == 1
+        with TestingSessionLocal() as db:
+            user = db.get(User, test_user.id)
+            assert user.login_attempts == 5 and user.locked_until is not None
+    
+    def test_failures_while_locked_do_not_extend_the_lock(self, client, test_user):
+        self.user_updates(client, [self.BAD_LOGIN] * 5)
+        with TestingSessionLocal() as db:
+            locked_until = db.get(User, test_user.id).locked_until
+        codes, updates = self.user_updates(client, [self.BAD_LOGIN] * 3)
+        assert codes == [401] * 3 and updates == []
+        with TestingSessionLocal() as db:
+            assert db.get(User, test_user.id).locked_until == locked_until
+    
+    def test_persisted_lock_survives_a_fresh_tracker(self, client, test_user):
+        from lockout import login_attempts
+        from local_redis import LocalRedis
+        self.user_updates(client, [self.BAD_LOGIN] * 5)
+        login_attempts.client = LocalRedis()  # another worker, or a restart
+        assert client.post("/auth/login", json=self.LOGIN).status_code == 423
+        
+        with TestingSessionLocal() as db:
+            db.get(User, test_user.id).locked_until = None
+            db.commit()
+        assert client.post("/auth/login", json=self.LOGIN).status_code == 200
+        with TestingSessionLocal() as db:
+            assert db.get(User, test_user.id).login_attempts == 0
+
 if __name__ == "__main__":
     pytest.main([__file__])
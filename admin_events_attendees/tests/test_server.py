@@ -0,0 +1,87 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+import config
+from server import check_shared_state, worker_count
+
+APP_DIR = Path(__file__).parents[1]
+sys.path.append(str(APP_DIR / "benchmarks"))
+from workers import free_port  # noqa: E402
+
+
+def test_worker_count_defaults_to_cpus():
+    assert worker_count(3) == 3
+    assert worker_count(0) == len(os.sched_getaffinity(0))
+
+
+def test_workers_need_a_shared_lockout_store(monkeypatch):
+    monkeypatch.setattr(config, "LOGIN_ATTEMPTS_REDIS_URL", "memory://")
+    assert check_shared_state(1, 1) == 1
+    # One per CPU falls back to a single worker; an explicit count is refused
+    assert check_shared_state(4, 0) == 1
+    with pytest.raises(SystemExit):
+        check_shared_state(4, 4)
+    assert check_shared_state(4, 4, allow_per_worker_state=True) == 4
+
+    monkeypatch.setattr(config, "LOGIN_ATTEMPTS_REDIS_URL", "redis://localhost:6379/1")
+    assert check_shared_state(4, 4) == 4
+
+
+def wait_for(predicate, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.2)
+
+
+def test_workers_recycle_and_drain_on_sigterm(tmp_path):
+    port = free_port()
+    log = tmp_path / "server.log"
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_path}/server.db",
+        JWT_KEYS_DIR=f"{tmp_path}/jwt_keys",
+        LOOP_MONITOR_ENABLED="false",
+        PYTHONPATH=os.pathsep.join(
+            os.path.abspath(path) for path in os.environ.get("PYTHONPATH", "").split(os.pathsep) if path
+        ),
+    )
+    with open(log, "w") as output:
+        server = subprocess.Popen(
+            [sys.executable, "-u", str(APP_DIR / "server.py"), "--workers", "2", "--port", str(port),
+             "--max-requests", "3", "--max-requests-jitter", "0", "--graceful-timeout", "5",
+             "--allow-per-worker-state"],
+            env=env, cwd=tmp_path, stdout=output, stderr=subprocess.STDOUT
+        )
+    try:
+        def healthy():
+            try:
+                return httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200
+            except httpx.TransportError:
+                return False
+
+        wait_for(healthy)
+
+        def recycled():
+            # uvicorn counts a request once its last body message is sent, which
+            # Starlette's BaseHTTPMiddleware skips when the client already closed
+            assert httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200
+            return "recycled after its request limit" in log.read_text()
+
+        wait_for(recycled)
+        assert healthy()
+        # The schema is checked once in the master, before forking
+        assert log.read_text().count("Database schema migrated") == 1
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+    output = log.read_text()
+    assert "Application shutdown complete" in output
+    assert output.rstrip().endswith("All workers stopped")
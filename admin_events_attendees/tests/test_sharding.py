@@ -0,0 +1,225 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select, text
+
+import sharding
+from database import Attendee, create_db_engine
+from sharding import SHARD_ID_STRIDE, ShardSet, reshard, shard_for_key, shard_key, shard_info
+
+pytestmark = pytest.mark.usefixtures("setup_database")
+
+
+def attendee(number):
+    return {
+        "name": f"Sharded {number}", "email": f"sharded{number}@example.com",
+        "document_type": "DNI", "document_number": f"SHARD-{number}", "phone_number": "555-0200"
+    }
+
+
+def shard_urls(tmp_path, prefix, count):
+    return [f"sqlite:///{tmp_path}/{prefix}-{index}.db" for index in range(count)]
+
+
+def rows_per_shard(urls):
+    documents = []
+    for url in urls:
+        engine = create_db_engine(url, use_async=False)
+        with engine.connect() as conn:
+            documents.append(conn.execute(select(Attendee.attendee_id, Attendee.document_number)).all())
+        engine.dispose()
+    return documents
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    """Two attendee shards in tmp_path; the client fixture's lifespan starts them"""
+    urls = shard_urls(tmp_path, "shard", 2)
+    shard_set = ShardSet(urls)
+    for shard in shard_set.shards:
+        shard.snapshots.directory = str(tmp_path / f"snapshots-{shard.index}")
+    monkeypatch.setattr(sharding, "shard_set", shard_set)
+    return urls
+
+
+def test_shard_key_is_stable_and_ranges_split_on_doubling():
+    from schemas import DocumentType
+    assert shard_key(DocumentType.DNI, "123") == shard_key("DNI", "123") == shard_key(None, "123")
+    for number in range(200):
+        key = shard_key("DNI", str(number))
+        # Doubling the shard count splits every hash range in two
+        assert shard_for_key(key, 8) // 2 == shard_for_key(key, 4)
+
+
+def test_requests_span_shards(sharded, client, user_token, admin_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    created = [client.post("/attendees/", json=attendee(number), headers=headers).json() for number in range(12)]
+    ids = sorted(a["attendee_id"] for a in created)
+
+    per_shard = rows_per_shard(sharded)
+    assert all(per_shard), "every shard should receive attendees"
+    for index, rows in enumerate(per_shard):
+        for attendee_id, number in rows:
+            assert shard_for_key(shard_key("DNI", number), 2) == index
+            assert attendee_id % SHARD_ID_STRIDE == index
+
+    listed = client.get("/attendees/?limit=100", headers=headers).json()
+    assert [a["attendee_id"] for a in listed] == ids
+    page = client.get("/attendees/?skip=3&limit=4", headers=headers).json()
+    assert [a["attendee_id"] for a in page] == ids[3:7]
+
+    assert client.get(f"/attendees/{ids[5]}", headers=headers).json()["attendee_id"] == ids[5]
+    assert client.get("/attendees/search/by-document/DNI/SHARD-7", headers=headers).json()["name"] == "Sharded 7"
+    found = client.get("/attendees/search/by-email/sharded1", headers=headers).json()
+    assert {a["document_number"] for a in found} == {"SHARD-1", "SHARD-10", "SHARD-11"}
+
+    duplicate = client.post("/attendees/", json=attendee(4), headers=headers)
+    assert duplicate.status_code == 400
+
+    admin = {"Authorization": f"Bearer {admin_token}"}
+    export = client.get("/attendees/export", headers=admin).text.splitlines()
+    assert [int(line.split(",")[0]) for line in export[1:]] == ids
+    assert client.get("/attendees/stats", headers=admin).json()["total"] == 12
+
+    assert client.delete(f"/attendees/{ids[0]}", headers=admin).status_code == 200
+    assert client.get(f"/attendees/{ids[0]}", headers=headers).status_code == 404
+
+
+def test_document_change_moves_attendee_to_its_new_shard(sharded, client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    original = client.post("/attendees/", json=attendee(100), headers=headers).json()
+    home = shard_for_key(shard_key("DNI", "SHARD-100"), 2)
+    number = next(n for n in range(101, 200) if shard_for_key(shard_key("DNI", f"SHARD-{n}"), 2) != home)
+
+    response = client.put(
+        f"/attendees/{original['attendee_id']}", json={"document_number": f"SHARD-{number}"}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()["attendee_id"] == original["attendee_id"]
+
+    per_shard = rows_per_shard(sharded)
+    assert per_shard[home] == []
+    assert per_shard[1 - home] == [(original["attendee_id"], f"SHARD-{number}")]
+    moved = client.get(f"/attendees/{original['attendee_id']}", headers=headers).json()
+    assert moved["document_number"] == f"SHARD-{number}"
+
+
+def test_failed_move_leaves_the_attendee_on_its_shard(sharded, client, user_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    original = client.post("/attendees/", json=attendee(150), headers=headers).json()
+    home = shard_for_key(shard_key("DNI", "SHARD-150"), 2)
+    number = next(n for n in range(151, 250) if shard_for_key(shard_key("DNI", f"SHARD-{n}"), 2) != home)
+
+    async def broken(unit):
+        raise RuntimeError("shard unavailable")
+
+    monkeypatch.setattr(sharding.shard_set.shards[home].lane, "submit", broken)
+    response = client.put(
+        f"/attendees/{original['attendee_id']}", json={"document_number": f"SHARD-{number}"}, headers=headers
+    )
+    assert response.status_code == 503
+
+    per_shard = rows_per_shard(sharded)
+    assert per_shard[home] == [(original["attendee_id"], "SHARD-150")]
+    assert per_shard[1 - home] == []
+    assert client.get(f"/attendees/{original['attendee_id']}", headers=headers).json()["document_number"] == "SHARD-150"
+
+
+def test_newest_copy_wins_after_an_interrupted_move(tmp_path, sharded, client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    original = client.post("/attendees/", json=attendee(250), headers=headers).json()
+    home = shard_for_key(shard_key("DNI", "SHARD-250"), 2)
+
+    # The new copy committed, the old one was never deleted
+    source = create_db_engine(sharded[home], use_async=False)
+    with source.connect() as conn:
+        row = dict(conn.execute(select(Attendee.__table__)).one()._mapping)
+    source.dispose()
+    row.update(document_number="SHARD-NEWER", updated_at=row["created_at"] + timedelta(minutes=1))
+    target = create_db_engine(sharded[1 - home], use_async=False)
+    with target.begin() as conn:
+        conn.execute(Attendee.__table__.insert(), [row])
+    target.dispose()
+
+    served = client.get(f"/attendees/{original['attendee_id']}", headers=headers).json()
+    assert served["document_number"] == "SHARD-NEWER"
+
+    copied = reshard(sharded, shard_urls(tmp_path, "resharded", 2))
+    assert sum(copied.values()) == 1
+    assert {row for rows in rows_per_shard(shard_urls(tmp_path, "resharded", 2)) for row in rows} == {
+        (original["attendee_id"], "SHARD-NEWER")
+    }
+
+
+def test_bulk_load_splits_rows_by_shard(sharded, client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.post("/attendees/bulk", json=[attendee(n) for n in range(200, 230)], headers=headers)
+    assert response.json() == {"inserted": 30}
+    per_shard = rows_per_shard(sharded)
+    assert sum(len(rows) for rows in per_shard) == 30
+    all_ids = [attendee_id for rows in per_shard for attendee_id, _ in rows]
+    assert len(set(all_ids)) == 30
+
+
+def test_bulk_load_reports_the_shards_that_failed(sharded, client, user_token, monkeypatch):
+    async def broken(unit):
+        raise RuntimeError("shard unavailable")
+
+    monkeypatch.setattr(sharding.shard_set.shards[1].lane, "submit", broken)
+    headers = {"Authorization": f"Bearer {user_token}"}
+    batch = [attendee(n) for n in range(300, 320)]
+    response = client.post("/attendees/bulk", json=batch, headers=headers)
+
+    stored = rows_per_shard(sharded)
+    assert stored[0] and not stored[1]
+    assert response.status_code == 207
+    body = response.json()
+    assert body["inserted"] == len(stored[0])
+    [failure] = body["failed"]
+    assert failure["error"] == "shard unavailable"
+    assert len(failure["documents"]) == len(batch) - len(stored[0])
+    assert all(shard_for_key(shard_key("DNI", document.split(" - ")[1]), 2) == 1 for document in failure["documents"])
+
+
+def test_reshard_preserves_ids_and_routes_rows(tmp_path, sharded, client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    client.post("/attendees/bulk", json=[attendee(n) for n in range(300, 340)], headers=headers)
+    before = {row for rows in rows_per_shard(sharded) for row in rows}
+
+    targets = shard_urls(tmp_path, "resharded", 3)
+    copied = reshard(sharded, targets)
+    assert sum(copied.values()) == 40
+
+    after = rows_per_shard(targets)
+    assert {row for rows in after for row in rows} == before
+    for index, rows in enumerate(after):
+        for _, number in rows:
+            assert shard_for_key(shard_key("DNI", number), 3) == index
+
+    # New ids of every target start above the copied ids that share its residue
+    for index, url in enumerate(targets):
+        engine = create_db_engine(url, use_async=False)
+        with engine.connect() as conn:
+            next_local = conn.execute(select(shard_info.c.next_local_id)).scalar()
+        engine.dispose()
+        taken = [attendee_id // SHARD_ID_STRIDE for attendee_id, _ in before if attendee_id % SHARD_ID_STRIDE == index]
+        assert next_local > max(taken, default=0)
+
+    with pytest.raises(RuntimeError, match="already contains attendees"):
+        reshard(sharded, targets)
+
+
+def test_start_rejects_a_reordered_layout(tmp_path):
+    urls = shard_urls(tmp_path, "layout", 2)
+
+    async def start(shard_urls):
+        shard_set = ShardSet(shard_urls)
+        try:
+            await shard_set.start()
+        finally:
+            await shard_set.stop()
+
+    asyncio.run(start(urls))
+    with pytest.raises(RuntimeError, match="is shard 1 of 2"):
+        asyncio.run(start(list(reversed(urls))))
@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+import pytest
+from jose import JWTError, jwk, jwt
+
+import signing_keys
+from auth import auth_service
+from signing_keys import KeyRing, generate_key
+
+
+def claims(**extra):
+    return dict({"sub": "ana", "exp": int(time.time()) + 60}, **extra)
+
+
+def age(directory, kid, seconds):
+    path = os.path.join(directory, f"{kid}.pem")
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+@pytest.mark.usefixtures("setup_database")
+def test_tokens_verify_offline_against_the_jwks(client, user_token):
+    response = client.get("/.well-known/jwks.json")
+    assert response.status_code == 200
+    assert "max-age" in response.headers["cache-control"]
+    jwks = response.json()
+    kid = jwt.get_unverified_header(user_token)["kid"]
+    assert kid in {key["kid"] for key in jwks["keys"]}
+    # What a downstream service does with the published document
+    assert jwt.decode(user_token, jwks, algorithms=["ES256"])["sub"] == "testuser"
+
+
+def test_generated_keys_round_trip_through_jose(tmp_path):
+    kid = generate_key(str(tmp_path))
+    with open(tmp_path / f"{kid}.pem", "rb") as f:
+        signer = jwk.construct(f.read(), "ES256")
+    verifier = signer.public_key()
+    assert signing_keys.thumbprint(verifier.to_dict()) == kid
+    message = b"header.payload"
+    assert verifier.verify(message, signer.sign(message))
+
+
+def test_new_keys_sign_only_after_a_jwks_cache_period(tmp_path):
+    directory = str(tmp_path)
+    old = generate_key(directory)
+    age(directory, old, 3600)
+    new = generate_key(directory)
+    ring = KeyRing("ES256", directory, publish_delay=300)
+    ring.load()
+
+    before = ring.sign(claims())
+    assert jwt.get_unverified_header(before)["kid"] == old
+    assert {key["kid"] for key in json.loads(ring.jwks)["keys"]} == {old, new}
+
+    age(directory, new, 301)
+    ring.load()
+    after = ring.sign(claims())
+    assert jwt.get_unverified_header(after)["kid"] == new
+    # Tokens of the retiring key stay valid while it is in the ring
+    assert ring.decode(before)["sub"] == ring.decode(after)["sub"] == "ana"
+
+
+def test_active_kid_pins_the_signing_key(tmp_path):
+    directory = str(tmp_path)
+    first = generate_key(directory)
+    generate_key(directory)
+    ring = KeyRing("ES256", directory, active_kid=first, publish_delay=0)
+    ring.load()
+    assert jwt.get_unverified_header(ring.sign(claims()))["kid"] == first
+
+
+def test_verified_tokens_are_not_checked_again(tmp_path, monkeypatch):
+    ring = KeyRing("ES256", str(tmp_path))
+    ring.load()
+    token = ring.sign(claims())
+    assert ring.decode(token)["sub"] == "ana"
+
+    def decode(*args, **kwargs):
+        raise AssertionError("signature checked twice")
+
+    monkeypatch.setattr(signing_keys.jwt, "decode", decode)
+    assert ring.decode(token)["sub"] == "ana"
+
+    stranger = KeyRing("ES256", str(tmp_path / "other"))
+    stranger.load()
+    with pytest.raises(JWTError, match="Unknown signing key"):
+        ring.decode(stranger.sign(claims()))
+    assert auth_service.verify_token(stranger.sign(claims(user_id=1))) is None
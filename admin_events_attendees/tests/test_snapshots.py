@@ -0,0 +1,129 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+from conftest import engine as test_engine
+from database import Attendee, Base, create_db_engine
+from snapshots import SnapshotService
+
+pytestmark = pytest.mark.usefixtures("setup_database")
+
+
+def attendee(document_number):
+    return {
+        "name": "Snapshot", "email": f"{document_number.lower()}@example.com",
+        "document_number": document_number, "phone_number": "555-0100"
+    }
+
+
+@pytest.fixture
+def source(tmp_path):
+    sync = create_db_engine(f"sqlite:///{tmp_path}/live.db", use_async=False)
+    Base.metadata.create_all(bind=sync)
+    with sync.begin() as conn:
+        conn.execute(Attendee.__table__.insert(), [attendee("SNAP-1")])
+    yield sync
+    sync.dispose()
+
+
+def run_with_service(tmp_path, job, max_age=60):
+    async def main():
+        engine = create_db_engine(f"sqlite:///{tmp_path}/live.db")
+        service = SnapshotService(source=engine, directory=str(tmp_path / "snapshots"), max_age=max_age)
+        service.start()
+        try:
+            return await job(service)
+        finally:
+            await service.close()
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+def test_snapshot_is_point_in_time(tmp_path, source):
+    async def job(service):
+        async with service.session() as session:
+            with source.begin() as conn:
+                conn.execute(Attendee.__table__.insert(), [attendee("SNAP-2")])
+            return (await session.scalars(select(Attendee.document_number))).all()
+
+    assert run_with_service(tmp_path, job) == ["SNAP-1"]
+
+
+def test_snapshot_is_read_only(tmp_path, source):
+    async def job(service):
+        async with service.session() as session:
+            with pytest.raises(OperationalError):
+                await session.execute(text("DELETE FROM attendees"))
+
+    run_with_service(tmp_path, job)
+
+
+def test_snapshots_are_reused_within_the_freshness_bound(tmp_path, source):
+    async def job(service):
+        first = await service.acquire()
+        second = await service.acquire()
+        fresh = await service.acquire(max_age=0)
+        paths = {first.path, fresh.path}
+        for snapshot in (first, second, fresh):
+            await service.release(snapshot)
+        return first is second, first is fresh, paths
+
+    reused, replaced, (old_path, new_path) = run_with_service(tmp_path, job)
+    assert reused and not replaced
+    # The replaced copy is gone once its readers released it; close() removes the current one
+    assert not os.path.exists(old_path) and not os.path.exists(new_path)
+
+
+def test_retired_snapshot_survives_until_released(tmp_path, source):
+    async def job(service):
+        old = await service.acquire()
+        new = await service.acquire(max_age=0)
+        still_there = os.path.exists(old.path)
+        await service.release(old)
+        await service.release(new)
+        return still_there, os.path.exists(old.path)
+
+    assert run_with_service(tmp_path, job) == (True, False)
+
+
+def test_stats_and_duplicates_run_on_snapshot(client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    client.post("/attendees/", json=attendee("SNAP-DUP"), headers=headers)
+    # The create route rejects repeated documents; add one the way a race between two workers would
+    with test_engine.begin() as conn:
+        conn.execute(Attendee.__table__.insert(), [attendee("SNAP-DUP") | {"document_type": "DNI"}])
+
+    stats = client.get("/attendees/stats", headers=headers)
+    assert stats.status_code == 200
+    assert stats.json()["total"] == sum(stats.json()["by_document_type"].values())
+
+    duplicates = client.get("/attendees/duplicates", headers=headers).json()
+    group = [d for d in duplicates if d["document_number"] == "SNAP-DUP"][0]
+    assert len(group["attendee_ids"]) == 2
+
+
+def test_reports_require_admin(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    assert client.get("/attendees/stats", headers=headers).status_code == 403
+    assert client.get("/attendees/duplicates", headers=headers).status_code == 403
+
+
+def test_start_only_deletes_copies_of_exited_processes(tmp_path):
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    directory = tmp_path / "snapshots"
+    directory.mkdir()
+    mine = directory / f"snapshot-{os.getpid()}-aaaaaaaaaaaa.db"
+    orphan = directory / f"snapshot-{int(exited.stdout)}-bbbbbbbbbbbb.db"
+    for path in (mine, orphan):
+        path.write_bytes(b"")
+
+    async def main():
+        SnapshotService(directory=str(directory)).start()
+
+    asyncio.run(main())
+    assert mine.exists() and not orphan.exists()
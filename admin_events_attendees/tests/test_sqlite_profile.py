@@ -0,0 +1,89 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import text
+
+from database import create_db_engine, pool_options, SQLITE_PRAGMAS
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    url = f"sqlite:///{tmp_path}/profile.db"
+    engine = create_db_engine(url, use_async=False)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO items (name) VALUES ('a'), ('b')"))
+    engine.dispose()
+    return url
+
+
+def test_pragmas_applied_on_connect(db_url):
+    engine = create_db_engine(db_url, use_async=False)
+    with engine.connect() as conn:
+        def pragma(name):
+            return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1  # NORMAL
+        assert pragma("busy_timeout") == SQLITE_PRAGMAS["busy_timeout"]
+        assert pragma("cache_size") == SQLITE_PRAGMAS["cache_size"]
+        assert pragma("temp_store") == 2  # MEMORY
+    engine.dispose()
+
+
+def test_async_engine_gets_same_profile(db_url):
+    async def journal_mode():
+        engine = create_db_engine(db_url)
+        async with engine.connect() as conn:
+            mode = (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar()
+        await engine.dispose()
+        return mode
+
+    assert asyncio.run(journal_mode()) == "wal"
+
+
+def test_readers_not_blocked_by_writer(db_url):
+    engine = create_db_engine(db_url, use_async=False)
+    writer = engine.raw_connection()
+    writer.isolation_level = None
+    cursor = writer.cursor()
+    # In rollback-journal mode an exclusive lock locks readers out entirely
+    cursor.execute("BEGIN EXCLUSIVE")
+    cursor.execute("INSERT INTO items (name) VALUES ('c')")
+    try:
+        with engine.connect() as reader:
+            reader.exec_driver_sql("PRAGMA busy_timeout=50")
+            # Readers see the last committed snapshot
+            assert reader.execute(text("SELECT COUNT(*) FROM items")).scalar() == 2
+    finally:
+        cursor.execute("COMMIT")
+        writer.close()
+        engine.dispose()
+
+
+def test_second_writer_waits_for_lock(db_url):
+    engine = create_db_engine(db_url, use_async=False)
+    writer = engine.raw_connection()
+    writer.isolation_level = None
+    writer.cursor().execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.1, lambda: writer.cursor().execute("COMMIT"))
+    release.start()
+    try:
+        # busy_timeout queues the second writer instead of raising "database is locked"
+        with engine.begin() as other:
+            other.execute(text("INSERT INTO items (name) VALUES ('d')"))
+    finally:
+        release.join()
+        writer.close()
+        engine.dispose()
+
+
+def test_pool_split_across_workers(monkeypatch):
+    import database
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 0)
+    monkeypatch.setattr(database, "DB_MAX_CONNECTIONS", 20)
+    monkeypatch.setattr(database, "WEB_CONCURRENCY", 4)
+    assert pool_options("sqlite:///x.db")["pool_size"] == 5
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 3)
+    assert pool_options("sqlite:///x.db")["pool_size"] == 3
@@ -0,0 +1,32 @@
+import os
+import sys
+from pathlib import Path
+
+from database import SCHEMA_VERSION, SchemaVersion, ensure_schema, stored_schema_version, sync_engine
+
+sys.path.append(str(Path(__file__).parents[1] / "benchmarks"))
+from startup import measure_startup  # noqa: E402
+
+# Twice what a restart takes on a single-CPU CI box; override on slower machines
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 4000))
+LIFESPAN_BUDGET_MS = float(os.environ.get("STARTUP_LIFESPAN_BUDGET_MS", 500))
+
+
+def test_schema_is_only_migrated_when_behind():
+    ensure_schema()
+    assert ensure_schema() is False
+    with sync_engine.begin() as conn:
+        assert stored_schema_version(conn) == SCHEMA_VERSION
+        conn.execute(SchemaVersion.__table__.delete())
+    assert ensure_schema() is True
+    with sync_engine.connect() as conn:
+        assert stored_schema_version(conn) == SCHEMA_VERSION
+
+
+def test_startup_budget():
+    runs = measure_startup()
+    restart = runs["restart"]
+    report = "\n".join(f"{cumulative:>8} ms  {name}" for name, cumulative in restart["slowest_imports"])
+    assert not any(restart["lazy_modules_loaded"].values()), restart["lazy_modules_loaded"]
+    assert restart["lifespan_ms"] < LIFESPAN_BUDGET_MS, restart
+    assert restart["total_ms"] < STARTUP_BUDGET_MS, f"{restart}\n{report}"
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import create_db_engine
+from write_lane import WriteLane
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    url = f"sqlite:///{tmp_path}/lane.db"
+    engine = create_db_engine(url, use_async=False)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT UNIQUE)"))
+    engine.dispose()
+    return url
+
+
+def run_with_lane(db_url, scenario, start=True):
+    """Run `scenario(lane)` on a fresh loop with a lane bound to db_url; returns its result and the row names"""
+    async def main():
+        engine = create_db_engine(db_url, pool_size=1, max_overflow=0)
+        lane = WriteLane(async_sessionmaker(engine, expire_on_commit=False))
+        if start:
+            lane.start()
+        try:
+            result = await scenario(lane)
+        finally:
+            await lane.stop()
+        async with engine.connect() as conn:
+            names = (await conn.execute(text("SELECT name FROM items ORDER BY id"))).scalars().all()
+        await engine.dispose()
+        return result, names
+
+    return asyncio.run(main())
+
+
+def insert(name, sessions=None):
+    async def unit(session):
+        if sessions is not None:
+            sessions.add(id(session))
+        await session.execute(text("INSERT INTO items (name) VALUES (:name)"), {"name": name})
+        return name
+    return unit
+
+
+def test_pending_units_share_one_commit(db_url):
+    sessions = set()
+
+    async def scenario(lane):
+        return await asyncio.gather(*(lane.submit(insert(f"item-{i}", sessions)) for i in range(20)))
+
+    results, names = run_with_lane(db_url, scenario)
+    assert results == [f"item-{i}" for i in range(20)]
+    assert len(names) == 20
+    # The first unit may be picked up alone; everything queued behind it is grouped
+    assert len(sessions) <= 2
+
+
+def test_failing_unit_only_fails_its_caller(db_url):
+    async def scenario(lane):
+        return await asyncio.gather(
+            lane.submit(insert("a")),
+            lane.submit(insert("b")),
+            lane.submit(insert("a")),  # violates UNIQUE
+            lane.submit(insert("c")),
+            return_exceptions=True
+        )
+
+    results, names = run_with_lane(db_url, scenario)
+    assert results[:2] == ["a", "b"] and results[3] == "c"
+    assert isinstance(results[2], Exception)
+    assert sorted(names) == ["a", "b", "c"]
+
+
+def test_stop_commits_queued_units(db_url):
+    async def scenario(lane):
+        futures = [asyncio.ensure_future(lane.submit(insert(f"item-{i}"))) for i in range(5)]
+        await asyncio.sleep(0)
+        await lane.stop()
+        return await asyncio.gather(*futures)
+
+    results, names = run_with_lane(db_url, scenario)
+    assert len(results) == 5
+    assert len(names) == 5
+
+
+def test_submit_without_writer_commits_inline(db_url):
+    async def scenario(lane):
+        assert not lane.running
+        return await lane.submit(insert("solo"))
+
+    result, names = run_with_lane(db_url, scenario, start=False)
+    assert result == "solo"
+    assert names == ["solo"]
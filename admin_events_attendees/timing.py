@@ -0,0 +1,124 @@
+"""
+Request-phase timer.
+
+ServerTimingMiddleware binds a PhaseTimer to each request; code that wants
+its time attributed wraps the work in `with phase("name"):`. Outside a
+request (scripts, tests calling services directly) phase() is a no-op.
+
+Phases overlap by design: "db" is the total SQL time of the request and
+also appears inside "user" and "audit". "app" is the whole route handler
+(dependencies, endpoint and serialization) and "middleware" is whatever
+the middleware stack adds around it.
+"""
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from fastapi.routing import APIRoute
+
+
+class PhaseTimer:
+    """Accumulated seconds per phase for one request"""
+
+    __slots__ = ("start", "phases", "endpoint_end")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.endpoint_end: Optional[float] = None
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+_current_timer: ContextVar[Optional[PhaseTimer]] = ContextVar("request_phase_timer", default=None)
+
+
+def begin_request():
+    """Bind a fresh PhaseTimer to the current context; returns (timer, token)"""
+    timer = PhaseTimer()
+    return timer, _current_timer.set(timer)
+
+
+def end_request(token):
+    _current_timer.reset(token)
+
+
+def current_timer() -> Optional[PhaseTimer]:
+    return _current_timer.get()
+
+
+@contextmanager
+def phase(name: str):
+    """Attribute the time spent in the block to `name`"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def format_server_timing(phases: Dict[str, float], descriptions: Optional[Dict[str, str]] = None) -> str:
+    """Render phases as a Server-Timing header value (durations in ms)"""
+    descriptions = descriptions or {}
+    entries = []
+    for name, seconds in phases.items():
+        entry = f"{name};dur={seconds * 1000:.2f}"
+        if name in descriptions:
+            entry += f';desc="{descriptions[name]}"'
+        entries.append(entry)
+    return ", ".join(entries)
+
+
+def _mark_endpoint_end():
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.endpoint_end = time.perf_counter()
+
+
+def _timed_endpoint(call):
+    """Wrap an endpoint so the timer knows when serialization starts"""
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def async_endpoint(*args, **kwargs):
+            result = await call(*args, **kwargs)
+            _mark_endpoint_end()
+            return result
+        return async_endpoint
+
+    @functools.wraps(call)
+    def sync_endpoint(*args, **kwargs):
+        result = call(*args, **kwargs)
+        _mark_endpoint_end()
+        return result
+    return sync_endpoint
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that records "app" and "serialize" phases"""
+
+    def get_route_handler(self):
+        self.dependant.call = _timed_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timer = _current_timer.get()
+            if timer is None:
+                return await handler(request)
+            start = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                end = time.perf_counter()
+                timer.add("app", end - start)
+                if timer.endpoint_end is not None:
+                    timer.add("serialize", end - timer.endpoint_end)
+
+        return timed_handler
@@ -0,0 +1,126 @@
+"""
+Single-writer lane with group commit.
+
+SQLite allows one writer at a time; when request handlers commit on their
+own connections they queue on the file lock (or fail with "database is
+locked") and every small commit pays its own WAL sync. Instead, handlers
+submit a write unit, an async callable that takes a session, and await
+its result. One writer task on one connection takes every unit pending in
+the queue, runs them in a single transaction and commits once, then
+resolves each caller's future. Reads keep using the regular pool.
+
+If a batch fails it is rolled back and its units are retried one by one,
+so a bad unit only fails its own caller. Units may therefore run more than
+once and must build their ORM objects inside the callable.
+
+When the lane is not running (scripts, non-SQLite databases) submit() runs
+the unit in its own transaction.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import WRITE_LANE_MAX_BATCH
+from database import WriteSessionLocal
+from metrics import WRITE_LANE_DEPTH, WRITE_LANE_BATCH_SIZE, WRITE_LANE_COMMIT_DURATION
+
+WriteUnit = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class WriteLane:
+    """Queue of write units drained by one writer task"""
+
+    def __init__(self, session_factory=WriteSessionLocal, max_batch: int = WRITE_LANE_MAX_BATCH):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Start the writer on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._writer())
+
+    async def stop(self):
+        """Commit everything already queued, then stop the writer"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def submit(self, unit: WriteUnit) -> Any:
+        """Run `unit` in the writer's transaction and return its result once committed"""
+        if self._task is None:
+            return await self._run_alone(unit)
+        future = asyncio.get_running_loop().create_future()
+        WRITE_LANE_DEPTH.inc()
+        self._queue.put_nowait((unit, future))
+        return await future
+
+    async def _writer(self):
+        while True:
+            item = await self._queue.get()
+            stopping = item is None
+            batch = [] if stopping else [item]
+            # Everything that queued up while the previous batch was committing
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+            if batch:
+                WRITE_LANE_DEPTH.dec(len(batch))
+                await self._commit_batch(batch)
+            if stopping and self._queue.empty():
+                return
+
+    async def _commit_batch(self, batch: list):
+        start = time.perf_counter()
+        try:
+            async with self.session_factory() as session:
+                results = [await unit(session) for unit, _ in batch]
+                await session.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                _resolve(batch[0][1], error=e)
+                return
+            # Isolate the failing unit: every unit gets its own transaction
+            for unit, future in batch:
+                try:
+                    _resolve(future, result=await self._run_alone(unit))
+                except Exception as unit_error:
+                    _resolve(future, error=unit_error)
+            return
+        finally:
+            WRITE_LANE_COMMIT_DURATION.observe(time.perf_counter() - start)
+        WRITE_LANE_BATCH_SIZE.observe(len(batch))
+        for (_, future), result in zip(batch, results):
+            _resolve(future, result=result)
+
+    async def _run_alone(self, unit: WriteUnit) -> Any:
+        async with self.session_factory() as session:
+            result = await unit(session)
+            await session.commit()
+            return result
+
+
+def _resolve(future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+    # The caller may have gone away (cancelled request); the write stands regardless
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+write_lane = WriteLane()